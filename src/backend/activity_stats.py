@@ -0,0 +1,269 @@
+"""
+咨询活动统计
+咨询师端和用户端「咨询活动」看板共用的聚合查询：按日期、小时、类型分组的统计都在数据库中完成，
+只有最近 30 天窗口内的活动明细（最多 50 条）会取回逐行数据
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import Integer, and_, case, cast, extract, func, literal_column, or_
+from sqlalchemy.orm import Session
+
+from models import Appointment, AppointmentStatus, Counselor, CounselorRating, User
+
+# 没有结束时间和更新时间时的默认时长；时长统一限制在 60-180 分钟
+DEFAULT_DURATION_MINUTES = 60
+MIN_DURATION_MINUTES = 60
+MAX_DURATION_MINUTES = 180
+WINDOW_DAYS = 30
+ACTIVITY_LIMIT = 50
+
+
+def _completed_filter():
+    """已完成的咨询：状态为已完成，或已确认且双方都确认结束"""
+    return or_(
+        Appointment.status == AppointmentStatus.COMPLETED,
+        and_(
+            Appointment.status == AppointmentStatus.CONFIRMED,
+            Appointment.user_confirmed_complete.is_(True),
+            Appointment.counselor_confirmed_complete.is_(True),
+        ),
+    )
+
+
+def _minutes_between(dialect_name: str, start_col, end_col):
+    """两个时间字段相差的整分钟数（向零取整）"""
+    if dialect_name == "postgresql":
+        return func.trunc(extract("epoch", end_col - start_col) / 60)
+    if dialect_name == "mysql":
+        return func.timestampdiff(literal_column("MINUTE"), start_col, end_col)
+    # SQLite：strftime('%s') 为秒级时间戳，整数相除即向零取整
+    return cast(
+        (func.strftime("%s", end_col) - func.strftime("%s", start_col)) / 60,
+        Integer,
+    )
+
+
+def _duration_expression(dialect_name: str):
+    """
+    单次咨询时长（分钟）
+    优先使用 end_time，其次使用 updated_at 估算，都没有时按默认时长
+    """
+    finished_at = func.coalesce(Appointment.end_time, Appointment.updated_at)
+    elapsed = _minutes_between(dialect_name, Appointment.appointment_date, finished_at)
+    return case(
+        (finished_at.is_(None), DEFAULT_DURATION_MINUTES),
+        (elapsed < MIN_DURATION_MINUTES, MIN_DURATION_MINUTES),
+        (elapsed > MAX_DURATION_MINUTES, MAX_DURATION_MINUTES),
+        else_=elapsed,
+    )
+
+
+def _to_date(value) -> Optional[date]:
+    """GROUP BY date() 的结果转为 date（SQLite 返回字符串）"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _to_local_naive(value: datetime) -> datetime:
+    """带时区的时间转换为本地时间并去掉时区信息"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _time_period(hour: int) -> str:
+    if 6 <= hour < 12:
+        return "morning"
+    if 12 <= hour < 18:
+        return "afternoon"
+    if 18 <= hour < 22:
+        return "evening"
+    return "night"
+
+
+def build_consultation_activity(
+    db: Session,
+    counselor_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> dict:
+    """
+    构建咨询活动看板数据
+    - 传 counselor_id：咨询师视角，活动明细包含来访者信息，并附带平均评分
+    - 传 user_id：用户视角，活动明细包含咨询师姓名
+    """
+    dialect_name = db.get_bind().dialect.name
+    duration = _duration_expression(dialect_name)
+
+    owner_filter = (
+        Appointment.counselor_id == counselor_id
+        if counselor_id is not None
+        else Appointment.user_id == user_id
+    )
+    base_filters = (owner_filter, _completed_filter())
+
+    today = date.today()
+    window_start = datetime.combine(today - timedelta(days=WINDOW_DAYS), time.min)
+    window_filters = base_filters + (Appointment.appointment_date >= window_start,)
+
+    # 最近 30 天（含未来日期）：按日期分组
+    day_column = func.date(Appointment.appointment_date)
+    day_rows = db.query(
+        day_column,
+        func.count(Appointment.id),
+        func.sum(duration),
+    ).filter(*window_filters).group_by(day_column).all()
+
+    date_stats = defaultdict(int)
+    date_duration_stats = defaultdict(int)
+    week_stats = defaultdict(int)
+    total_duration_minutes = 0
+    for day_value, count, duration_sum in sorted(
+        day_rows, key=lambda row: _to_date(row[0]) or date.min, reverse=True
+    ):
+        day = _to_date(day_value)
+        if day is None:
+            continue
+        date_str = day.isoformat()
+        date_stats[date_str] += count
+        date_duration_stats[date_str] += int(duration_sum or 0)
+        total_duration_minutes += int(duration_sum or 0)
+        week_stats[(today - day).days // 7] += count
+
+    date_list = []
+    for i in range(WINDOW_DAYS - 1, -1, -1):
+        date_str = (today - timedelta(days=i)).isoformat()
+        date_list.append({
+            "date": date_str,
+            "count": date_stats.get(date_str, 0),
+            "total_duration": date_duration_stats.get(date_str, 0),
+        })
+
+    # 全部历史：按类型分组
+    type_stats = defaultdict(int)
+    for consult_type, count in db.query(
+        Appointment.consult_type,
+        func.count(Appointment.id),
+    ).filter(*base_filters).group_by(Appointment.consult_type).all():
+        type_stats[consult_type or "心理咨询"] += count
+
+    # 全部历史：按小时分组，同时统计时长分布
+    hour_column = extract("hour", Appointment.appointment_date)
+    hour_rows = db.query(
+        hour_column,
+        func.count(Appointment.id),
+        func.sum(duration),
+        func.sum(case((duration < 60, 1), else_=0)),
+        func.sum(case((and_(duration >= 60, duration < 120), 1), else_=0)),
+        func.sum(case((and_(duration >= 120, duration < 180), 1), else_=0)),
+        func.sum(case((duration >= 180, 1), else_=0)),
+    ).filter(*base_filters).group_by(hour_column).all()
+
+    hour_stats = defaultdict(int)
+    hour_duration_stats = defaultdict(int)
+    time_period_stats = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
+    time_period_duration = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
+    duration_distribution = {"short": 0, "medium": 0, "long": 0, "very_long": 0}
+    total_consultations = 0
+    for hour_value, count, duration_sum, short, medium, long_, very_long in hour_rows:
+        total_consultations += count
+        if hour_value is None:
+            continue
+        hour = int(hour_value)
+        hour_stats[hour] += count
+        hour_duration_stats[hour] += int(duration_sum or 0)
+        period = _time_period(hour)
+        time_period_stats[period] += count
+        time_period_duration[period] += int(duration_sum or 0)
+        duration_distribution["short"] += int(short or 0)
+        duration_distribution["medium"] += int(medium or 0)
+        duration_distribution["long"] += int(long_ or 0)
+        duration_distribution["very_long"] += int(very_long or 0)
+
+    hour_list = []
+    for hour in range(24):
+        count = hour_stats.get(hour, 0)
+        total_dur = hour_duration_stats.get(hour, 0)
+        hour_list.append({
+            "hour": hour,
+            "count": count,
+            "total_duration": total_dur,
+            "average_duration": int(total_dur / count) if count > 0 else 0,
+        })
+
+    # 最近 30 天的活动明细（最多 50 条）
+    activity_columns = [
+        Appointment.id,
+        Appointment.appointment_date,
+        Appointment.consult_type,
+        Appointment.consult_method,
+        Appointment.rating,
+        duration.label("duration_minutes"),
+    ]
+    if counselor_id is not None:
+        activity_query = db.query(*activity_columns, User.nickname, User.username).outerjoin(
+            User, User.id == Appointment.user_id
+        )
+    else:
+        activity_query = db.query(*activity_columns, Counselor.real_name).outerjoin(
+            Counselor, Counselor.id == Appointment.counselor_id
+        )
+    activity_rows = activity_query.filter(*window_filters).order_by(
+        Appointment.appointment_date.desc()
+    ).limit(ACTIVITY_LIMIT).all()
+
+    activities = []
+    for row in activity_rows:
+        activity = {
+            "id": row.id,
+            "date": _to_local_naive(row.appointment_date).date().isoformat(),
+            "datetime": row.appointment_date.isoformat(),
+            "consult_type": row.consult_type or "心理咨询",
+            "consult_method": row.consult_method or "未知",
+        }
+        if counselor_id is not None:
+            activity["user_name"] = row.nickname
+            activity["user_username"] = row.username
+        else:
+            activity["counselor_name"] = row.real_name or "未知咨询师"
+        activity.update({
+            "duration_minutes": int(row.duration_minutes),
+            "rating": row.rating,
+            "status": "completed",
+        })
+        activities.append(activity)
+
+    recent_7_days = sum(date_stats.get((today - timedelta(days=i)).isoformat(), 0) for i in range(7))
+
+    result = {
+        "total_consultations": total_consultations,
+        "total_duration_minutes": total_duration_minutes,
+        "total_duration_hours": round(total_duration_minutes / 60, 1),
+        "average_duration_minutes": int(total_duration_minutes / total_consultations) if total_consultations > 0 else 0,
+        "recent_7_days": recent_7_days,
+        "recent_30_days": sum(date_stats.values()),
+    }
+    if counselor_id is not None:
+        rating_count, rating_avg = db.query(
+            func.count(CounselorRating.id),
+            func.avg(CounselorRating.rating),
+        ).filter(CounselorRating.counselor_id == counselor_id).one()
+        result["average_rating"] = round(float(rating_avg), 1) if rating_count else 0
+    result.update({
+        "daily_stats": date_list,
+        "week_stats": dict(week_stats),
+        "type_stats": dict(type_stats),
+        "hour_stats": hour_list,
+        "time_period_stats": time_period_stats,
+        "time_period_duration": time_period_duration,
+        "duration_distribution": duration_distribution,
+        "activities": activities,
+    })
+    return result
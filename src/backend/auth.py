@@ -4,33 +4,26 @@
 """
 
 import os
+import threading
+import time
 import warnings
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 from dotenv import load_dotenv
 
-from database import get_db
+from database import get_async_db, get_db
 from models import User
+import password_hashing
 
 # 加载环境变量
 load_dotenv()
 
-# 直接使用 bcrypt，避免 passlib 的兼容性问题
-# passlib 在新版本 bcrypt 上存在兼容性问题（缺少 __about__ 属性等）
-_bcrypt = None
-
-def _get_bcrypt():
-    """获取 bcrypt 模块，延迟导入"""
-    global _bcrypt
-    if _bcrypt is None:
-        import bcrypt
-        _bcrypt = bcrypt
-    return _bcrypt
-
 # 默认初始化密码（咨询师账户等统一使用）
 DEFAULT_COUNSELOR_PASSWORD = "123456"
 
@@ -53,62 +46,52 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24小时
 # 配置 OAuth2PasswordBearer，允许 token 为空（由 get_current_user 处理）
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
+# 已认证用户缓存（按用户 ID 的 TTL + LRU 缓存，TTL 设为 0 即关闭）
+# 资料修改、禁用、角色变更、停用账户后需调用 invalidate_principal；
+# 多进程部署时其他进程的缓存最多滞后 TTL 秒
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "2048"))
 
-def _truncate_password(password: str, max_bytes: int = 72) -> str:
-    """
-    将密码截断到指定的最大字节数（bcrypt限制为72字节）
-    使用UTF-8编码，确保不会截断多字节字符的中间部分
-    """
-    if not password:
-        return password
-    
-    # 将密码编码为UTF-8字节
-    password_bytes = password.encode('utf-8')
-    
-    # 如果密码长度在限制内，直接返回
-    if len(password_bytes) <= max_bytes:
-        return password
-    
-    # 截断到最大字节数
-    truncated_bytes = password_bytes[:max_bytes]
-    
-    # 尝试解码，如果截断导致不完整的UTF-8序列，移除最后一个字节直到可以解码
-    while truncated_bytes:
-        try:
-            return truncated_bytes.decode('utf-8')
-        except UnicodeDecodeError:
-            truncated_bytes = truncated_bytes[:-1]
-    
-    # 如果所有字节都无法解码（理论上不应该发生），返回空字符串
-    return ""
+# 缓存的字段快照不含密码哈希，需要时由会话按需加载
+_PRINCIPAL_COLUMNS = tuple(
+    attr.key for attr in User.__mapper__.column_attrs if attr.key != "password_hash"
+)
+_principal_cache: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+_principal_cache_lock = threading.Lock()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    # bcrypt限制密码不能超过72字节，需要截断
-    truncated_password = _truncate_password(plain_password, max_bytes=72)
-    
-    bcrypt = _get_bcrypt()
-    try:
-        # 确保 hashed_password 是字节
-        if isinstance(hashed_password, str):
-            hashed_password = hashed_password.encode('utf-8')
-        return bcrypt.checkpw(truncated_password.encode('utf-8'), hashed_password)
-    except Exception:
-        return False
+    """验证密码（在当前线程中计算，供脚本使用）"""
+    return password_hashing.check_password(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
-    # bcrypt限制密码不能超过72字节，需要截断
-    truncated_password = _truncate_password(password, max_bytes=72)
-    
-    bcrypt = _get_bcrypt()
-    # 生成 salt 并哈希密码
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(truncated_password.encode('utf-8'), salt)
-    # 返回字符串格式
-    return hashed.decode('utf-8')
+    """生成密码哈希（在当前线程中计算，供脚本使用）"""
+    return password_hashing.hash_password(password)
+
+
+def _password_hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="当前登录人数较多，请稍后重试",
+        headers={"Retry-After": "1"},
+    )
+
+
+def verify_password_pooled(plain_password: str, hashed_password: str) -> bool:
+    """在密码哈希进程池中验证密码，排队已满时返回 503"""
+    try:
+        return password_hashing.pooled_check_password(plain_password, hashed_password)
+    except password_hashing.PasswordHashingBusy:
+        raise _password_hashing_busy()
+
+
+def get_password_hash_pooled(password: str) -> str:
+    """在密码哈希进程池中生成密码哈希，排队已满时返回 503"""
+    try:
+        return password_hashing.pooled_hash_password(password)
+    except password_hashing.PasswordHashingBusy:
+        raise _password_hashing_busy()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -128,35 +111,87 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(
-    token: Optional[str] = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """获取当前登录用户"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无法验证凭据，请先登录",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    # 如果 token 为空，直接抛出认证异常
+def _cache_principal(user: User) -> None:
+    if PRINCIPAL_CACHE_TTL_SECONDS <= 0:
+        return
+    snapshot = {key: getattr(user, key) for key in _PRINCIPAL_COLUMNS}
+    expires_at = time.monotonic() + PRINCIPAL_CACHE_TTL_SECONDS
+    with _principal_cache_lock:
+        _principal_cache[user.id] = (expires_at, snapshot)
+        _principal_cache.move_to_end(user.id)
+        while len(_principal_cache) > PRINCIPAL_CACHE_MAX_SIZE:
+            _principal_cache.popitem(last=False)
+
+
+def _cached_principal(user_id: int, db: Session) -> Optional[User]:
+    """从缓存还原用户并挂到当前会话（不查询数据库），未命中或已过期返回 None"""
+    with _principal_cache_lock:
+        entry = _principal_cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            del _principal_cache[user_id]
+            return None
+        _principal_cache.move_to_end(user_id)
+
+    # 每个请求使用新的实例，路由中修改 current_user 后 commit 仍会正常写库
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_principal(user_id: Optional[int]) -> None:
+    """用户资料、状态或角色变更后清除缓存（在 commit 之后调用）"""
+    if user_id is None:
+        return
+    with _principal_cache_lock:
+        _principal_cache.pop(user_id, None)
+
+
+def clear_principal_cache() -> None:
+    """清空已认证用户缓存"""
+    with _principal_cache_lock:
+        _principal_cache.clear()
+
+
+def _resolve_principal(token: Optional[str], db: Session) -> Optional[User]:
+    """解析 Token 并加载对应用户，Token 无效或用户不存在时返回 None"""
     if not token:
-        raise credentials_exception
-    
+        return None
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id_str = payload.get("sub")
         if user_id_str is None:
-            raise credentials_exception
+            return None
         # 将字符串转换为整数
         user_id: int = int(user_id_str)
     except (JWTError, ValueError):
-        raise credentials_exception
-    
+        return None
+
+    user = _cached_principal(user_id, db)
+    if user is not None:
+        return user
+
     user = db.query(User).filter(User.id == user_id).first()
+    if user is not None:
+        _cache_principal(user)
+    return user
+
+
+def get_current_user(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    """获取当前登录用户"""
+    user = _resolve_principal(token, db)
     if user is None:
-        raise credentials_exception
-    
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据，请先登录",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
@@ -172,22 +207,22 @@ def get_optional_user(
     db: Session = Depends(get_db)
 ) -> Optional[User]:
     """获取当前用户（可选，未登录时返回None）"""
-    if not token:
+    user = _resolve_principal(token, db)
+    if user is None or not user.is_active:
         return None
-    
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id_str = payload.get("sub")
-        if user_id_str is None:
-            return None
-        user_id: int = int(user_id_str)
-    except (JWTError, ValueError):
+    return user
+
+
+async def get_optional_user_async(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[User]:
+    """get_optional_user 的异步版本，供使用 get_async_db 的路由使用"""
+    if not token:
         return None
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.run_sync(lambda session: _resolve_principal(token, session))
     if user is None or not user.is_active:
         return None
-    
     return user
 
 
@@ -0,0 +1,312 @@
+"""
+咨询师可预约时段索引
+按「咨询师 + 日期」缓存每日时段位图和剩余容量，避免预约页面逐日查询数据库
+"""
+
+import logging
+import os
+import threading
+import time as time_module
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import (
+    Appointment,
+    AppointmentStatus,
+    CounselorSchedule,
+    CounselorUnavailable,
+)
+
+logger = logging.getLogger("heart_care.availability")
+
+# 索引条目的最长存活时间（秒），用于兜底多进程部署下其他进程的写入
+AVAILABILITY_INDEX_TTL_SECONDS = int(os.getenv("AVAILABILITY_INDEX_TTL_SECONDS", "60"))
+# 索引最多保留的条目数（咨询师 x 日期），超出时淘汰最早写入的条目
+AVAILABILITY_INDEX_MAX_ENTRIES = int(os.getenv("AVAILABILITY_INDEX_MAX_ENTRIES", "20000"))
+
+# 默认时段：8:00-22:00，每个时段 1 人
+DEFAULT_START_TIME = time(8, 0)
+DEFAULT_END_TIME = time(22, 0)
+DEFAULT_MAX_NUM = 1
+SLOT_MINUTES = 60
+
+ACTIVE_APPOINTMENT_STATUSES = [AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]
+
+# (counselor_id, date) -> (写入时间, 时段起点(分钟), 可用位图, 剩余容量)
+DayEntry = Tuple[float, Tuple[int, ...], int, Tuple[int, ...]]
+
+# 按写入顺序排列，便于从头部淘汰过期条目
+_index: "OrderedDict[Tuple[int, date], DayEntry]" = OrderedDict()
+# 每个咨询师的版本号，失效时递增，防止并发构建把旧数据写回索引
+_versions: Dict[int, int] = {}
+_lock = threading.Lock()
+
+
+def _safe_parse_time(value) -> Optional[time]:
+    """安全地将数据库返回的时间值转换为 time 对象"""
+    if value is None:
+        return None
+    if isinstance(value, time):
+        return value
+    if isinstance(value, timedelta):
+        # MySQL TIME 字段经 PyMySQL 返回 timedelta
+        total_minutes = int(value.total_seconds()) // 60
+        return time(total_minutes // 60 % 24, total_minutes % 60)
+    if isinstance(value, str):
+        for fmt in ["%H:%M:%S", "%H:%M", "%H:%M:%S.%f"]:
+            try:
+                return datetime.strptime(value, fmt).time()
+            except ValueError:
+                continue
+    return None
+
+
+def _load_schedules(db: Session, counselor_id: int) -> Dict[int, Tuple[time, time, int]]:
+    """读取咨询师每个工作日的时段设置（weekday -> (开始, 结束, 最大预约量)）"""
+    rows = db.query(
+        CounselorSchedule.weekday,
+        CounselorSchedule.start_time,
+        CounselorSchedule.end_time,
+        CounselorSchedule.max_num,
+    ).filter(
+        CounselorSchedule.counselor_id == counselor_id,
+        CounselorSchedule.is_available == True
+    ).order_by(CounselorSchedule.id.asc()).all()
+
+    schedules: Dict[int, Tuple[time, time, int]] = {}
+    for weekday, start_value, end_value, max_num in rows:
+        if weekday in schedules:
+            continue
+        start_time = _safe_parse_time(start_value)
+        end_time = _safe_parse_time(end_value)
+        if start_time is None or end_time is None:
+            logger.error(
+                "咨询师 %s 的时段设置解析失败: start_time=%s, end_time=%s",
+                counselor_id, start_value, end_value,
+            )
+            schedules[weekday] = (DEFAULT_START_TIME, DEFAULT_END_TIME, DEFAULT_MAX_NUM)
+            continue
+        schedules[weekday] = (start_time, end_time, max_num if max_num is not None else 1)
+    return schedules
+
+
+def _build_day(
+    target_date: date,
+    schedule: Tuple[time, time, int],
+    periods: List[Tuple[date, date, Optional[time], Optional[time]]],
+    booked: Dict[Tuple[int, int], int],
+) -> Tuple[Tuple[int, ...], int, Tuple[int, ...]]:
+    """计算单日的时段起点、可用位图和每个时段的剩余容量"""
+    start_time, end_time, max_num = schedule
+
+    day_periods = [p for p in periods if p[0] <= target_date <= p[1]]
+    whole_day_blocked = any(p[2] is None or p[3] is None for p in day_periods)
+
+    slot_starts: List[int] = []
+    remaining: List[int] = []
+    mask = 0
+
+    start_minutes = start_time.hour * 60 + start_time.minute
+    end_minutes = end_time.hour * 60 + end_time.minute
+    current_minutes = start_minutes
+    while current_minutes + SLOT_MINUTES <= end_minutes:
+        hour, minute = divmod(current_minutes, 60)
+        slot_time = time(hour, minute)
+        booked_count = booked.get((hour, minute), 0)
+
+        is_unavailable = whole_day_blocked or any(
+            p[2] <= slot_time < p[3] for p in day_periods
+        )
+
+        # 已有有效预约的时段不再开放（与原有逐日查询的行为保持一致）
+        if not is_unavailable and booked_count == 0 and max_num > 0:
+            mask |= 1 << len(slot_starts)
+
+        slot_starts.append(current_minutes)
+        remaining.append(0 if is_unavailable else max(0, max_num - booked_count))
+        current_minutes += SLOT_MINUTES
+
+    return tuple(slot_starts), mask, tuple(remaining)
+
+
+def _build_range(db: Session, counselor_id: int, start_date: date, end_date: date) -> Dict[date, DayEntry]:
+    """用三次查询构建一个日期区间内所有日期的索引条目"""
+    schedules = _load_schedules(db, counselor_id)
+
+    period_rows = db.query(
+        CounselorUnavailable.start_date,
+        CounselorUnavailable.end_date,
+        CounselorUnavailable.start_time,
+        CounselorUnavailable.end_time,
+    ).filter(
+        CounselorUnavailable.counselor_id == counselor_id,
+        CounselorUnavailable.status == 1,
+        CounselorUnavailable.start_date <= end_date,
+        CounselorUnavailable.end_date >= start_date
+    ).all()
+    periods = [
+        (
+            row[0],
+            row[1],
+            _safe_parse_time(row[2]) if row[2] is not None else None,
+            _safe_parse_time(row[3]) if row[3] is not None else None,
+        )
+        for row in period_rows
+    ]
+
+    range_start = datetime.combine(start_date, datetime.min.time())
+    range_end = datetime.combine(end_date, datetime.max.time())
+    appointment_rows = db.query(Appointment.appointment_date).filter(
+        Appointment.counselor_id == counselor_id,
+        Appointment.appointment_date >= range_start,
+        Appointment.appointment_date < range_end,
+        Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES)
+    ).all()
+
+    booked_by_day: Dict[date, Dict[Tuple[int, int], int]] = {}
+    for (appointment_date,) in appointment_rows:
+        if appointment_date is None:
+            continue
+        slots = booked_by_day.setdefault(appointment_date.date(), {})
+        key = (appointment_date.hour, appointment_date.minute)
+        slots[key] = slots.get(key, 0) + 1
+
+    now = time_module.monotonic()
+    entries: Dict[date, DayEntry] = {}
+    current = start_date
+    while current <= end_date:
+        schedule = schedules.get(
+            current.isoweekday(),
+            (DEFAULT_START_TIME, DEFAULT_END_TIME, DEFAULT_MAX_NUM),
+        )
+        slot_starts, mask, remaining = _build_day(
+            current, schedule, periods, booked_by_day.get(current, {})
+        )
+        entries[current] = (now, slot_starts, mask, remaining)
+        current += timedelta(days=1)
+    return entries
+
+
+def _entry_to_slots(entry: DayEntry) -> List[dict]:
+    """将索引条目展开为接口返回的时段列表"""
+    _, slot_starts, mask, remaining = entry
+    slots = []
+    for i, start_minutes in enumerate(slot_starts):
+        if not mask & (1 << i):
+            continue
+        hour, minute = divmod(start_minutes, 60)
+        end_hour, end_minute = divmod(start_minutes + SLOT_MINUTES, 60)
+        slots.append({
+            "time": f"{hour:02d}:{minute:02d}",
+            "display": f"{hour:02d}:{minute:02d}-{end_hour:02d}:{end_minute:02d}",
+            "remaining": remaining[i],
+        })
+    return slots
+
+
+def _lookup_range(counselor_id: int, start_date: date, end_date: date) -> Tuple[int, Dict[date, DayEntry]]:
+    """读取区间内的索引条目，任意一天缺失或过期时返回空字典；同时返回当前版本号"""
+    now = time_module.monotonic()
+    with _lock:
+        version = _versions.get(counselor_id, 0)
+        cached: Dict[date, DayEntry] = {}
+        current = start_date
+        while current <= end_date:
+            entry = _index.get((counselor_id, current))
+            if entry is None or now - entry[0] > AVAILABILITY_INDEX_TTL_SECONDS:
+                return version, {}
+            cached[current] = entry
+            current += timedelta(days=1)
+    return version, cached
+
+
+def _store_range(counselor_id: int, version: int, entries: Dict[date, DayEntry]) -> None:
+    now = time_module.monotonic()
+    with _lock:
+        # 构建期间发生过失效则不回写，下次请求重新构建
+        if _versions.get(counselor_id, 0) == version:
+            for day, entry in entries.items():
+                key = (counselor_id, day)
+                _index.pop(key, None)
+                _index[key] = entry
+        # 淘汰已过期的条目，并限制索引大小
+        while _index:
+            key, entry = next(iter(_index.items()))
+            if now - entry[0] <= AVAILABILITY_INDEX_TTL_SECONDS and len(_index) <= AVAILABILITY_INDEX_MAX_ENTRIES:
+                break
+            del _index[key]
+
+
+def get_available_slots_range(
+    db: Session,
+    counselor_id: int,
+    start_date: date,
+    end_date: date,
+) -> Dict[date, List[dict]]:
+    """
+    获取咨询师在日期区间内每天的可用时段
+    - 命中索引时不访问数据库
+    - 区间内任意一天缺失或过期时，整段重新构建（固定三次查询）
+    """
+    version, cached = _lookup_range(counselor_id, start_date, end_date)
+    if not cached:
+        cached = _build_range(db, counselor_id, start_date, end_date)
+        _store_range(counselor_id, version, cached)
+
+    return {day: _entry_to_slots(entry) for day, entry in cached.items()}
+
+
+async def get_available_slots_range_async(
+    db: AsyncSession,
+    counselor_id: int,
+    start_date: date,
+    end_date: date,
+) -> Dict[date, List[dict]]:
+    """get_available_slots_range 的异步版本（索引未命中时在异步会话上构建）"""
+    version, cached = _lookup_range(counselor_id, start_date, end_date)
+    if not cached:
+        cached = await db.run_sync(_build_range, counselor_id, start_date, end_date)
+        _store_range(counselor_id, version, cached)
+
+    return {day: _entry_to_slots(entry) for day, entry in cached.items()}
+
+
+def get_available_slots(db: Session, counselor_id: int, target_date: date) -> List[dict]:
+    """获取咨询师在指定日期的可用时段"""
+    return get_available_slots_range(db, counselor_id, target_date, target_date)[target_date]
+
+
+async def get_available_slots_async(db: AsyncSession, counselor_id: int, target_date: date) -> List[dict]:
+    """get_available_slots 的异步版本"""
+    slots_by_day = await get_available_slots_range_async(db, counselor_id, target_date, target_date)
+    return slots_by_day[target_date]
+
+
+def invalidate_counselor_availability(counselor_id: Optional[int], target_date: Optional[date] = None) -> None:
+    """
+    使咨询师的可预约时段索引失效
+    - 指定日期时只清除当天（预约创建、更新、取消）
+    - 未指定日期时清除该咨询师全部条目（日程或不可预约时段变更）
+    """
+    if counselor_id is None:
+        return
+    with _lock:
+        _versions[counselor_id] = _versions.get(counselor_id, 0) + 1
+        if target_date is not None:
+            _index.pop((counselor_id, target_date), None)
+            return
+        for key in [key for key in _index if key[0] == counselor_id]:
+            del _index[key]
+
+
+def invalidate_appointment_availability(appointment: Appointment) -> None:
+    """预约写入后使其所在日期的时段索引失效"""
+    appointment_date = appointment.appointment_date
+    invalidate_counselor_availability(
+        appointment.counselor_id,
+        appointment_date.date() if appointment_date is not None else None,
+    )
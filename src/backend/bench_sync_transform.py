@@ -0,0 +1,172 @@
+"""
+云端同步行转换的性能测试（不连接数据库）
+按 models.py 的表结构生成模拟的本地行数据，对比两种转换方式每秒处理的行数：
+- 逐值转换：每个单元格调用 convert_mysql_to_postgres_value，每个无效密码行都计算一次默认密码哈希（优化前的做法）
+- 按表编译：compile_row_transformer 编译出的逐列转换函数（同步脚本当前的做法）
+两种方式都包含生成批量写入参数的开销，并校验转换结果一致
+
+用法：python bench_sync_transform.py [每个表的行数，默认 20000] [users 表中无效密码的行数，默认 10]
+"""
+
+import sys
+import time
+from datetime import date, datetime, time as dt_time
+
+from sqlalchemy import Boolean, Date, DateTime, Enum, Float, Integer, Time
+from sqlalchemy.dialects import mysql
+
+import sync_all_data_to_cloud as sync
+from auth import verify_password
+from models import Base
+
+BENCH_TABLES = ["users", "counselors", "appointments", "system_logs"]
+DEFAULT_PASSWORD = "123456"
+
+
+def mysql_column_type(column) -> str:
+    """模拟从 MySQL 反射得到的列类型字符串（布尔列在 MySQL 中为 TINYINT(1)）"""
+    if isinstance(column.type, Boolean):
+        return "TINYINT(1)"
+    return str(column.type.compile(dialect=mysql.dialect()))
+
+
+def sample_value(column, i: int):
+    """生成一个模拟的本地值（枚举值混用大小写和别名，覆盖各转换分支）"""
+    if column.primary_key:
+        return i
+    if i % 7 == 0 and column.nullable:
+        return None
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return i % 2
+    if isinstance(column_type, Enum):
+        choices = list(column_type.enums)
+        value = choices[i % len(choices)]
+        return value.upper() if i % 3 == 0 else value.lower()
+    if isinstance(column_type, Integer):
+        return i % 1000 + 1
+    if isinstance(column_type, Float):
+        return (i % 50) / 10
+    if isinstance(column_type, DateTime):
+        return datetime(2026, 1, 1, i % 24, i % 60)
+    if isinstance(column_type, Date):
+        return date(2026, 1, 1 + i % 28)
+    if isinstance(column_type, Time):
+        return dt_time(i % 24, 0)
+    if column.name == "password_hash":
+        return "$2b$12$" + "x" * 53
+    return f"{column.name}-{i}"
+
+
+def make_rows(table_name: str, common_columns, row_count: int, bad_passwords: int):
+    table = Base.metadata.tables[table_name]
+    columns = [table.columns[name] for name in common_columns]
+    rows = [tuple(sample_value(column, i) for column in columns) for i in range(1, row_count + 1)]
+    if "password_hash" in common_columns and bad_passwords:
+        index = common_columns.index("password_hash")
+        step = max(1, row_count // bad_passwords)
+        for i in range(0, min(row_count, step * bad_passwords), step):
+            row = list(rows[i])
+            row[index] = ""
+            rows[i] = tuple(row)
+    return rows
+
+
+def transform_per_value(rows, common_columns, column_types, pk_column, table_name, batch_size):
+    """优化前：逐单元格判断类型并转换，生成按列名的字典，再拼接参数名"""
+    for batch_start in range(0, len(rows), batch_size):
+        row_dicts = []
+        for row in rows[batch_start:batch_start + batch_size]:
+            row_dict = {}
+            for i, col_name in enumerate(common_columns):
+                value = row[i]
+                if table_name == "users" and col_name == "password_hash" and (not value or len(value) < 10):
+                    value = sync.get_password_hash(DEFAULT_PASSWORD)
+                column_type = column_types.get(col_name)
+                if column_type is not None:
+                    value = sync.convert_mysql_to_postgres_value(value, column_type, col_name, None, table_name)
+                row_dict[col_name] = value
+            row_dicts.append(row_dict)
+        params = {
+            f"p{r}_{c}": row_dict[col]
+            for r, row_dict in enumerate(row_dicts)
+            for c, col in enumerate(common_columns)
+        }
+        yield row_dicts, params
+
+
+def transform_compiled(rows, common_columns, column_types, pk_column, table_name, batch_size):
+    """优化后：每表编译一次转换函数，逐列应用"""
+    transform = sync.compile_row_transformer(
+        table_name, common_columns, column_types, pk_column, None, DEFAULT_PASSWORD, log=lambda message: None
+    )
+    for batch_start in range(0, len(rows), batch_size):
+        values = [transform(row) for row in rows[batch_start:batch_start + batch_size]]
+        yield values, sync._batch_params(values, len(common_columns))
+
+
+def run(row_count: int = 20000, bad_passwords: int = 10):
+    print(f"开始测试同步行转换性能（每表 {row_count} 行，users 表无效密码 {bad_passwords} 行）...")
+    batch_size = sync.SYNC_BATCH_SIZE
+    total_before = total_after = 0.0
+    total_rows = 0
+
+    for table_name in BENCH_TABLES:
+        table = Base.metadata.tables[table_name]
+        common_columns = sorted(column.name for column in table.columns)
+        column_types = {column.name: mysql_column_type(column) for column in table.columns}
+        pk_column = next(column.name for column in table.columns if column.primary_key)
+        rows = make_rows(table_name, common_columns, row_count, bad_passwords if table_name == "users" else 0)
+
+        started = time.perf_counter()
+        before = [row_dicts for row_dicts, _ in transform_per_value(
+            rows, common_columns, column_types, pk_column, table_name, batch_size
+        )]
+        before_seconds = time.perf_counter() - started
+
+        sync._default_password_hash.cache_clear()
+        started = time.perf_counter()
+        after = [values for values, _ in transform_compiled(
+            rows, common_columns, column_types, pk_column, table_name, batch_size
+        )]
+        after_seconds = time.perf_counter() - started
+
+        # 校验结果一致（密码哈希带随机盐，只比较是否被替换）
+        password_index = common_columns.index("password_hash") if table_name == "users" else None
+        for row_dicts, values_list in zip(before, after):
+            for row_dict, values in zip(row_dicts, values_list):
+                expected = [row_dict[col] for col in common_columns]
+                if password_index is not None:
+                    replaced = expected[password_index] != values[password_index]
+                    if replaced and not verify_password(DEFAULT_PASSWORD, values[password_index]):
+                        raise AssertionError(f"表 {table_name} 的默认密码哈希无效")
+                    expected[password_index] = values[password_index]
+                if expected != values:
+                    raise AssertionError(f"表 {table_name} 转换结果不一致: {expected} != {values}")
+
+        total_before += before_seconds
+        total_after += after_seconds
+        total_rows += len(rows)
+        print(
+            f"✓ {table_name}（{len(common_columns)} 列）："
+            f"逐值转换 {len(rows) / before_seconds:,.0f} 行/秒，"
+            f"按表编译 {len(rows) / after_seconds:,.0f} 行/秒，"
+            f"提升 {before_seconds / after_seconds:.1f} 倍"
+        )
+
+    print(
+        f"\n✓ 合计 {total_rows} 行：逐值转换 {total_rows / total_before:,.0f} 行/秒，"
+        f"按表编译 {total_rows / total_after:,.0f} 行/秒，提升 {total_before / total_after:.1f} 倍"
+    )
+    print("\n性能测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        args = [int(arg) for arg in sys.argv[1:3]]
+        run(*args)
+    except Exception as e:
+        print(f"性能测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,130 @@
+"""
+咨询师标签（擅长领域、咨询方式）
+counselors.specialty / consult_methods 仍保存 JSON 数组原文用于展示和兼容，
+同时同步到 counselor_specialties / counselor_consult_methods 两张标签表，供搜索筛选和分面统计走索引
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Counselor, CounselorConsultMethod, CounselorSpecialty, CounselorStatus
+from utils import parse_json_array_field
+
+# 标签字段长度与表结构保持一致
+MAX_TAG_LENGTH = 50
+
+
+def _normalize_tags(value) -> List[str]:
+    """解析字段并去重（保留原顺序）"""
+    tags: List[str] = []
+    for tag in parse_json_array_field(value, default=[]):
+        tag = tag[:MAX_TAG_LENGTH]
+        if tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _replace_tags(db: Session, model, counselor_id: int, tags: List[str]) -> None:
+    db.query(model).filter(model.counselor_id == counselor_id).delete(synchronize_session=False)
+    db.add_all([
+        model(counselor_id=counselor_id, name=tag, position=position)
+        for position, tag in enumerate(tags)
+    ])
+
+
+def sync_counselor_tags(db: Session, counselor: Counselor) -> None:
+    """
+    按咨询师当前的 specialty / consult_methods 重建其标签行
+    在写入咨询师资料的同一事务中调用（counselor 需已 flush 获得 id）
+    """
+    if counselor.id is None:
+        db.flush()
+    _replace_tags(db, CounselorSpecialty, counselor.id, _normalize_tags(counselor.specialty))
+    _replace_tags(db, CounselorConsultMethod, counselor.id, _normalize_tags(counselor.consult_methods))
+
+
+def clear_counselor_tags(db: Session, counselor_id: int) -> None:
+    """删除咨询师的全部标签行（删除咨询师前调用）"""
+    _replace_tags(db, CounselorSpecialty, counselor_id, [])
+    _replace_tags(db, CounselorConsultMethod, counselor_id, [])
+
+
+def split_filter_value(value: Optional[str]) -> List[str]:
+    """将逗号分隔的筛选参数拆分为标签列表"""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def specialty_filter(names: Iterable[str]):
+    """擅长领域命中任一标签的咨询师（走 name + counselor_id 索引）"""
+    return Counselor.id.in_(
+        select(CounselorSpecialty.counselor_id).where(CounselorSpecialty.name.in_(list(names)))
+    )
+
+
+def consult_method_filter(names: Iterable[str]):
+    """咨询方式命中任一标签的咨询师（走 name + counselor_id 索引）"""
+    return Counselor.id.in_(
+        select(CounselorConsultMethod.counselor_id).where(CounselorConsultMethod.name.in_(list(names)))
+    )
+
+
+def load_tags(db: Session, counselor_ids: List[int]) -> Dict[str, Dict[int, List[str]]]:
+    """
+    批量读取一页咨询师的标签
+    返回 {"specialty": {counselor_id: [...]}, "consult_methods": {counselor_id: [...]}}
+    """
+    result: Dict[str, Dict[int, List[str]]] = {"specialty": {}, "consult_methods": {}}
+    if not counselor_ids:
+        return result
+    for key, model in (("specialty", CounselorSpecialty), ("consult_methods", CounselorConsultMethod)):
+        rows = db.query(model.counselor_id, model.name).filter(
+            model.counselor_id.in_(counselor_ids)
+        ).order_by(model.counselor_id, model.position).all()
+        for counselor_id, name in rows:
+            result[key].setdefault(counselor_id, []).append(name)
+    return result
+
+
+def _facet_counts(db: Session, model, filters) -> List[dict]:
+    rows = db.query(
+        model.name,
+        func.count(func.distinct(model.counselor_id)),
+    ).join(
+        Counselor, Counselor.id == model.counselor_id
+    ).filter(*filters).group_by(model.name).all()
+    return [
+        {"name": name, "count": count}
+        for name, count in sorted(rows, key=lambda row: (-row[1], row[0]))
+    ]
+
+
+def search_facets(
+    db: Session,
+    specialties: List[str],
+    methods: List[str],
+    gender: Optional[str] = None,
+) -> dict:
+    """
+    筛选栏分面统计
+    每个维度的计数应用其他维度的筛选条件（不应用自身），与多选筛选的交互一致
+    """
+    base_filters = [Counselor.status == CounselorStatus.ACTIVE]
+    if gender and gender != 'all':
+        base_filters.append(Counselor.gender == gender)
+
+    specialty_filters = list(base_filters)
+    if methods:
+        specialty_filters.append(consult_method_filter(methods))
+
+    method_filters = list(base_filters)
+    if specialties:
+        method_filters.append(specialty_filter(specialties))
+
+    return {
+        "specialties": _facet_counts(db, CounselorSpecialty, specialty_filters),
+        "consult_methods": _facet_counts(db, CounselorConsultMethod, method_filters),
+    }
@@ -7,6 +7,7 @@
 from database import SessionLocal
 from models import User, UserRole
 from auth import get_password_hash
+from login_identifiers import sync_login_identifiers
 
 def create_admin():
     """创建管理员账户"""
@@ -22,6 +23,7 @@ def create_admin():
             existing_user.password_hash = get_password_hash(password)
             existing_user.role = UserRole.ADMIN
             existing_user.is_active = True
+            sync_login_identifiers(db, existing_user, strict=False)
             db.commit()
             print(f"[OK] 更新管理员账户：{username} (密码: {password})")
             return
@@ -36,6 +38,8 @@ def create_admin():
         )
         
         db.add(admin_user)
+        # 写入登录标识，账号可按唯一索引登录
+        sync_login_identifiers(db, admin_user, strict=False)
         db.commit()
         
         print(f"[OK] 创建管理员账户：{username} (密码: {password})")
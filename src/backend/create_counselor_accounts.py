@@ -6,6 +6,7 @@
 from database import SessionLocal
 from models import Counselor, User, UserRole, Gender, CounselorStatus
 from auth import get_password_hash, get_default_counselor_password
+from login_identifiers import sync_login_identifiers
 
 def create_counselor_accounts():
     """为所有没有账户的咨询师创建账户"""
@@ -56,6 +57,8 @@ def create_counselor_accounts():
             
             # 更新咨询师的 user_id
             counselor.user_id = new_user.id
+            # 写入登录标识，账号可按唯一索引登录
+            sync_login_identifiers(db, new_user, strict=False)
             
             db.commit()
             
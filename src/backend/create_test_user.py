@@ -7,6 +7,7 @@
 from database import SessionLocal
 from models import User, UserRole
 from auth import get_password_hash
+from login_identifiers import sync_login_identifiers
 
 def create_test_user():
     """创建测试用户"""
@@ -20,6 +21,7 @@ def create_test_user():
         if existing_user:
             # 更新密码
             existing_user.password_hash = get_password_hash(password)
+            sync_login_identifiers(db, existing_user, strict=False)
             db.commit()
             print(f"✓ 更新用户密码：{phone} (密码: {password})")
             return
@@ -35,6 +37,8 @@ def create_test_user():
         )
         
         db.add(new_user)
+        # 写入登录标识，账号可按唯一索引登录
+        sync_login_identifiers(db, new_user, strict=False)
         db.commit()
         
         print(f"✓ 创建测试用户：{phone} (密码: {password})")
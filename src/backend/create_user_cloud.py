@@ -14,6 +14,7 @@ sys.path.insert(0, str(PROJECT_ROOT / "src" / "backend"))
 from database import SessionLocal, DATABASE_URL
 from models import User, UserRole
 from auth import get_password_hash
+from login_identifiers import sync_login_identifiers
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -58,6 +59,7 @@ def create_user_liuziyuan_cloud():
             if update == 'y':
                 existing_user.password_hash = get_password_hash(password)
                 existing_user.is_active = True
+                sync_login_identifiers(db, existing_user, strict=False)
                 db.commit()
                 print(f"✅ 密码已更新: {password}")
             else:
@@ -76,6 +78,8 @@ def create_user_liuziyuan_cloud():
             )
             
             db.add(new_user)
+            # 写入登录标识，账号可按唯一索引登录
+            sync_login_identifiers(db, new_user, strict=False)
             db.commit()
             db.refresh(new_user)
             
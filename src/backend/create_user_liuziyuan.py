@@ -6,6 +6,7 @@
 from database import SessionLocal
 from models import User, UserRole
 from auth import get_password_hash
+from login_identifiers import sync_login_identifiers
 
 def create_user_liuziyuan():
     """创建或更新用户 刘紫湲"""
@@ -23,6 +24,7 @@ def create_user_liuziyuan():
             # 更新密码
             existing_user.password_hash = get_password_hash(password)
             existing_user.is_active = True
+            sync_login_identifiers(db, existing_user, strict=False)
             db.commit()
             print(f"✓ 更新用户密码：{username} (密码: {password})")
             print(f"  用户ID: {existing_user.id}")
@@ -41,6 +43,8 @@ def create_user_liuziyuan():
             )
             
             db.add(new_user)
+            # 写入登录标识，账号可按唯一索引登录
+            sync_login_identifiers(db, new_user, strict=False)
             db.commit()
             
             print(f"✓ 创建用户：{username} (密码: {password})")
@@ -0,0 +1,311 @@
+"""
+平台每日统计汇总（管理员统计看板）
+后台线程定时扫描各来源表 created_at / updated_at 超过水位的记录，找出受影响的月份，
+按月从业务表重新聚合写入 daily_stats（重算是幂等的，同一月份重复计算结果相同）
+统计接口只读 daily_stats：一条查询同时取回累计总数和最近 90 天的逐日数据
+
+- 水位回退 WATERMARK_OVERLAP 再扫描，避免时间戳早于水位、但在上次扫描后才提交的记录被漏掉
+- 删除记录不会推进水位，删除后运行 rebuild_daily_stats.py 全量重建
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import Date, Integer, cast, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import (
+    Appointment, AppointmentStatus, Comment, CommunityPost, Counselor, CounselorStatus,
+    DailyStats, StatsWatermark, TestReport, User,
+)
+
+logger = logging.getLogger("heart_care.daily_stats")
+
+# 定时汇总间隔（秒）
+STATS_ROLLUP_INTERVAL_SECONDS = float(os.getenv("STATS_ROLLUP_INTERVAL_SECONDS", "300"))
+WATERMARK_OVERLAP = timedelta(minutes=10)
+SERIES_DAYS = 90
+
+# 来源表 -> (水位字段, 影响的统计日期字段)
+SOURCES = {
+    "users": ((User.created_at,), (User.created_at,)),
+    "appointments": (
+        (Appointment.created_at, Appointment.updated_at),
+        (Appointment.created_at, Appointment.appointment_date),
+    ),
+    "test_reports": ((TestReport.created_at,), (TestReport.created_at,)),
+    "community_posts": ((CommunityPost.created_at,), (CommunityPost.created_at,)),
+    "comments": ((Comment.created_at,), (Comment.created_at,)),
+}
+
+# 计为活跃的行为：(用户字段, 时间字段)
+ACTIVITY_COLUMNS = (
+    (User.id, User.created_at),
+    (Appointment.user_id, Appointment.created_at),
+    (TestReport.user_id, TestReport.created_at),
+    (CommunityPost.author_id, CommunityPost.created_at),
+    (Comment.user_id, Comment.created_at),
+)
+
+STATUS_COLUMNS = {
+    AppointmentStatus.PENDING: "appointments_pending",
+    AppointmentStatus.CONFIRMED: "appointments_confirmed",
+    AppointmentStatus.COMPLETED: "appointments_completed",
+    AppointmentStatus.CANCELLED: "appointments_cancelled",
+    AppointmentStatus.REJECTED: "appointments_cancelled",
+}
+
+METRIC_COLUMNS = (
+    "signups", "active_users", "active_users_mtd", "appointments",
+    "appointments_pending", "appointments_confirmed", "appointments_completed", "appointments_cancelled",
+    "completed_sessions", "tests",
+)
+
+_refresh_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _as_date(value) -> Optional[date]:
+    """func.date() 的结果（SQLite 返回字符串）转为 date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _dirty_months(db: Session, source: str, since: Optional[datetime]) -> Tuple[Set[date], Optional[datetime]]:
+    """来源表中时间晚于 since 的记录所影响的月份，以及新的水位"""
+    watermark_columns, day_columns = SOURCES[source]
+
+    # 先取新水位再找变化：两次查询之间写入的记录下次还会再扫描一次，不会遗漏
+    maxima = db.query(*[func.max(column) for column in watermark_columns]).one()
+    new_watermark = max((value for value in maxima if value is not None), default=None)
+
+    # 每个水位字段单独查询，各自走索引范围扫描（OR 条件会退化为全表扫描）
+    filters = [None] if since is None else [column > since for column in watermark_columns]
+    months: Set[date] = set()
+    for criterion in filters:
+        for day_column in day_columns:
+            query = db.query(func.date(day_column)).distinct()
+            if criterion is not None:
+                query = query.filter(criterion)
+            for (day,) in query.all():
+                day = _as_date(day)
+                if day is not None:
+                    months.add(_month_start(day))
+    return months, new_watermark
+
+
+def _count_by_day(db: Session, day_column, count_column, start: datetime, end: datetime, *criteria):
+    day = func.date(day_column)
+    rows = db.query(day, func.count(count_column)).filter(
+        day_column >= start, day_column < end, *criteria
+    ).group_by(day).all()
+    return {_as_date(value): count for value, count in rows}
+
+
+def recompute_month(db: Session, month: date, today: Optional[date] = None) -> int:
+    """从业务表重新聚合某月（截至今天）的每日统计并写入 daily_stats，返回写入天数（调用方负责 commit）"""
+    today = today or date.today()
+    first = _month_start(month)
+    last = min(_next_month(first), today + timedelta(days=1))
+    if first >= last:
+        return 0
+    start, end = datetime.combine(first, time.min), datetime.combine(last, time.min)
+
+    days = [first + timedelta(days=offset) for offset in range((last - first).days)]
+    metrics: Dict[date, Dict[str, int]] = {day: dict.fromkeys(METRIC_COLUMNS, 0) for day in days}
+
+    def put(column: str, counts: Dict[date, int]) -> None:
+        for day, count in counts.items():
+            if day in metrics:
+                metrics[day][column] += count
+
+    put("signups", _count_by_day(db, User.created_at, User.id, start, end))
+    put("tests", _count_by_day(db, TestReport.created_at, TestReport.id, start, end))
+    put("completed_sessions", _count_by_day(
+        db, Appointment.appointment_date, Appointment.id, start, end,
+        Appointment.status == AppointmentStatus.COMPLETED,
+    ))
+
+    created_day = func.date(Appointment.created_at)
+    for value, status, count in db.query(created_day, Appointment.status, func.count(Appointment.id)).filter(
+        Appointment.created_at >= start, Appointment.created_at < end
+    ).group_by(created_day, Appointment.status).all():
+        day = _as_date(value)
+        if day not in metrics:
+            continue
+        metrics[day]["appointments"] += count
+        column = STATUS_COLUMNS.get(AppointmentStatus(status) if status is not None else None)
+        if column:
+            metrics[day][column] += count
+
+    # 活跃用户：各行为的 (日期, 用户) 去重后按日计数，再按月累积得到月初至当日的去重人数
+    activity = union_all(*[
+        select(func.date(time_column).label("day"), user_column.label("user_id")).where(
+            time_column >= start, time_column < end, user_column.isnot(None)
+        )
+        for user_column, time_column in ACTIVITY_COLUMNS
+    ]).subquery()
+    active_by_day = defaultdict(set)
+    for value, user_id in db.execute(select(activity.c.day, activity.c.user_id).distinct()).all():
+        active_by_day[_as_date(value)].add(user_id)
+    month_active: Set[int] = set()
+    for day in days:
+        users = active_by_day.get(day, set())
+        month_active |= users
+        metrics[day]["active_users"] = len(users)
+        metrics[day]["active_users_mtd"] = len(month_active)
+
+    existing = {
+        row.day: row
+        for row in db.query(DailyStats).filter(DailyStats.day >= first, DailyStats.day < last).all()
+    }
+    for day in days:
+        row = existing.get(day)
+        if row is None:
+            db.add(DailyStats(day=day, **metrics[day]))
+        else:
+            for column, value in metrics[day].items():
+                setattr(row, column, value)
+    return len(days)
+
+
+def refresh(db: Optional[Session] = None, full: bool = False) -> int:
+    """
+    按水位增量重算受影响月份的每日统计，返回重算的月份数
+    full 为 True 时忽略水位，重算全部历史
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        with _refresh_lock:
+            watermarks = {row.source: row for row in db.query(StatsWatermark).all()}
+            months: Set[date] = set()
+            new_watermarks = {}
+            for source in SOURCES:
+                row = watermarks.get(source)
+                since = None if full or row is None or row.watermark is None else row.watermark - WATERMARK_OVERLAP
+                dirty, new_watermarks[source] = _dirty_months(db, source, since)
+                months |= dirty
+
+            today = date.today()
+            for month in sorted(months):
+                recompute_month(db, month, today)
+
+            # 统计写入与水位推进在同一事务中提交
+            for source, value in new_watermarks.items():
+                row = watermarks.get(source)
+                if row is None:
+                    db.add(StatsWatermark(source=source, watermark=value))
+                elif value is not None:
+                    row.watermark = value
+            db.commit()
+            if months:
+                logger.info("每日统计已重算 %s 个月", len(months))
+            return len(months)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def load_statistics(db: Session, days: int = SERIES_DAYS, today: Optional[date] = None) -> dict:
+    """
+    读取统计看板数据：累计总数、本月至今数据和最近 days 天的逐日数据
+    逐日数据与总数用一条 UNION ALL 查询取回（总数行的 day 为 NULL）
+    """
+    today = today or date.today()
+    series_start = today - timedelta(days=days - 1)
+    month_start = _month_start(today)
+    columns = [getattr(DailyStats, name) for name in METRIC_COLUMNS]
+
+    series = select(
+        DailyStats.day.label("day"),
+        *[column.label(column.key) for column in columns],
+        literal(0, Integer).label("counselors"),
+    ).where(DailyStats.day >= min(series_start, month_start), DailyStats.day <= today)
+    totals = select(
+        cast(null(), Date).label("day"),
+        *[func.coalesce(func.sum(column), 0).label(column.key) for column in columns],
+        select(func.count(Counselor.id)).where(
+            Counselor.status == CounselorStatus.ACTIVE
+        ).scalar_subquery().label("counselors"),
+    )
+
+    by_day: Dict[date, dict] = {}
+    total = dict.fromkeys(METRIC_COLUMNS, 0)
+    total_counselors = 0
+    for row in db.execute(union_all(series, totals)).mappings().all():
+        if row["day"] is None:
+            total = {name: int(row[name] or 0) for name in METRIC_COLUMNS}
+            total_counselors = int(row["counselors"] or 0)
+        else:
+            by_day[_as_date(row["day"])] = {name: int(row[name] or 0) for name in METRIC_COLUMNS}
+
+    month_rows = [values for day, values in sorted(by_day.items()) if day >= month_start]
+    zero = dict.fromkeys(METRIC_COLUMNS, 0)
+    return {
+        "total_users": total["signups"],
+        "total_counselors": total_counselors,
+        "total_appointments": total["appointments"],
+        "total_tests": total["tests"],
+        # 当月最后一个有统计的日期的累积去重人数
+        "active_users_month": month_rows[-1]["active_users_mtd"] if month_rows else 0,
+        "appointments_month": sum(values["appointments"] for values in month_rows),
+        "new_users_month": sum(values["signups"] for values in month_rows),
+        "completed_sessions_month": sum(values["completed_sessions"] for values in month_rows),
+        "tests_month": sum(values["tests"] for values in month_rows),
+        "series": [
+            {"day": day, **{name: value for name, value in by_day.get(day, zero).items() if name != "active_users_mtd"}}
+            for day in (series_start + timedelta(days=offset) for offset in range(days))
+        ],
+    }
+
+
+def _run() -> None:
+    while True:
+        try:
+            refresh()
+        except Exception as exc:
+            logger.warning("每日统计汇总失败，将在下次重试：%s", exc)
+        if _stop_event.wait(STATS_ROLLUP_INTERVAL_SECONDS):
+            return
+
+
+def start() -> None:
+    """启动定时汇总线程（应用启动时调用，启动后立即汇总一次）"""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_run, name="daily-stats-rollup", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    """停止定时汇总线程（应用退出时调用）"""
+    global _thread
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
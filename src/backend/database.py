@@ -6,10 +6,12 @@
 import logging
 import os
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 from dotenv import load_dotenv, dotenv_values
 from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 logger = logging.getLogger("heart_care.database")
@@ -187,7 +189,7 @@ def _ensure_users_table_columns() -> None:
 def _ensure_appointments_table_columns() -> None:
     """
     启动时检查 appointments 表是否缺少关键字段，若缺失则自动补齐。
-    主要用于处理旧版本数据库缺少 rating 和 review 字段导致的运行错误。
+    主要用于处理旧版本数据库缺少 rating、review 和 end_time 字段导致的运行错误。
     """
     try:
         inspector = inspect(engine)
@@ -218,6 +220,14 @@ def _ensure_appointments_table_columns() -> None:
             )
         )
 
+    if "end_time" not in existing_columns:
+        migrations.append(
+            (
+                "end_time",
+                f"ALTER TABLE appointments ADD COLUMN end_time {_datetime_column_type()} NULL",
+            )
+        )
+
     if not migrations:
         return
 
@@ -230,8 +240,44 @@ def _ensure_appointments_table_columns() -> None:
                 logger.error("补充字段 appointments.%s 失败：%s", column_name, exc)
 
 
+def _ensure_consultation_records_table_columns() -> None:
+    """
+    启动时检查 consultation_records 表是否缺少 end_time 字段，若缺失则自动补齐。
+    历史数据的回填见 migrate_add_appointment_end_time.py
+    """
+    try:
+        inspector = inspect(engine)
+    except Exception as exc:  # pragma: no cover - 仅在启动日志中提示
+        logger.warning("无法检查数据库 schema：%s", exc)
+        return
+
+    if "consultation_records" not in inspector.get_table_names():
+        return
+
+    existing_columns = {col["name"] for col in inspector.get_columns("consultation_records")}
+    if "end_time" in existing_columns:
+        return
+
+    with engine.begin() as connection:
+        try:
+            connection.execute(text(
+                f"ALTER TABLE consultation_records ADD COLUMN end_time {_datetime_column_type()} NULL"
+            ))
+            logger.info("已补充缺失的字段 consultation_records.end_time")
+        except Exception as exc:  # pragma: no cover
+            logger.error("补充字段 consultation_records.end_time 失败：%s", exc)
+
+
+def _datetime_column_type() -> str:
+    """与 DateTime(timezone=True) 对应的各数据库列类型"""
+    if engine.dialect.name == "postgresql":
+        return "TIMESTAMP WITH TIME ZONE"
+    return "DATETIME"
+
+
 _ensure_users_table_columns()
 _ensure_appointments_table_columns()
+_ensure_consultation_records_table_columns()
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -250,3 +296,98 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ============ 异步引擎（可选）============
+# 热点只读接口使用异步会话，不占用线程池；脚本和其余路由继续使用上面的同步引擎。
+# 异步驱动只在首次使用时加载：PostgreSQL 使用 asyncpg，本地 SQLite 使用 aiosqlite，MySQL 使用 aiomysql。
+# 可通过 ASYNC_DATABASE_URL 单独指定异步连接串，默认由 DATABASE_URL 推导。
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+_async_engine = None
+_async_session_factory = None
+
+
+def _build_async_database_url(url: str) -> Tuple[Any, Dict[str, Any]]:
+    """由同步连接串推导异步连接串和 connect_args"""
+    override = os.getenv("ASYNC_DATABASE_URL", "").strip().strip('"').strip("'")
+    async_url = make_url(override or url)
+
+    backend = async_url.get_backend_name()
+    if not override:
+        driver = _ASYNC_DRIVERS.get(backend)
+        if driver is None:
+            raise RuntimeError(f"不支持为 {backend} 创建异步数据库引擎")
+        async_url = async_url.set(drivername=driver)
+
+    async_connect_args: Dict[str, Any] = {}
+    if backend == "postgresql":
+        # asyncpg 不识别 libpq 的 sslmode / channel_binding 参数，改用 ssl 参数（Neon 强制要求 SSL）
+        query = dict(async_url.query)
+        sslmode = query.pop("sslmode", None) or "require"
+        query.pop("channel_binding", None)
+        async_url = async_url.set(query=query)
+        if sslmode != "disable":
+            async_connect_args["ssl"] = sslmode
+    elif backend == "mysql":
+        async_connect_args = {"connect_timeout": 10, "charset": "utf8mb4"}
+
+    return async_url, async_connect_args
+
+
+def get_async_engine():
+    """获取异步引擎（首次调用时创建）"""
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        async_url, async_connect_args = _build_async_database_url(DATABASE_URL)
+        async_engine_kwargs = dict(engine_kwargs)
+        async_engine_kwargs.pop("connect_args", None)
+        if async_url.get_backend_name() == "sqlite":
+            # aiosqlite 使用 NullPool，不接受连接池大小参数
+            for key in ("pool_size", "max_overflow", "pool_timeout"):
+                async_engine_kwargs.pop(key, None)
+        if async_connect_args:
+            async_engine_kwargs["connect_args"] = async_connect_args
+        try:
+            _async_engine = create_async_engine(async_url, **async_engine_kwargs)
+        except ImportError as exc:
+            raise RuntimeError(
+                f"缺少异步数据库驱动 {async_url.drivername}，请执行 pip install -r requirements.txt：{exc}"
+            ) from exc
+        _async_session_factory = async_sessionmaker(
+            _async_engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+        logger.info("Async database engine created: %s", _async_engine.dialect.driver)
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """创建异步会话"""
+    get_async_engine()
+    return _async_session_factory()
+
+
+async def get_async_db():
+    """
+    获取异步数据库会话的依赖函数
+    用于 async def 路由；需要复用同步查询函数时使用 await db.run_sync(...)
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """关闭异步引擎的连接池（应用退出时调用）"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
@@ -0,0 +1,144 @@
+"""
+互动计数（点赞、评论、举报）
+- 点赞以 content_likes 的 (user_id, content_type, content_id) 唯一约束为准：切换时先尝试删除，删不到再插入
+- 计数列只用单条 UPDATE col = col + :delta 原子更新，不在 Python 中读改写
+- 计数漂移时由 reconcile_counters 从明细表重新计算
+"""
+
+import logging
+from typing import Dict, Tuple
+
+from sqlalchemy import and_, case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Comment, CommunityPost, Content, ContentLike, PostReport
+
+logger = logging.getLogger("heart_care.engagement")
+
+# content_likes.content_type -> 被点赞的表
+LIKE_TARGETS = {
+    "post": CommunityPost,
+    "comment": Comment,
+    "content": Content,
+}
+
+# 举报达到该次数的帖子自动转为待审核
+REPORT_HIDE_THRESHOLD = 3
+
+
+def _clamped(column, delta: int):
+    """column + delta，结果不小于 0"""
+    value = func.coalesce(column, 0) + delta
+    return case((value < 0, 0), else_=value)
+
+
+def adjust_counter(db: Session, model, row_id: int, column_name: str, delta: int) -> int:
+    """原子地调整一行的计数列并返回新值（支持 RETURNING 的数据库一次往返完成）"""
+    column = getattr(model, column_name)
+    statement = update(model).where(model.id == row_id).values(
+        {column_name: _clamped(column, delta)}
+    ).execution_options(synchronize_session=False)
+
+    if db.get_bind().dialect.update_returning:
+        value = db.execute(statement.returning(column)).scalar()
+    else:
+        db.execute(statement)
+        # 本事务已持有该行的写锁，读到的就是刚写入的值
+        value = db.execute(select(column).where(model.id == row_id)).scalar()
+    return int(value or 0)
+
+
+def toggle_like(db: Session, user_id: int, content_type: str, content_id: int) -> Tuple[bool, int]:
+    """
+    切换点赞状态（调用方负责 commit）
+    返回 (是否已点赞, 新的点赞数)
+    """
+    model = LIKE_TARGETS[content_type]
+
+    deleted = db.execute(
+        delete(ContentLike).where(
+            ContentLike.user_id == user_id,
+            ContentLike.content_type == content_type,
+            ContentLike.content_id == content_id,
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    if deleted:
+        return False, adjust_counter(db, model, content_id, "like_count", -deleted)
+
+    savepoint = db.begin_nested()
+    try:
+        db.add(ContentLike(user_id=user_id, content_type=content_type, content_id=content_id))
+        db.flush()
+        savepoint.commit()
+    except IntegrityError:
+        # 同一用户的并发请求已经点过赞：保持已点赞，不重复计数
+        savepoint.rollback()
+        value = db.execute(select(model.like_count).where(model.id == content_id)).scalar()
+        return True, int(value or 0)
+    return True, adjust_counter(db, model, content_id, "like_count", 1)
+
+
+def record_comment(db: Session, post_id: int) -> int:
+    """新增评论后增加帖子评论数，返回新值"""
+    return adjust_counter(db, CommunityPost, post_id, "comment_count", 1)
+
+
+def record_report(db: Session, post_id: int) -> Tuple[int, bool]:
+    """
+    举报记录写入后增加帖子举报次数，达到阈值时在同一条语句中转为待审核
+    返回 (新的举报次数, 是否仍为已审核)
+    """
+    new_count = func.coalesce(CommunityPost.report_count, 0) + 1
+    # is_approved 必须排在 report_count 之前：MySQL 按从左到右的顺序赋值，后面的表达式读到的是已更新的值；
+    # 其他数据库始终读取更新前的值，两种语义下 CASE 中的 report_count 都是旧值
+    statement = update(CommunityPost).where(CommunityPost.id == post_id).ordered_values(
+        (CommunityPost.is_approved, case((new_count >= REPORT_HIDE_THRESHOLD, False), else_=CommunityPost.is_approved)),
+        (CommunityPost.report_count, new_count),
+    ).execution_options(synchronize_session=False)
+
+    if db.get_bind().dialect.update_returning:
+        row = db.execute(statement.returning(CommunityPost.report_count, CommunityPost.is_approved)).one()
+    else:
+        db.execute(statement)
+        row = db.execute(
+            select(CommunityPost.report_count, CommunityPost.is_approved).where(CommunityPost.id == post_id)
+        ).one()
+    return int(row[0] or 0), bool(row[1])
+
+
+def _reconcile(db: Session, model, column_name: str, count_query) -> int:
+    """把计数列更新为明细表的实际数量，只改写不一致的行，返回更新行数"""
+    actual = count_query.scalar_subquery()
+    column = getattr(model, column_name)
+    return db.execute(
+        update(model).where(func.coalesce(column, -1) != actual).values(
+            {column_name: actual}
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def reconcile_counters(db: Session) -> Dict[str, int]:
+    """
+    从 content_likes / comments / post_reports 重新计算全部互动计数
+    返回各计数列被修正的行数
+    """
+    result: Dict[str, int] = {}
+    for content_type, model in LIKE_TARGETS.items():
+        result[f"{model.__tablename__}.like_count"] = _reconcile(
+            db, model, "like_count",
+            select(func.count(ContentLike.id)).where(and_(
+                ContentLike.content_type == content_type,
+                ContentLike.content_id == model.id,
+            )),
+        )
+    result["community_posts.comment_count"] = _reconcile(
+        db, CommunityPost, "comment_count",
+        select(func.count(Comment.id)).where(Comment.post_id == CommunityPost.id),
+    )
+    result["community_posts.report_count"] = _reconcile(
+        db, CommunityPost, "report_count",
+        select(func.count(PostReport.id)).where(PostReport.post_id == CommunityPost.id),
+    )
+    db.commit()
+    return result
@@ -53,6 +53,7 @@ def init_default_data():
     """初始化默认数据（可选）"""
     from auth import get_password_hash
     from models import UserRole
+    from login_identifiers import sync_login_identifiers
     
     db = SessionLocal()
     try:
@@ -67,6 +68,8 @@ def init_default_data():
                 nickname="系统管理员"
             )
             db.add(admin_user)
+            # 写入登录标识，账号可按唯一索引登录
+            sync_login_identifiers(db, admin_user, strict=False)
             print("✅ 管理员账户已创建：一只炸虾 / zhaxia")
         else:
             print("ℹ️  管理员账户已存在")
@@ -0,0 +1,156 @@
+"""
+登录标识
+用户名、手机号、邮箱、学号、昵称规范化后写入 login_identifiers 表（值唯一），
+登录时按唯一索引点查，替代原来对 users 表五个字段的 OR 查询
+
+同一个值只能指向一个用户：
+- 用户名、手机号、邮箱、学号与其他用户的登录标识冲突时拒绝写入
+- 昵称不唯一，已被其他用户占用的昵称不作为登录标识（昵称本身照常保存和展示）；
+  昵称占用的值会被其他用户的用户名、手机号、邮箱、学号顶替
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import LoginIdentifier, User
+
+logger = logging.getLogger("heart_care.login_identifiers")
+
+# 同一用户多个字段取值相同时，按此顺序保留一个
+KIND_PRIORITY = ("username", "phone", "email", "student_id", "nickname")
+NICKNAME = "nickname"
+KIND_LABELS = {
+    "username": "用户名",
+    "phone": "手机号",
+    "email": "邮箱",
+    "student_id": "学号",
+    "nickname": "昵称",
+}
+
+# 与表结构保持一致
+MAX_VALUE_LENGTH = 100
+
+
+class LoginIdentifierConflict(Exception):
+    """登录标识已被其他用户占用"""
+
+    def __init__(self, kind: str, value: str):
+        super().__init__(f"{kind}={value}")
+        self.kind = kind
+        self.value = value
+
+    @property
+    def detail(self) -> str:
+        return f"该{KIND_LABELS.get(self.kind, '账号')}已被其他账号使用"
+
+
+def normalize(kind: str, value: Optional[str]) -> Optional[str]:
+    """规范化标识值：去除首尾空白，邮箱转小写；空值或超长返回 None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if kind == "email":
+        value = value.lower()
+    if not value or len(value) > MAX_VALUE_LENGTH:
+        return None
+    return value
+
+
+def lookup_values(account: str) -> List[str]:
+    """登录输入可能对应的规范化值（不知道输入的是哪种标识，邮箱形式额外匹配小写）"""
+    value = (account or "").strip()
+    if not value:
+        return []
+    values = [value]
+    if "@" in value and value.lower() != value:
+        values.append(value.lower())
+    return values
+
+
+def _desired_identifiers(user: User) -> Dict[str, str]:
+    """用户应有的登录标识（value -> kind）"""
+    desired: Dict[str, str] = {}
+    for kind in KIND_PRIORITY:
+        value = normalize(kind, getattr(user, kind))
+        if value is not None and value not in desired:
+            desired[value] = kind
+    return desired
+
+
+def sync_login_identifiers(db: Session, user: User, strict: bool = True) -> List[Tuple[str, str]]:
+    """
+    按用户当前字段重建其登录标识（在写入用户的同一事务中调用，user 需已 flush 获得 id）
+    strict 为 True 时非昵称冲突抛出 LoginIdentifierConflict，否则跳过（回填使用）
+    返回未能写入的 (kind, value) 列表
+    """
+    if user.id is None:
+        db.flush()
+
+    desired = _desired_identifiers(user)
+    taken = {
+        row.value_normalized: row
+        for row in db.query(LoginIdentifier).filter(
+            LoginIdentifier.value_normalized.in_(list(desired))
+        ).all()
+    } if desired else {}
+
+    skipped: List[Tuple[str, str]] = []
+    for value, kind in list(desired.items()):
+        row = taken.get(value)
+        if row is None or row.user_id == user.id:
+            continue
+        if kind == NICKNAME:
+            # 昵称重复：该昵称仍归先占用的用户
+            logger.info("昵称 %s 已被用户 %s 用作登录标识，用户 %s 不能用其登录", value, row.user_id, user.id)
+            skipped.append((kind, value))
+            del desired[value]
+        elif row.kind == NICKNAME:
+            # 其他用户的昵称让位于本用户的用户名、手机号、邮箱、学号
+            logger.info("用户 %s 的昵称 %s 被用户 %s 的 %s 顶替", row.user_id, value, user.id, kind)
+            db.delete(row)
+            del taken[value]
+        elif strict:
+            raise LoginIdentifierConflict(kind, value)
+        else:
+            logger.warning("登录标识冲突：%s=%s 已属于用户 %s，跳过用户 %s", kind, value, row.user_id, user.id)
+            skipped.append((kind, value))
+            del desired[value]
+
+    existing = {
+        row.value_normalized: row
+        for row in db.query(LoginIdentifier).filter(LoginIdentifier.user_id == user.id).all()
+    }
+    for value, row in existing.items():
+        if value not in desired:
+            db.delete(row)
+        elif row.kind != desired[value]:
+            row.kind = desired[value]
+    # 删除（包括被顶替的昵称）先于插入执行，避免唯一索引冲突
+    db.flush()
+    db.add_all([
+        LoginIdentifier(kind=kind, value_normalized=value, user_id=user.id)
+        for value, kind in desired.items()
+        if value not in existing
+    ])
+    return skipped
+
+
+def clear_login_identifiers(db: Session, user_id: int) -> None:
+    """删除用户的全部登录标识（删除用户前调用）"""
+    db.query(LoginIdentifier).filter(LoginIdentifier.user_id == user_id).delete(synchronize_session=False)
+
+
+def find_user_id(db: Session, account: str) -> Optional[int]:
+    """按登录输入点查用户 ID（精确值优先于小写邮箱）"""
+    values = lookup_values(account)
+    if not values:
+        return None
+    rows = dict(db.query(LoginIdentifier.value_normalized, LoginIdentifier.user_id).filter(
+        LoginIdentifier.value_normalized.in_(values)
+    ).all())
+    for value in values:
+        if value in rows:
+            return rows[value]
+    return None
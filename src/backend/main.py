@@ -12,7 +12,10 @@ from typing import List
 import uvicorn
 import traceback
 
-from database import get_db, engine
+from database import get_db, engine, dispose_async_engine
+import password_hashing
+import daily_stats
+import view_counter
 from models import Base
 from routers import auth, users, counselors, appointments, tests, content, community, admin
 
@@ -113,6 +116,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         headers={
+            # 保留异常自带的响应头（如 WWW-Authenticate、Retry-After）
+            **(exc.headers or {}),
             "Access-Control-Allow-Origin": allow_origin,
             "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS, PATCH",
             "Access-Control-Allow-Headers": "*",
@@ -260,6 +265,22 @@ app.include_router(community.router, prefix="/api/community", tags=["互助社
 app.include_router(admin.router, prefix="/api/admin", tags=["管理员"])
 
 
+@app.on_event("startup")
+async def start_background_tasks():
+    """启动浏览量定时写回和每日统计汇总"""
+    view_counter.start()
+    daily_stats.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_database():
+    """写回剩余浏览量，关闭异步数据库连接池和密码哈希进程池"""
+    view_counter.stop()
+    daily_stats.stop()
+    await dispose_async_engine()
+    password_hashing.shutdown_pool()
+
+
 @app.get("/")
 async def root():
     """根路径 - API 健康检查"""
@@ -0,0 +1,116 @@
+"""
+数据库迁移脚本：将预约结束时间从 description 迁移到 end_time 字段
+- 为 appointments / consultation_records 表添加 end_time 字段及索引
+- 分批解析旧数据 description 中的 |END_TIME: 标记，写入 end_time 并去掉该标记
+- 没有标记的历史预约保持 end_time 为空，读取时按默认时长计算
+"""
+
+import sys
+
+from sqlalchemy import inspect, text
+
+from database import engine, SessionLocal
+from models import Appointment, ConsultationRecord
+from utils import END_TIME_MARKER, split_end_time_marker
+
+BATCH_SIZE = 500
+
+
+def ensure_columns():
+    """确保 end_time 字段和索引存在（导入 database 时已尝试自动补齐字段）"""
+    inspector = inspect(engine)
+    for model in (Appointment, ConsultationRecord):
+        table_name = model.__tablename__
+        existing_columns = {col["name"] for col in inspector.get_columns(table_name)}
+        if "end_time" not in existing_columns:
+            column_type = "TIMESTAMP WITH TIME ZONE" if engine.dialect.name == "postgresql" else "DATETIME"
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN end_time {column_type} NULL"))
+            print(f"✓ 已添加字段 {table_name}.end_time")
+        else:
+            print(f"✓ 字段 {table_name}.end_time 已存在")
+
+        for index in model.__table__.indexes:
+            if "end_time" not in index.columns:
+                continue
+            index.create(bind=engine, checkfirst=True)
+            print(f"✓ 索引 {index.name} 已就绪")
+
+
+def backfill(model):
+    """按主键分批回填 end_time，每批单独提交"""
+    table_name = model.__tablename__
+    print(f"\n开始回填 {table_name}.end_time ...")
+
+    db = SessionLocal()
+    last_id = 0
+    updated = 0
+    skipped = 0
+    try:
+        while True:
+            rows = db.query(model).filter(
+                model.id > last_id,
+                model.description.like(f"%{END_TIME_MARKER}%")
+            ).order_by(model.id.asc()).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+
+            for row in rows:
+                cleaned, end_time = split_end_time_marker(row.description)
+                if end_time is None:
+                    skipped += 1
+                    continue
+                if row.end_time is None:
+                    row.end_time = end_time
+                row.description = cleaned
+                updated += 1
+
+            last_id = rows[-1].id
+            db.commit()
+            print(f"  已处理至 id={last_id}，累计回填 {updated} 条")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✓ {table_name} 回填完成：{updated} 条，无法解析 {skipped} 条")
+
+
+def sync_consultation_records():
+    """咨询记录从对应预约复制仍为空的 end_time"""
+    db = SessionLocal()
+    try:
+        result = db.execute(text(
+            "UPDATE consultation_records SET end_time = ("
+            "  SELECT appointments.end_time FROM appointments"
+            "  WHERE appointments.id = consultation_records.appointment_id"
+            ") WHERE end_time IS NULL AND appointment_id IS NOT NULL"
+        ))
+        db.commit()
+        print(f"✓ 已从预约同步咨询记录结束时间（影响 {result.rowcount} 行）")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def migrate():
+    """执行迁移"""
+    print("开始迁移预约结束时间...")
+    ensure_columns()
+    backfill(Appointment)
+    backfill(ConsultationRecord)
+    sync_consultation_records()
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,38 @@
+"""
+数据库迁移脚本：为 appointments 表添加预约时间复合索引
+- ix_appointments_counselor_date (counselor_id, appointment_date)
+- ix_appointments_user_date (user_id, appointment_date)
+用于创建预约时的时段冲突检测和可用时段查询
+"""
+
+import sys
+
+from database import engine
+from models import Appointment
+
+
+def migrate():
+    """创建 appointments 表上缺失的索引"""
+    print("开始创建 appointments 表索引...")
+
+    for index in Appointment.__table__.indexes:
+        if index.name not in ("ix_appointments_counselor_date", "ix_appointments_user_date"):
+            continue
+        try:
+            index.create(bind=engine, checkfirst=True)
+            print(f"✓ 索引 {index.name} 已就绪")
+        except Exception as e:
+            print(f"✗ 创建索引 {index.name} 失败: {e}")
+            raise
+
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,37 @@
+"""
+数据库迁移脚本：为 comments 表添加评论分页复合索引
+- ix_comments_post_approved_created (post_id, is_approved, created_at)
+用于按帖子游标分页读取评论
+"""
+
+import sys
+
+from database import engine
+from models import Comment
+
+
+def migrate():
+    """创建 comments 表上缺失的索引"""
+    print("开始创建 comments 表索引...")
+
+    for index in Comment.__table__.indexes:
+        if index.name != "ix_comments_post_approved_created":
+            continue
+        try:
+            index.create(bind=engine, checkfirst=True)
+            print(f"✓ 索引 {index.name} 已就绪")
+        except Exception as e:
+            print(f"✗ 创建索引 {index.name} 失败: {e}")
+            raise
+
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
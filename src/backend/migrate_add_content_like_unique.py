@@ -0,0 +1,84 @@
+"""
+数据库迁移脚本：为 content_likes 添加 (user_id, content_type, content_id) 唯一约束
+- 删除重复的点赞记录（每组保留 id 最小的一条）
+- 创建唯一索引 uq_content_like_user_target
+- 按点赞记录重新计算帖子、评论、科普内容的点赞数（以及帖子评论数、举报次数）
+可重复执行
+"""
+
+import sys
+
+from sqlalchemy import inspect, text
+
+from database import engine, SessionLocal
+from engagement import reconcile_counters
+
+INDEX_NAME = "uq_content_like_user_target"
+
+
+def remove_duplicates():
+    """删除重复点赞，每组保留 id 最小的一条"""
+    with engine.begin() as conn:
+        # 先查出要删除的 id 再按批删除，兼容 MySQL 不允许 DELETE 子查询引用自身表的限制
+        duplicate_ids = [
+            row[0] for row in conn.execute(text(
+                "SELECT l.id FROM content_likes l WHERE EXISTS ("
+                "  SELECT 1 FROM content_likes k"
+                "  WHERE k.user_id = l.user_id AND k.content_type = l.content_type"
+                "  AND k.content_id = l.content_id AND k.id < l.id"
+                ")"
+            ))
+        ]
+        if not duplicate_ids:
+            print("✓ 没有重复的点赞记录")
+            return
+        for start in range(0, len(duplicate_ids), 500):
+            batch = duplicate_ids[start:start + 500]
+            conn.execute(
+                text(f"DELETE FROM content_likes WHERE id IN ({', '.join(str(i) for i in batch)})")
+            )
+        print(f"✓ 已删除重复点赞 {len(duplicate_ids)} 条")
+
+
+def create_unique_index():
+    """创建唯一索引"""
+    inspector = inspect(engine)
+    existing = {index["name"] for index in inspector.get_indexes("content_likes")}
+    existing |= {constraint["name"] for constraint in inspector.get_unique_constraints("content_likes")}
+    if INDEX_NAME in existing:
+        print(f"✓ 唯一索引 {INDEX_NAME} 已存在")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX {INDEX_NAME} ON content_likes (user_id, content_type, content_id)"
+        ))
+    print(f"✓ 已创建唯一索引 {INDEX_NAME}")
+
+
+def migrate():
+    """执行迁移"""
+    print("开始迁移点赞唯一约束...")
+    remove_duplicates()
+    create_unique_index()
+
+    db = SessionLocal()
+    try:
+        for column, count in reconcile_counters(db).items():
+            print(f"✓ {column} 修正 {count} 行")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+数据库迁移脚本：创建咨询师标签表并回填
+- counselor_specialties：擅长领域标签
+- counselor_consult_methods：咨询方式标签
+从 counselors.specialty / consult_methods 的 JSON 数组原文解析后写入，可重复执行
+"""
+
+import sys
+
+from database import engine, SessionLocal
+from models import Counselor, CounselorSpecialty, CounselorConsultMethod
+from counselor_tags import sync_counselor_tags
+
+BATCH_SIZE = 200
+
+
+def migrate():
+    """创建标签表并按咨询师分批回填"""
+    print("开始迁移咨询师标签...")
+
+    for model in (CounselorSpecialty, CounselorConsultMethod):
+        model.__table__.create(bind=engine, checkfirst=True)
+        print(f"✓ 表 {model.__tablename__} 已就绪")
+
+    db = SessionLocal()
+    last_id = 0
+    total = 0
+    try:
+        while True:
+            counselors = db.query(Counselor).filter(
+                Counselor.id > last_id
+            ).order_by(Counselor.id.asc()).limit(BATCH_SIZE).all()
+            if not counselors:
+                break
+            for counselor in counselors:
+                sync_counselor_tags(db, counselor)
+            db.commit()
+            last_id = counselors[-1].id
+            total += len(counselors)
+            print(f"  已同步 {total} 位咨询师")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✓ 共同步 {total} 位咨询师的标签")
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
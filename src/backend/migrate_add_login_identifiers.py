@@ -0,0 +1,63 @@
+"""
+数据库迁移脚本：创建登录标识表并回填
+- login_identifiers：用户名、手机号、邮箱、学号、昵称规范化后的值 -> 用户（值唯一）
+按用户 ID 顺序分批回填，可重复执行；同一个值出现在多个用户上时保留先注册的用户，冲突逐条输出
+
+登录默认只按登录标识查找账号（LOGIN_IDENTIFIER_FALLBACK 默认关闭）。
+升级后须先运行本脚本回填；回填完成前可设置 LOGIN_IDENTIFIER_FALLBACK=true，
+让未命中的登录回退到 users 表的多字段查询并顺便补写登录标识
+"""
+
+import sys
+
+from database import engine, SessionLocal
+from models import LoginIdentifier, User
+from login_identifiers import sync_login_identifiers
+
+BATCH_SIZE = 500
+
+
+def migrate():
+    """创建登录标识表并按用户分批回填"""
+    print("开始迁移登录标识...")
+
+    LoginIdentifier.__table__.create(bind=engine, checkfirst=True)
+    print(f"✓ 表 {LoginIdentifier.__tablename__} 已就绪")
+
+    db = SessionLocal()
+    last_id = 0
+    total = 0
+    conflicts = 0
+    try:
+        while True:
+            users = db.query(User).filter(
+                User.id > last_id
+            ).order_by(User.id.asc()).limit(BATCH_SIZE).all()
+            if not users:
+                break
+            for user in users:
+                for kind, value in sync_login_identifiers(db, user, strict=False):
+                    conflicts += 1
+                    print(f"  ✗ 用户 {user.id} 的 {kind}={value} 已被其他用户占用，未写入")
+            db.commit()
+            last_id = users[-1].id
+            total += len(users)
+            print(f"  已同步 {total} 位用户")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✓ 共同步 {total} 位用户的登录标识，冲突 {conflicts} 条")
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
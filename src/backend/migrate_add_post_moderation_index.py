@@ -0,0 +1,37 @@
+"""
+数据库迁移脚本：为 community_posts 表添加审核队列复合索引
+- ix_community_posts_moderation (is_approved, is_deleted, created_at)
+用于管理员按游标分页读取待审核帖子
+"""
+
+import sys
+
+from database import engine
+from models import CommunityPost
+
+
+def migrate():
+    """创建 community_posts 表上缺失的索引"""
+    print("开始创建 community_posts 表索引...")
+
+    for index in CommunityPost.__table__.indexes:
+        if index.name != "ix_community_posts_moderation":
+            continue
+        try:
+            index.create(bind=engine, checkfirst=True)
+            print(f"✓ 索引 {index.name} 已就绪")
+        except Exception as e:
+            print(f"✗ 创建索引 {index.name} 失败: {e}")
+            raise
+
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,50 @@
+"""
+数据库迁移脚本：为每日统计的水位字段添加索引
+- ix_users_created_at
+- ix_appointments_created_at / ix_appointments_updated_at
+- ix_test_reports_created_at
+- ix_community_posts_created_at
+- ix_comments_created_at
+用于 daily_stats 定时任务按水位查找变化记录和按月重算，避免每次扫描全表
+"""
+
+import sys
+
+from database import engine
+from models import Appointment, Comment, CommunityPost, TestReport, User
+
+WATERMARK_INDEXES = {
+    User: ("ix_users_created_at",),
+    Appointment: ("ix_appointments_created_at", "ix_appointments_updated_at"),
+    TestReport: ("ix_test_reports_created_at",),
+    CommunityPost: ("ix_community_posts_created_at",),
+    Comment: ("ix_comments_created_at",),
+}
+
+
+def migrate():
+    """创建各来源表上缺失的水位索引"""
+    print("开始创建每日统计水位索引...")
+
+    for model, index_names in WATERMARK_INDEXES.items():
+        for index in model.__table__.indexes:
+            if index.name not in index_names:
+                continue
+            try:
+                index.create(bind=engine, checkfirst=True)
+                print(f"✓ 索引 {index.name} 已就绪")
+            except Exception as e:
+                print(f"✗ 创建索引 {index.name} 失败: {e}")
+                raise
+
+    print("\n数据库迁移完成！")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -3,7 +3,7 @@
 使用 SQLAlchemy ORM 定义所有表结构
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Float, Boolean, ForeignKey, Date, Time, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Float, Boolean, ForeignKey, Date, Time, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -81,7 +81,7 @@ class User(Base):
     record_retention = Column(String(20), default="3months")  # 记录保留时长
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 每日统计水位扫描
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # 关系
@@ -98,6 +98,20 @@ class User(Base):
     emergency_helps = relationship("EmergencyHelp", back_populates="user")
 
 
+class LoginIdentifier(Base):
+    """登录标识表（用户名、手机号、邮箱、学号、昵称规范化后的值 -> 用户，登录时按唯一索引点查）"""
+    __tablename__ = "login_identifiers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)  # username / phone / email / student_id / nickname
+    value_normalized = Column(String(100), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('value_normalized', name='uq_login_identifiers_value'),
+    )
+
+
 class Counselor(Base):
     """咨询师表"""
     __tablename__ = "counselors"
@@ -149,6 +163,36 @@ class Counselor(Base):
     favorites = relationship("CounselorFavorite", back_populates="counselor")
 
 
+class CounselorSpecialty(Base):
+    """咨询师擅长领域标签表（由 counselors.specialty 规范化而来，用于索引筛选）"""
+    __tablename__ = "counselor_specialties"
+
+    id = Column(Integer, primary_key=True, index=True)
+    counselor_id = Column(Integer, ForeignKey("counselors.id"), nullable=False, index=True)
+    name = Column(String(50), nullable=False)  # 擅长领域，如 学业压力
+    position = Column(Integer, nullable=False, default=0)  # 在原字段中的顺序（用于展示）
+
+    __table_args__ = (
+        UniqueConstraint('counselor_id', 'name', name='uq_counselor_specialty'),
+        Index("ix_counselor_specialties_name_counselor", "name", "counselor_id"),
+    )
+
+
+class CounselorConsultMethod(Base):
+    """咨询师咨询方式标签表（由 counselors.consult_methods 规范化而来，用于索引筛选）"""
+    __tablename__ = "counselor_consult_methods"
+
+    id = Column(Integer, primary_key=True, index=True)
+    counselor_id = Column(Integer, ForeignKey("counselors.id"), nullable=False, index=True)
+    name = Column(String(50), nullable=False)  # 咨询方式，如 线上视频
+    position = Column(Integer, nullable=False, default=0)  # 在原字段中的顺序（用于展示）
+
+    __table_args__ = (
+        UniqueConstraint('counselor_id', 'name', name='uq_counselor_consult_method'),
+        Index("ix_counselor_consult_methods_name_counselor", "name", "counselor_id"),
+    )
+
+
 class CounselorFavorite(Base):
     """咨询师收藏表"""
     __tablename__ = "counselor_favorites"
@@ -216,6 +260,7 @@ class Appointment(Base):
     consult_type = Column(String(100), nullable=True)  # 咨询类型
     consult_method = Column(String(50), nullable=False)  # 咨询方式（直接存储中文：线上视频、线下面谈、语音咨询、文字咨询）
     appointment_date = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=True, index=True)  # 预约结束时间（为空时按默认时长计算）
     
     # 咨询诉求
     description = Column(Text, nullable=True)
@@ -233,8 +278,14 @@ class Appointment(Base):
     counselor_confirmed_complete = Column(Boolean, default=False)  # 咨询师确认咨询结束
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 每日统计水位扫描
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), index=True)  # 每日统计水位扫描
+    
+    # 复合索引：按咨询师/用户 + 预约时间做区间查询（冲突检测、可用时段）
+    __table_args__ = (
+        Index("ix_appointments_counselor_date", "counselor_id", "appointment_date"),
+        Index("ix_appointments_user_date", "user_id", "appointment_date"),
+    )
     
     # 关系
     user = relationship("User", back_populates="appointments", foreign_keys=[user_id])
@@ -278,7 +329,7 @@ class TestReport(Base):
     result_json = Column(Text, nullable=True)  # 详细结果 (JSON)
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 每日统计水位扫描
     
     # 关系
     user = relationship("User", back_populates="test_reports")
@@ -338,12 +389,17 @@ class CommunityPost(Base):
     is_deleted = Column(Boolean, default=False)
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 每日统计水位扫描
     
     # 关系
     author = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post")
 
+    # 复合索引：管理员审核队列按 (created_at, id) 游标分页读取待审核帖子
+    __table_args__ = (
+        Index("ix_community_posts_moderation", "is_approved", "is_deleted", "created_at"),
+    )
+
 
 class Comment(Base):
     """评论表"""
@@ -357,7 +413,12 @@ class Comment(Base):
     like_count = Column(Integer, default=0)
     
     is_approved = Column(Boolean, default=True)  # 直接发布，不需要审核
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 每日统计水位扫描
+    
+    # 复合索引：按帖子分页读取已通过审核的评论（created_at, id 游标）
+    __table_args__ = (
+        Index("ix_comments_post_approved_created", "post_id", "is_approved", "created_at"),
+    )
     
     # 关系
     post = relationship("CommunityPost", back_populates="comments")
@@ -466,6 +527,11 @@ class ContentLike(Base):
     content_id = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # 唯一约束：同一用户对同一内容只能点赞一次（点赞切换按插入/删除实现）
+    __table_args__ = (
+        UniqueConstraint('user_id', 'content_type', 'content_id', name='uq_content_like_user_target'),
+    )
+    
     # 关系
     user = relationship("User", back_populates="content_likes")
 
@@ -501,6 +567,7 @@ class ConsultationRecord(Base):
     consult_type = Column(String(100), nullable=True)  # 咨询类型
     consult_method = Column(String(50), nullable=False)  # 咨询方式（直接存储中文：线上视频、线下面谈、语音咨询、文字咨询）
     appointment_date = Column(DateTime(timezone=True), nullable=False)  # 预约时间
+    end_time = Column(DateTime(timezone=True), nullable=True, index=True)  # 预约结束时间
     description = Column(Text, nullable=True)  # 咨询诉求
     
     # 咨询结果
@@ -520,3 +587,55 @@ class ConsultationRecord(Base):
     appointment = relationship("Appointment")
     user = relationship("User", back_populates="consultation_records", foreign_keys=[user_id])
     counselor = relationship("Counselor", back_populates="consultation_records", foreign_keys=[counselor_id])
+
+
+class StatsCounter(Base):
+    """
+    仪表盘计数表（冗余统计）
+    与预约、评分、测评写入在同一事务中更新，数据漂移时运行 rebuild_stats_counters.py 重建
+    """
+    __tablename__ = "stats_counters"
+
+    owner_type = Column(String(20), primary_key=True)  # user / counselor
+    owner_id = Column(Integer, primary_key=True)  # 用户ID 或 咨询师ID
+
+    pending_appointments = Column(Integer, nullable=False, default=0)  # 待确认预约数
+    completed_appointments = Column(Integer, nullable=False, default=0)  # 已完成咨询数
+    test_reports = Column(Integer, nullable=False, default=0)  # 测评报告数（仅用户）
+    favorites = Column(Integer, nullable=False, default=0)  # 收藏数（仅用户）
+    rating_count = Column(Integer, nullable=False, default=0)  # 评分数（仅咨询师）
+    rating_sum = Column(Integer, nullable=False, default=0)  # 评分总和（仅咨询师）
+    good_rating_count = Column(Integer, nullable=False, default=0)  # 4分及以上评分数（仅咨询师）
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class DailyStats(Base):
+    """
+    平台每日统计汇总（管理员统计看板）
+    由 daily_stats 定时任务按 created_at / updated_at 水位增量重算，统计漂移时运行 rebuild_daily_stats.py 全量重建
+    """
+    __tablename__ = "daily_stats"
+
+    day = Column(Date, primary_key=True)
+
+    signups = Column(Integer, nullable=False, default=0)  # 当日注册用户数
+    active_users = Column(Integer, nullable=False, default=0)  # 当日活跃用户数（注册、预约、测评、发帖、评论）
+    active_users_mtd = Column(Integer, nullable=False, default=0)  # 当月 1 日至当日的活跃用户数（去重）
+    appointments = Column(Integer, nullable=False, default=0)  # 当日创建的预约数
+    appointments_pending = Column(Integer, nullable=False, default=0)  # 其中当前待确认
+    appointments_confirmed = Column(Integer, nullable=False, default=0)  # 其中当前已确认
+    appointments_completed = Column(Integer, nullable=False, default=0)  # 其中当前已完成
+    appointments_cancelled = Column(Integer, nullable=False, default=0)  # 其中当前已取消或已拒绝
+    completed_sessions = Column(Integer, nullable=False, default=0)  # 预约时间在当日且已完成的咨询数
+    tests = Column(Integer, nullable=False, default=0)  # 当日提交的测评数
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class StatsWatermark(Base):
+    """每日统计任务已处理到的各来源表时间水位"""
+    __tablename__ = "stats_watermarks"
+
+    source = Column(String(50), primary_key=True)  # 来源表名
+    watermark = Column(DateTime(timezone=True), nullable=True)  # 已处理的最大 created_at / updated_at
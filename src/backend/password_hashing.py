@@ -0,0 +1,157 @@
+"""
+密码哈希
+bcrypt 是 CPU 密集型计算：请求路径上的哈希和校验提交到独立的进程池执行，
+登录高峰时不再占满请求线程、拖慢同一进程内的其他接口；
+同时最多允许 PASSWORD_HASH_MAX_PENDING 个任务排队或执行，超出时立即拒绝（由路由返回 503）
+
+本模块只依赖 bcrypt，进程池子进程导入时不会连接数据库
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+logger = logging.getLogger("heart_care.password_hashing")
+
+# bcrypt 成本因子；调整后旧哈希会在用户下次登录时自动重新生成
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# 进程池大小，设为 0 时在调用线程中直接计算（仍受排队上限约束）
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 排队加执行中的任务上限
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+# 单个任务的最长等待时间（秒）
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
+
+# bcrypt 限制密码不能超过 72 字节
+MAX_PASSWORD_BYTES = 72
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_admission = threading.BoundedSemaphore(max(1, PASSWORD_HASH_MAX_PENDING))
+
+
+class PasswordHashingBusy(Exception):
+    """进程池排队已满或任务超时"""
+
+
+def _truncate_password(password: str, max_bytes: int = MAX_PASSWORD_BYTES) -> str:
+    """
+    将密码截断到指定的最大字节数（bcrypt限制为72字节）
+    使用UTF-8编码，确保不会截断多字节字符的中间部分
+    """
+    if not password:
+        return password
+
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) <= max_bytes:
+        return password
+
+    # 截断后若出现不完整的UTF-8序列，逐个移除末尾字节直到可以解码
+    truncated_bytes = password_bytes[:max_bytes]
+    while truncated_bytes:
+        try:
+            return truncated_bytes.decode('utf-8')
+        except UnicodeDecodeError:
+            truncated_bytes = truncated_bytes[:-1]
+    return ""
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """在当前线程中生成密码哈希（脚本使用；请求路径请使用 pooled_hash_password）"""
+    import bcrypt
+
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    hashed = bcrypt.hashpw(_truncate_password(password).encode('utf-8'), salt)
+    return hashed.decode('utf-8')
+
+
+def check_password(plain_password: str, hashed_password) -> bool:
+    """在当前线程中校验密码（脚本使用；请求路径请使用 pooled_check_password）"""
+    import bcrypt
+
+    try:
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode('utf-8')
+        return bcrypt.checkpw(_truncate_password(plain_password).encode('utf-8'), hashed_password)
+    except Exception:
+        return False
+
+
+def hash_rounds(hashed_password: Optional[str]) -> Optional[int]:
+    """解析 bcrypt 哈希中的成本因子（格式 $2b$12$...），无法解析时返回 None"""
+    if not hashed_password:
+        return None
+    parts = hashed_password.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: Optional[str]) -> bool:
+    """哈希的成本因子与当前配置不一致时需要重新生成"""
+    rounds = hash_rounds(hashed_password)
+    return rounds is not None and rounds != BCRYPT_ROUNDS
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    """在进程池中执行；排队已满或超时抛出 PasswordHashingBusy"""
+    if not _admission.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        executor = _get_executor()
+        if executor is None:
+            return fn(*args)
+        try:
+            return executor.submit(fn, *args).result(timeout=PASSWORD_HASH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            logger.warning("密码哈希任务等待超时（%.1fs）", PASSWORD_HASH_TIMEOUT_SECONDS)
+            raise PasswordHashingBusy()
+        except BrokenProcessPool:
+            # 子进程异常退出：重建进程池，本次在当前线程中完成
+            logger.error("密码哈希进程池已损坏，重新创建")
+            _reset_executor(executor)
+            return fn(*args)
+    finally:
+        _admission.release()
+
+
+def pooled_hash_password(password: str) -> str:
+    """在进程池中生成密码哈希"""
+    return _run(hash_password, password, BCRYPT_ROUNDS)
+
+
+def pooled_check_password(plain_password: str, hashed_password: str) -> bool:
+    """在进程池中校验密码"""
+    return _run(check_password, plain_password, hashed_password)
+
+
+def shutdown_pool() -> None:
+    """关闭进程池（应用退出时调用）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,37 @@
+"""
+重建平台每日统计 daily_stats
+统计由后台任务按 created_at / updated_at 水位增量汇总；删除了业务数据、直接改库或统计漂移后运行本脚本全量重算
+"""
+
+import sys
+
+from database import engine, SessionLocal
+from models import DailyStats, StatsWatermark
+from daily_stats import refresh
+
+
+def rebuild():
+    """忽略水位，从业务表重算全部历史月份"""
+    print("开始重建 daily_stats 每日统计...")
+
+    DailyStats.__table__.create(bind=engine, checkfirst=True)
+    StatsWatermark.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        months = refresh(db, full=True)
+        print(f"✓ 已重算 {months} 个月")
+    finally:
+        db.close()
+
+    print("\n统计重建完成！")
+
+
+if __name__ == "__main__":
+    try:
+        rebuild()
+    except Exception as e:
+        print(f"重建失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,41 @@
+"""
+重建仪表盘计数表 stats_counters，并修复咨询师的 total_consultations
+计数由预约、评分、测评的写入路径增量维护；直接改库、导入数据或计数漂移后运行本脚本修复
+"""
+
+import sys
+
+from database import engine, SessionLocal
+from models import StatsCounter
+from stats_counters import rebuild_counters
+
+
+def rebuild():
+    """从业务表重新计算全部计数"""
+    print("开始重建 stats_counters 计数表...")
+
+    StatsCounter.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        result = rebuild_counters(db)
+        print(f"✓ 用户计数 {result['user']} 行")
+        print(f"✓ 咨询师计数 {result['counselor']} 行")
+        print(f"✓ 修正咨询师累计咨询次数 {result['total_consultations']} 行")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print("\n计数重建完成！")
+
+
+if __name__ == "__main__":
+    try:
+        rebuild()
+    except Exception as e:
+        print(f"重建失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
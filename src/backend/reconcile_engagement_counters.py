@@ -0,0 +1,38 @@
+"""
+重新计算互动计数
+帖子、评论、科普内容的点赞数，帖子的评论数和举报次数由写入路径原子增减；
+直接改库、导入数据或计数漂移后运行本脚本，从 content_likes / comments / post_reports 修复
+"""
+
+import sys
+
+from database import SessionLocal
+from engagement import reconcile_counters
+
+
+def reconcile():
+    """从明细表重新计算全部互动计数"""
+    print("开始校正互动计数...")
+
+    db = SessionLocal()
+    try:
+        result = reconcile_counters(db)
+        for column, count in result.items():
+            print(f"✓ {column} 修正 {count} 行")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print("\n计数校正完成！")
+
+
+if __name__ == "__main__":
+    try:
+        reconcile()
+    except Exception as e:
+        print(f"校正失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,103 @@
+"""
+按量表当前的计分规则重新计算测评报告的分数和等级
+修改量表计分规则（选项分值、反向计分题、等级划分）或导入历史答卷后运行本脚本
+- 按报告 ID 分批读取，每批按量表分组后批量计分（安装 NumPy 时按矩阵计算）
+- 只改写分数或等级有变化的报告；result_json 中没有作答结果的报告（旧数据）跳过
+
+用法：python rescore_test_reports.py [量表ID ...]
+"""
+
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import update
+
+from database import SessionLocal
+from models import TestReport, TestScale
+import scale_scoring
+
+BATCH_SIZE = 5000
+
+
+def rescore(scale_ids=None):
+    """重新计分，scale_ids 为空时处理全部量表"""
+    print("开始重新计算测评报告分数...")
+    started = time.perf_counter()
+
+    db = SessionLocal()
+    try:
+        scale_query = db.query(TestScale)
+        if scale_ids:
+            scale_query = scale_query.filter(TestScale.id.in_(scale_ids))
+        compiled = {}
+        for scale in scale_query.all():
+            definition = scale_scoring.get_compiled(scale)
+            if definition is None:
+                print(f"  - 量表 {scale.id}（{scale.name}）未配置计分规则，跳过")
+            else:
+                compiled[scale.id] = definition
+                print(f"✓ 量表 {scale.id}（{scale.name}）{definition.question_count} 题，版本 {definition.version}")
+        if not compiled:
+            print("没有可计分的量表")
+            return
+
+        last_id = 0
+        scanned = skipped = invalid = updated = 0
+        while True:
+            rows = db.query(
+                TestReport.id, TestReport.scale_id, TestReport.score, TestReport.level, TestReport.result_json
+            ).filter(
+                TestReport.id > last_id,
+                TestReport.scale_id.in_(list(compiled)),
+            ).order_by(TestReport.id.asc()).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            scanned += len(rows)
+
+            groups = defaultdict(list)
+            for row in rows:
+                answers = scale_scoring.answers_from_result(row.result_json)
+                if answers is None:
+                    skipped += 1
+                else:
+                    groups[row.scale_id].append((row, answers))
+
+            changes = []
+            for scale_id, items in groups.items():
+                scores, levels = compiled[scale_id].score_many([answers for _, answers in items])
+                for (row, _), score, level in zip(items, scores, levels):
+                    if score is None:
+                        invalid += 1
+                    elif score != row.score or level != row.level:
+                        changes.append({"id": row.id, "score": score, "level": level})
+
+            if changes:
+                # 按主键批量更新（executemany）
+                db.execute(update(TestReport), changes)
+                db.commit()
+                updated += len(changes)
+            print(f"  已处理 {scanned} 份报告")
+
+        elapsed = time.perf_counter() - started
+        rate = scanned / elapsed if elapsed > 0 else 0
+        print(f"✓ 共处理 {scanned} 份报告，更新 {updated} 份，无作答结果 {skipped} 份，作答与量表不符 {invalid} 份")
+        print(f"✓ 耗时 {elapsed:.2f} 秒（约 {rate:.0f} 份/秒）")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print("\n重新计分完成！")
+
+
+if __name__ == "__main__":
+    try:
+        rescore([int(arg) for arg in sys.argv[1:]])
+    except Exception as e:
+        print(f"重新计分失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
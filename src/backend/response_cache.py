@@ -0,0 +1,248 @@
+"""
+公开只读接口的响应缓存
+- 按「路径 + 查询参数（+ 调用方指定的区分项）」缓存序列化后的 JSON 响应体，省去重复的 ORM 查询和 pydantic 序列化
+- 每条缓存带实体标签（如 content:12、counselor:5），写入路径提交后按标签失效
+- 响应带 ETag 和 Last-Modified，客户端可用 If-None-Match / If-Modified-Since 重新验证，未变化时返回 304
+- 默认使用进程内存后端，可通过 set_backend 替换为其他实现（如 Redis）；
+  多进程部署使用内存后端时，其他进程的缓存最多滞后 RESPONSE_CACHE_TTL_SECONDS 秒
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger("heart_care.response_cache")
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """一条缓存的响应"""
+    body: bytes
+    etag: str
+    last_modified: datetime
+    tags: Tuple[str, ...]
+
+
+class CacheBackend:
+    """缓存后端接口"""
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        raise NotImplementedError
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """进程内 LRU + TTL 缓存，维护标签到缓存键的反向索引"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CacheEntry]]" = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key: str) -> None:
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        for tag in item[1].tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, entry)
+            for tag in entry.tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+
+_backend: CacheBackend = MemoryBackend()
+# 失效次数，构建响应期间发生过失效则不写入缓存，避免把旧数据写回
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def set_backend(backend: CacheBackend) -> None:
+    """替换缓存后端"""
+    global _backend
+    _backend = backend
+
+
+def invalidate_tags(*tags: str) -> None:
+    """按实体标签失效缓存（在写入提交之后调用）"""
+    global _generation
+    tags = tuple(tag for tag in tags if tag)
+    if not tags:
+        return
+    with _generation_lock:
+        _generation += 1
+    try:
+        _backend.invalidate_tags(tags)
+    except Exception as exc:
+        logger.warning("响应缓存失效失败 %s：%s", tags, exc)
+
+
+def clear() -> None:
+    """清空全部响应缓存"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    _backend.clear()
+
+
+def content_tag(content_id) -> str:
+    return f"content:{content_id}"
+
+
+def counselor_tag(counselor_id) -> str:
+    return f"counselor:{counselor_id}"
+
+
+def scale_tag(scale_id) -> str:
+    return f"scale:{scale_id}"
+
+
+def _cache_key(request: Request, vary: Tuple[Any, ...]) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = f"{request.url.path}?{query}"
+    if vary:
+        key += "#" + "|".join(str(part) for part in vary)
+    return key
+
+
+def _not_modified(request: Request, entry: CacheEntry) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or entry.etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return entry.last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def _respond(request: Request, entry: CacheEntry, private: bool) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": format_datetime(entry.last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache" if private else "public, no-cache",
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def _lookup(request: Request, vary: Tuple[Any, ...]) -> Tuple[str, int, Optional[CacheEntry]]:
+    key = _cache_key(request, vary)
+    with _generation_lock:
+        generation = _generation
+    try:
+        entry = _backend.get(key)
+    except Exception as exc:
+        logger.warning("读取响应缓存失败 %s：%s", key, exc)
+        entry = None
+    return key, generation, entry
+
+
+def _store(key: str, generation: int, payload: Any, tags: Iterable[str]) -> CacheEntry:
+    body = JSONResponse(content=jsonable_encoder(payload)).body
+    entry = CacheEntry(
+        body=body,
+        etag='"' + hashlib.sha1(body).hexdigest() + '"',
+        last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+        tags=tuple(dict.fromkeys(tags)),
+    )
+    with _generation_lock:
+        stale = generation != _generation
+    if RESPONSE_CACHE_TTL_SECONDS > 0 and not stale:
+        try:
+            _backend.set(key, entry, RESPONSE_CACHE_TTL_SECONDS)
+        except Exception as exc:
+            logger.warning("写入响应缓存失败 %s：%s", key, exc)
+    return entry
+
+
+def cached_response(
+    request: Request,
+    build: Callable[[], Tuple[Any, Iterable[str]]],
+    vary: Tuple[Any, ...] = (),
+    private: bool = False,
+) -> Response:
+    """
+    返回缓存的响应，未命中时调用 build() 构建
+    build 返回 (响应数据, 标签列表)；vary 为需要区分缓存的额外取值（如当前用户是否已收藏）
+    """
+    key, generation, entry = _lookup(request, vary)
+    if entry is None:
+        payload, tags = build()
+        entry = _store(key, generation, payload, tags)
+    return _respond(request, entry, private)
+
+
+async def cached_response_async(
+    request: Request,
+    build: Callable[[], Awaitable[Tuple[Any, Iterable[str]]]],
+    vary: Tuple[Any, ...] = (),
+    private: bool = False,
+) -> Response:
+    """cached_response 的异步版本（build 为协程函数）"""
+    key, generation, entry = _lookup(request, vary)
+    if entry is None:
+        payload, tags = await build()
+        entry = _store(key, generation, payload, tags)
+    return _respond(request, entry, private)
@@ -2,49 +2,45 @@
 管理员路由 - 后台管理功能
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, func, or_, select
 
 from database import get_db
-from models import User, Counselor, Appointment, TestReport, CommunityPost, CounselorStatus
+from models import User, Counselor, Appointment, CommunityPost, CounselorStatus
 from schemas import Statistics, CounselorResponse
 from auth import (
     get_current_active_user,
     require_role,
-    get_password_hash,
+    get_password_hash_pooled,
     get_default_counselor_password,
+    invalidate_principal,
 )
-from typing import List
+import counselor_tags
+import daily_stats
+import login_identifiers
+import response_cache
+from typing import List, Optional
 
 router = APIRouter()
 
+# 审核队列分页
+MODERATION_PAGE_SIZE = 20
+MAX_MODERATION_PAGE_SIZE = 100
+# 每个帖子返回的最近举报原因条数
+LATEST_REPORT_REASONS = 3
+
 
 @router.get("/statistics", response_model=Statistics)
 def get_platform_statistics(
     current_user: User = Depends(require_role("admin")),
     db: Session = Depends(get_db)
 ):
-    """获取平台统计数据"""
-    total_users = db.query(func.count(User.id)).scalar()
-    total_counselors = db.query(func.count(Counselor.id)).filter(
-        Counselor.status == CounselorStatus.ACTIVE
-    ).scalar()
-    total_appointments = db.query(func.count(Appointment.id)).scalar()
-    total_tests = db.query(func.count(TestReport.id)).scalar()
-    
-    # 本月活跃用户和预约数（简化版）
-    active_users_month = total_users
-    appointments_month = total_appointments
-    
-    return {
-        "total_users": total_users,
-        "total_counselors": total_counselors,
-        "total_appointments": total_appointments,
-        "total_tests": total_tests,
-        "active_users_month": active_users_month,
-        "appointments_month": appointments_month
-    }
+    """
+    获取平台统计数据
+    - 读取 daily_stats 每日汇总（由后台任务定时增量更新），一条查询取回总数、本月数据和最近 90 天逐日数据
+    """
+    return daily_stats.load_statistics(db)
 
 
 @router.get("/counselors/pending")
@@ -80,6 +76,8 @@ def approve_counselor(
         user.role = "counselor"
     
     db.commit()
+    invalidate_principal(counselor.user_id)
+    response_cache.invalidate_tags(response_cache.counselor_tag(counselor_id))
     
     return {"message": "审核通过"}
 
@@ -98,56 +96,122 @@ def reject_counselor(
     
     counselor.status = CounselorStatus.REJECTED
     db.commit()
+    response_cache.invalidate_tags(response_cache.counselor_tag(counselor_id))
     
     return {"message": "申请已拒绝"}
 
 
 @router.get("/posts/pending")
 def get_pending_posts(
+    before_id: Optional[int] = Query(None, description="上一页最后一个帖子的ID，不传则从最新的帖子开始"),
+    limit: int = Query(MODERATION_PAGE_SIZE, ge=1, le=MAX_MODERATION_PAGE_SIZE),
     current_user: User = Depends(require_role("admin")),
     db: Session = Depends(get_db)
 ):
-    """获取待审核的社区帖子（包括被举报的帖子）"""
+    """
+    获取待审核的社区帖子（包括被举报的帖子），按发布时间倒序，游标分页
+    - 使用 (created_at, id) 作为游标，走 ix_community_posts_moderation 索引
+    - 帖子、作者、举报次数和最近的举报原因由一条查询取回：
+      本页帖子与作者连接后，外连接按帖子分组的举报次数，以及每个帖子最近几条举报记录
+      （不用窗口函数，MySQL 5.7 不支持：举报记录按「更新的举报条数 < N」筛选出最近 N 条）
+    - next_cursor 不为空时，作为 before_id 继续获取下一页
+    """
     from models import PostReport
-    from sqlalchemy.orm import joinedload
     
-    # 获取所有待审核的帖子（包括被多人举报的）
-    pending = db.query(CommunityPost).options(
-        joinedload(CommunityPost.author)
-    ).filter(
+    page_query = select(
+        CommunityPost.id, CommunityPost.created_at
+    ).where(
         CommunityPost.is_approved == False,
         CommunityPost.is_deleted == False
-    ).order_by(CommunityPost.created_at.desc()).all()
+    )
+    if before_id is not None:
+        # 游标时间用子查询直接取库中的原值，避免时间精度在往返中变化
+        cursor_created_at = select(CommunityPost.created_at).where(
+            CommunityPost.id == before_id
+        ).scalar_subquery()
+        page_query = page_query.where(or_(
+            CommunityPost.created_at < cursor_created_at,
+            and_(CommunityPost.created_at == cursor_created_at, CommunityPost.id < before_id)
+        ))
+    page = page_query.order_by(
+        CommunityPost.created_at.desc(), CommunityPost.id.desc()
+    ).limit(limit).subquery()
+    
+    report_counts = select(
+        PostReport.post_id.label("post_id"),
+        func.count(PostReport.id).label("report_count"),
+    ).join(page, page.c.id == PostReport.post_id).group_by(PostReport.post_id).subquery()
+    
+    newer = aliased(PostReport)
+    newer_reports = select(func.count(newer.id)).where(
+        newer.post_id == PostReport.post_id,
+        or_(
+            newer.created_at > PostReport.created_at,
+            and_(newer.created_at == PostReport.created_at, newer.id > PostReport.id)
+        )
+    ).correlate(PostReport).scalar_subquery()
+    latest_reports = select(
+        PostReport.post_id.label("post_id"),
+        PostReport.id.label("report_id"),
+        PostReport.reason.label("reason"),
+        PostReport.created_at.label("reported_at"),
+    ).join(page, page.c.id == PostReport.post_id).where(
+        newer_reports < LATEST_REPORT_REASONS
+    ).subquery()
+    
+    rows = db.execute(
+        select(
+            CommunityPost, User.id, User.username, User.nickname,
+            report_counts.c.report_count, latest_reports.c.reason, latest_reports.c.reported_at,
+        ).join(
+            page, page.c.id == CommunityPost.id
+        ).outerjoin(
+            User, User.id == CommunityPost.author_id
+        ).outerjoin(
+            report_counts, report_counts.c.post_id == CommunityPost.id
+        ).outerjoin(
+            latest_reports, latest_reports.c.post_id == CommunityPost.id
+        ).order_by(
+            CommunityPost.created_at.desc(), CommunityPost.id.desc(),
+            latest_reports.c.reported_at.desc(), latest_reports.c.report_id.desc()
+        )
+    ).all()
     
-    # 为每个帖子添加举报信息
+    # 每个帖子对应最多 LATEST_REPORT_REASONS 行（无举报时一行），按帖子合并
     result = []
-    for post in pending:
-        # 统计举报次数
-        report_count = db.query(func.count(PostReport.id)).filter(
-            PostReport.post_id == post.id
-        ).scalar() or 0
-        
-        post_dict = {
-            "id": post.id,
-            "author_id": post.author_id,
-            "author": {
-                "id": post.author.id if post.author else None,
-                "username": post.author.username if post.author else None,
-                "nickname": post.author.nickname if post.author else None,
-            } if post.author else None,
-            "category": post.category,
-            "content": post.content,
-            "tags": post.tags,
-            "like_count": post.like_count or 0,
-            "comment_count": post.comment_count or 0,
-            "report_count": report_count,
-            "is_approved": post.is_approved,
-            "is_deleted": post.is_deleted,
-            "created_at": post.created_at,
-        }
-        result.append(post_dict)
+    by_id = {}
+    for post, author_id, username, nickname, report_count, reason, reported_at in rows:
+        post_dict = by_id.get(post.id)
+        if post_dict is None:
+            post_dict = {
+                "id": post.id,
+                "author_id": post.author_id,
+                "author": {
+                    "id": author_id,
+                    "username": username,
+                    "nickname": nickname,
+                } if author_id is not None else None,
+                "category": post.category,
+                "content": post.content,
+                "tags": post.tags,
+                "like_count": post.like_count or 0,
+                "comment_count": post.comment_count or 0,
+                "report_count": int(report_count or 0),
+                "latest_report_reasons": [],
+                "last_reported_at": reported_at,
+                "is_approved": post.is_approved,
+                "is_deleted": post.is_deleted,
+                "created_at": post.created_at,
+            }
+            by_id[post.id] = post_dict
+            result.append(post_dict)
+        if reason:
+            post_dict["latest_report_reasons"].append(reason)
     
-    return {"pending_posts": result}
+    return {
+        "pending_posts": result,
+        "next_cursor": result[-1]["id"] if len(result) == limit else None
+    }
 
 
 @router.put("/posts/{post_id}/approve")
@@ -200,6 +264,7 @@ def disable_user(
     
     user.is_active = False
     db.commit()
+    invalidate_principal(user_id)
     
     return {"message": "用户已禁用"}
 
@@ -271,13 +336,17 @@ def create_counselor_account(
         
         new_user = User(
             username=username,
-            password_hash=get_password_hash(password),
+            password_hash=get_password_hash_pooled(password),
             role=UserRole.COUNSELOR,
             is_active=True,
             nickname=real_name
         )
         db.add(new_user)
         db.flush()
+        try:
+            login_identifiers.sync_login_identifiers(db, new_user)
+        except login_identifiers.LoginIdentifierConflict as exc:
+            raise HTTPException(status_code=400, detail=exc.detail)
         
         # 创建咨询师记录
         gender_str = counselor_data.get("gender", "female")
@@ -296,6 +365,8 @@ def create_counselor_account(
             status=CounselorStatus.ACTIVE
         )
         db.add(new_counselor)
+        db.flush()
+        counselor_tags.sync_counselor_tags(db, new_counselor)
         db.commit()
         db.refresh(new_counselor)
         
@@ -321,34 +392,36 @@ def get_all_counselors(
     skip: int = 0,
     limit: int = 100
 ):
-    """获取所有咨询师列表（管理员用，包含所有状态）"""
+    """
+    获取所有咨询师列表（管理员用，包含所有状态）
+    - 咨询次数为实际的已完成预约数：本页咨询师的预约按 counselor_id 分组计数后与本页外连接，一条查询取回
+    """
     try:
         from models import Appointment, AppointmentStatus
         
-        counselors = db.query(Counselor).order_by(Counselor.created_at.desc()).offset(skip).limit(limit).all()
+        page = db.query(Counselor.id).order_by(
+            Counselor.created_at.desc()
+        ).offset(skip).limit(limit).subquery()
+        completed = db.query(
+            Appointment.counselor_id.label("counselor_id"),
+            func.count(Appointment.id).label("completed_count")
+        ).join(page, page.c.id == Appointment.counselor_id).filter(
+            Appointment.status == AppointmentStatus.COMPLETED
+        ).group_by(Appointment.counselor_id).subquery()
         
-        # 确保 average_rating 和 review_count 不为 None（在返回前设置默认值）
-        # 同时统计实际的咨询次数（从Appointment表统计已完成的数量）
-        for counselor in counselors:
-            if counselor.average_rating is None:
-                counselor.average_rating = 0.0
-            if counselor.review_count is None:
-                counselor.review_count = 0
-            if counselor.fee is None:
-                counselor.fee = 0.0
-            
-            # 统计实际的咨询次数（已完成状态的预约数量）
-            actual_consultations = db.query(func.count(Appointment.id)).filter(
-                Appointment.counselor_id == counselor.id,
-                Appointment.status == AppointmentStatus.COMPLETED
-            ).scalar() or 0
-            
-            # 更新咨询师的咨询次数
-            counselor.total_consultations = actual_consultations
+        rows = db.query(Counselor, func.coalesce(completed.c.completed_count, 0)).join(
+            page, page.c.id == Counselor.id
+        ).outerjoin(
+            completed, completed.c.counselor_id == Counselor.id
+        ).order_by(Counselor.created_at.desc()).all()
         
-        # 使用 schema 确保返回的数据符合规范
-        from schemas import CounselorResponse
-        return [CounselorResponse.model_validate(counselor) for counselor in counselors]
+        # 使用 schema 确保返回的数据符合规范（None 值由 schema 填充默认值，不修改 ORM 对象）
+        result = []
+        for counselor, completed_count in rows:
+            item = CounselorResponse.model_validate(counselor)
+            item.total_consultations = int(completed_count)
+            result.append(item)
+        return result
     except Exception as e:
         print(f"获取咨询师列表错误: {str(e)}")
         import traceback
@@ -373,11 +446,16 @@ def delete_counselor(
     # 删除关联的用户账户
     user = db.query(User).filter(User.id == counselor.user_id).first()
     if user:
-        # 删除咨询师记录
+        # 删除咨询师记录（先删除引用它的标签行）
+        counselor_tags.clear_counselor_tags(db, counselor.id)
         db.delete(counselor)
-        # 删除用户账户
+        # 删除用户账户（先删除引用它的登录标识）
+        login_identifiers.clear_login_identifiers(db, user.id)
         db.delete(user)
     
     db.commit()
+    response_cache.invalidate_tags(response_cache.counselor_tag(counselor_id))
+    if user:
+        invalidate_principal(counselor.user_id)
     
     return {"message": "咨询师已删除"}
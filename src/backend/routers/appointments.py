@@ -2,7 +2,9 @@
 预约路由 - 咨询预约管理
 """
 
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional, Union
 
@@ -10,9 +12,60 @@ from database import get_db
 from models import Appointment, User, Counselor, AppointmentStatus, ConsultationRecord
 from schemas import AppointmentCreate, AppointmentResponse, AppointmentUpdate, ConsultationRecordResponse
 from auth import get_current_active_user, require_role
+from availability import invalidate_appointment_availability
+import response_cache
+import stats_counters
 
 router = APIRouter()
 
+# 单次预约的最长时长（创建预约时校验为1-3小时）
+MAX_APPOINTMENT_DURATION = timedelta(hours=3)
+# 未记录结束时间的预约默认时长
+DEFAULT_APPOINTMENT_DURATION = timedelta(hours=1)
+TZ_BEIJING = timezone(timedelta(hours=8))
+
+
+def _to_beijing_naive(value: datetime) -> datetime:
+    """将带时区的时间转换为北京时间并去掉时区信息"""
+    if value.tzinfo is not None:
+        return value.astimezone(TZ_BEIJING).replace(tzinfo=None)
+    return value
+
+
+def _find_overlapping_appointment(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    counselor_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> Optional[Appointment]:
+    """
+    查找与 [start, end) 时间范围重叠的有效预约（待确认/已确认）
+    - 预约时长不超过 MAX_APPOINTMENT_DURATION，因此只有开始时间落在
+      (start - MAX_APPOINTMENT_DURATION, end) 内的预约才可能重叠
+    - 借助 (counselor_id/user_id, appointment_date) 复合索引做有界区间查询，
+      与历史预约数量无关
+    - 结束时间直接比较 end_time 列；未记录结束时间的预约按默认时长计算
+    """
+    query = db.query(Appointment).filter(
+        Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]),
+        Appointment.appointment_date > start - MAX_APPOINTMENT_DURATION,
+        Appointment.appointment_date < end,
+        or_(
+            Appointment.end_time > start,
+            and_(
+                Appointment.end_time.is_(None),
+                Appointment.appointment_date > start - DEFAULT_APPOINTMENT_DURATION
+            )
+        )
+    )
+    if counselor_id is not None:
+        query = query.filter(Appointment.counselor_id == counselor_id)
+    if user_id is not None:
+        query = query.filter(Appointment.user_id == user_id)
+    
+    return query.order_by(Appointment.appointment_date.asc()).first()
+
 
 @router.post("/create", response_model=AppointmentResponse)
 def create_appointment(
@@ -95,67 +148,16 @@ def create_appointment(
     # 如果提供了结束时间，检查整个时间范围是否冲突
     if end_datetime:
         # 检查咨询师在该时间范围内是否有其他预约
-        existing_conflicts = db.query(Appointment).filter(
-            Appointment.counselor_id == appointment_data.counselor_id,
-            Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]),
-            # 检查时间范围是否重叠
-            Appointment.appointment_date < end_datetime
-        ).all()
-        
-        # 检查每个已有预约是否与当前预约时间范围重叠
-        for existing in existing_conflicts:
-            # 获取已有预约的结束时间（如果没有end_time，默认为开始时间+1小时）
-            existing_start = existing.appointment_date
-            if existing_start.tzinfo is not None:
-                from datetime import timezone, timedelta
-                tz_beijing = timezone(timedelta(hours=8))
-                existing_start = existing_start.astimezone(tz_beijing).replace(tzinfo=None)
-            
-            # 从description中提取结束时间（如果存在）
-            existing_end = existing_start + timedelta(hours=1)  # 默认1小时
-            if existing.description and '|END_TIME:' in existing.description:
-                try:
-                    end_time_str = existing.description.split('|END_TIME:')[1].split('|')[0]
-                    existing_end = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
-                    if existing_end.tzinfo is not None:
-                        from datetime import timezone, timedelta
-                        tz_beijing = timezone(timedelta(hours=8))
-                        existing_end = existing_end.astimezone(tz_beijing).replace(tzinfo=None)
-                except:
-                    pass
-            
-            # 检查时间范围是否重叠
-            if not (end_datetime <= existing_start or appointment_datetime >= existing_end):
-                raise HTTPException(status_code=400, detail="该时间范围与已有预约冲突，请选择其他时段")
+        if _find_overlapping_appointment(
+            db, appointment_datetime, end_datetime, counselor_id=appointment_data.counselor_id
+        ):
+            raise HTTPException(status_code=400, detail="该时间范围与已有预约冲突，请选择其他时段")
         
         # 检查用户在该时间范围内是否有其他预约
-        user_conflicts = db.query(Appointment).filter(
-            Appointment.user_id == current_user.id,
-            Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]),
-            Appointment.appointment_date < end_datetime
-        ).all()
-        
-        for existing in user_conflicts:
-            existing_start = existing.appointment_date
-            if existing_start.tzinfo is not None:
-                from datetime import timezone, timedelta
-                tz_beijing = timezone(timedelta(hours=8))
-                existing_start = existing_start.astimezone(tz_beijing).replace(tzinfo=None)
-            
-            existing_end = existing_start + timedelta(hours=1)
-            if existing.description and '|END_TIME:' in existing.description:
-                try:
-                    end_time_str = existing.description.split('|END_TIME:')[1].split('|')[0]
-                    existing_end = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
-                    if existing_end.tzinfo is not None:
-                        from datetime import timezone, timedelta
-                        tz_beijing = timezone(timedelta(hours=8))
-                        existing_end = existing_end.astimezone(tz_beijing).replace(tzinfo=None)
-                except:
-                    pass
-            
-            if not (end_datetime <= existing_start or appointment_datetime >= existing_end):
-                raise HTTPException(status_code=400, detail="该时间范围您已有其他预约，请选择其他时段")
+        if _find_overlapping_appointment(
+            db, appointment_datetime, end_datetime, user_id=current_user.id
+        ):
+            raise HTTPException(status_code=400, detail="该时间范围您已有其他预约，请选择其他时段")
     else:
         # 没有提供结束时间，使用原来的逻辑（1小时）
         # 校验重复预约（同一用户不能预约同一咨询师的同一时段）
@@ -344,27 +346,22 @@ def create_appointment(
     # 2. 关联学生与该预约记录
     # 3. 记录预约初始状态（如"待确认"）
     
-    # 如果提供了结束时间，将其存储在description中（格式：{原始description}|END_TIME:{end_time}）
-    description_with_end_time = appointment_data.description or ''
-    if end_datetime:
-        if description_with_end_time:
-            description_with_end_time = f"{description_with_end_time}|END_TIME:{end_datetime.isoformat()}"
-        else:
-            description_with_end_time = f"|END_TIME:{end_datetime.isoformat()}"
-    
     new_appointment = Appointment(
         user_id=current_user.id,
         counselor_id=appointment_data.counselor_id,
         consult_type=appointment_data.consult_type,
         consult_method=appointment_data.consult_method,
         appointment_date=appointment_datetime,
-        description=description_with_end_time,
+        end_time=end_datetime,
+        description=appointment_data.description or '',
         status=AppointmentStatus.PENDING  # 初始状态：待确认
     )
     
     db.add(new_appointment)
+    stats_counters.record_appointment_change(db, new_appointment)
     db.commit()
     db.refresh(new_appointment)
+    invalidate_appointment_availability(new_appointment)
     
     # 重新加载关联对象
     from sqlalchemy.orm import joinedload
@@ -381,6 +378,7 @@ def create_appointment(
         "consult_type": appointment.consult_type,
         "consult_method": appointment.consult_method,
         "appointment_date": appointment.appointment_date,
+        "end_time": appointment.end_time,
         "status": appointment.status,
         "description": appointment.description,
         "summary": appointment.summary,
@@ -453,6 +451,7 @@ def get_my_appointments(
             "consult_type": appointment.consult_type,
             "consult_method": appointment.consult_method,
             "appointment_date": appointment.appointment_date,
+            "end_time": appointment.end_time,
             "status": appointment.status,
             "description": appointment.description,
             "summary": appointment.summary,
@@ -580,6 +579,7 @@ def get_consultation_records(
             "consult_type": record.consult_type,
             "consult_method": record.consult_method,
             "appointment_date": record.appointment_date,
+            "end_time": record.end_time,
             "description": record.description,
             "summary": record.summary,
             "rating": record.rating,
@@ -629,6 +629,7 @@ def get_all_consultation_records(
             "consult_type": record.consult_type,
             "consult_method": record.consult_method,
             "appointment_date": record.appointment_date,
+            "end_time": record.end_time,
             "description": record.description,
             "summary": record.summary,
             "rating": record.rating,
@@ -682,6 +683,7 @@ def get_appointment_detail(
         "consult_type": appointment.consult_type,
         "consult_method": appointment.consult_method,
         "appointment_date": appointment.appointment_date,
+        "end_time": appointment.end_time,
         "status": appointment.status,
         "description": appointment.description,
         "summary": appointment.summary,
@@ -737,6 +739,7 @@ def update_appointment(
         raise HTTPException(status_code=403, detail="无权修改此预约")
     
     old_status = appointment.status
+    old_state = stats_counters.appointment_state(appointment)
     
     # 更新状态（带权限检查）
     if appointment_data.status:
@@ -777,7 +780,10 @@ def update_appointment(
     if appointment_datetime_naive:
         if appointment_datetime_naive.tzinfo is not None:
             appointment_datetime_naive = appointment_datetime_naive.astimezone(tz_beijing).replace(tzinfo=None)
-        consultation_end_time = appointment_datetime_naive + timedelta(hours=1)
+        if appointment.end_time is not None:
+            consultation_end_time = _to_beijing_naive(appointment.end_time)
+        else:
+            consultation_end_time = appointment_datetime_naive + DEFAULT_APPOINTMENT_DURATION
     
     user_confirmed_now = False
     counselor_confirmed_now = False
@@ -820,12 +826,12 @@ def update_appointment(
             
             if not existing_record:
                 # 创建咨询记录
-                # 确定确认时间：如果刚刚确认，使用当前时间；否则使用预约时间+1小时
+                # 确定确认时间：如果刚刚确认，使用当前时间；否则使用预约结束时间
                 user_confirmed_time = now_tz if user_confirmed_now else (
-                    appointment.appointment_date + timedelta(hours=1) if appointment.appointment_date else now_tz
+                    consultation_end_time or now_tz
                 )
                 counselor_confirmed_time = now_tz if counselor_confirmed_now else (
-                    appointment.appointment_date + timedelta(hours=1) if appointment.appointment_date else now_tz
+                    consultation_end_time or now_tz
                 )
                 
                 consultation_record = ConsultationRecord(
@@ -835,6 +841,7 @@ def update_appointment(
                     consult_type=appointment.consult_type,
                     consult_method=appointment.consult_method,
                     appointment_date=appointment.appointment_date,
+                    end_time=appointment.end_time,
                     description=appointment.description,
                     summary=appointment.summary,
                     rating=appointment.rating,
@@ -843,11 +850,7 @@ def update_appointment(
                     counselor_confirmed_at=counselor_confirmed_time
                 )
                 db.add(consultation_record)
-                
-                # 更新咨询师的咨询次数统计
-                counselor = db.query(Counselor).filter(Counselor.id == appointment.counselor_id).first()
-                if counselor:
-                    counselor.total_consultations = (counselor.total_consultations or 0) + 1
+                # 咨询师的咨询次数统计由 record_appointment_change 随状态变化更新
     
     # 用户评分和评价
     if appointment_data.rating is not None:
@@ -867,8 +870,12 @@ def update_appointment(
         ).first()
         
         if existing_rating:
-            # 更新现有评分
+            # 更新现有评分（先改评分再调整计数：计数行不存在时会从已刷新的评分记录现算，不能再叠加差值）
+            old_rating = existing_rating.rating
             existing_rating.rating = appointment_data.rating
+            stats_counters.record_rating_change(
+                db, existing_rating.counselor_id, old_rating, appointment_data.rating
+            )
             if appointment_data.review is not None:
                 existing_rating.review = appointment_data.review
         else:
@@ -888,6 +895,7 @@ def update_appointment(
                 review=appointment_data.review if appointment_data.review else None
             )
             db.add(new_rating)
+            stats_counters.record_rating_change(db, counselor_id, None, appointment_data.rating)
         
         # 更新咨询师的平均评分和评价数
         counselor = db.query(Counselor).filter(Counselor.id == appointment.counselor_id).first()
@@ -909,13 +917,20 @@ def update_appointment(
             raise HTTPException(status_code=403, detail="只有用户（学生）可以评价")
         appointment.review = appointment_data.review
     
+    stats_counters.record_appointment_change(db, appointment, old_state)
     db.commit()
     
+    # 评分或完成状态变化后咨询师详情中的评分、评价数和咨询次数随之变化
+    if appointment_data.rating is not None or (appointment.status == AppointmentStatus.COMPLETED) != (old_status == AppointmentStatus.COMPLETED):
+        response_cache.invalidate_tags(response_cache.counselor_tag(appointment.counselor_id))
+    
     # ============ 状态流转同步 ============
     # 状态变更时，同步更新相关数据，确保各页面显示的状态一致
-    # 注意：取消预约后，时段会自动释放（因为查询可用时段时会排除CANCELLED状态的预约）
+    # 注意：取消/拒绝预约后，时段索引失效，重新查询可用时段时会释放该时段
     
     db.refresh(appointment)
+    if appointment.status != old_status:
+        invalidate_appointment_availability(appointment)
     
     # 重新加载关联对象
     appointment = db.query(Appointment).options(
@@ -931,6 +946,7 @@ def update_appointment(
         "consult_type": appointment.consult_type,
         "consult_method": appointment.consult_method,
         "appointment_date": appointment.appointment_date,
+        "end_time": appointment.end_time,
         "status": appointment.status,
         "description": appointment.description,
         "summary": appointment.summary,
@@ -977,9 +993,12 @@ def cancel_appointment(
         raise HTTPException(status_code=400, detail="该预约状态不允许取消")
     
     # 更新状态为已取消
+    old_state = stats_counters.appointment_state(appointment)
     appointment.status = AppointmentStatus.CANCELLED
+    stats_counters.record_appointment_change(db, appointment, old_state)
     
     db.commit()
+    invalidate_appointment_availability(appointment)
     
     # ============ 状态流转同步 ============
     # 取消预约后，时段会自动释放
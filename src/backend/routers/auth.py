@@ -3,18 +3,32 @@
 """
 
 import logging
+import os
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Gender, User, UserRole
 from schemas import UserCreate, UserLogin, Token, UserResponse
-from auth import verify_password, get_password_hash, create_access_token, get_current_user
+from auth import (
+    verify_password_pooled,
+    get_password_hash_pooled,
+    create_access_token,
+    get_current_user,
+    invalidate_principal,
+)
+import login_identifiers
+import password_hashing
 
 logger = logging.getLogger("heart_care.auth")
 
 router = APIRouter()
 
+# 登录标识未命中时是否回退到原有的 users 多字段 OR 查询，默认关闭：
+# 回退会让每次不存在账号的登录（输错账号、撞库）都扫描 users 表。
+# 运行 migrate_add_login_identifiers.py 回填之前，或存在未写入登录标识的账号时，设置 LOGIN_IDENTIFIER_FALLBACK=true
+LOGIN_IDENTIFIER_FALLBACK = os.getenv("LOGIN_IDENTIFIER_FALLBACK", "false").lower() == "true"
+
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 def register(user_data: UserCreate, db: Session = Depends(get_db)):
@@ -37,7 +51,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="邮箱已被注册")
         
         # 创建新用户
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = get_password_hash_pooled(user_data.password)
         new_user = User(
             username=user_data.username,
             phone=user_data.phone,
@@ -49,6 +63,12 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
         
         db.add(new_user)
+        db.flush()
+        try:
+            login_identifiers.sync_login_identifiers(db, new_user)
+        except login_identifiers.LoginIdentifierConflict as exc:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=exc.detail)
         db.commit()
         db.refresh(new_user)
         
@@ -87,14 +107,27 @@ def login(login_data: UserLogin, db: Session = Depends(get_db)):
 
     logger.info("Login attempt for account='%s'", account)
 
-    # 查找用户（支持多种登录方式）
-    user = db.query(User).filter(
-        (User.username == account) |
-        (User.nickname == account) |
-        (User.phone == account) |
-        (User.email == account) |
-        (User.student_id == account)
-    ).first()
+    # 查找用户（支持用户名/昵称/手机号/邮箱/学号，按登录标识表唯一索引点查）
+    user = None
+    user_id = login_identifiers.find_user_id(db, account)
+    if user_id is not None:
+        user = db.get(User, user_id)
+    elif LOGIN_IDENTIFIER_FALLBACK:
+        user = db.query(User).filter(
+            (User.username == account) |
+            (User.nickname == account) |
+            (User.phone == account) |
+            (User.email == account) |
+            (User.student_id == account)
+        ).first()
+        if user:
+            # 补写登录标识，之后的登录走点查
+            try:
+                login_identifiers.sync_login_identifiers(db, user, strict=False)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.warning("Failed to backfill login identifiers for user_id=%s", user.id)
 
     if not user:
         logger.warning("Login failed: account='%s' not found", account)
@@ -110,9 +143,9 @@ def login(login_data: UserLogin, db: Session = Depends(get_db)):
             detail="账户密码信息异常，请联系管理员"
         )
 
-    # 验证密码
+    # 验证密码（在密码哈希进程池中计算，排队已满时返回 503）
     try:
-        password_valid = verify_password(login_data.password, user.password_hash)
+        password_valid = verify_password_pooled(login_data.password, user.password_hash)
     except ValueError as exc:
         logger.exception(
             "Login failed: invalid password hash for user_id=%s", user.id
@@ -138,11 +171,25 @@ def login(login_data: UserLogin, db: Session = Depends(get_db)):
         user.gender = Gender.OTHER
         try:
             db.commit()
+            invalidate_principal(user.id)
             db.refresh(user)
         except Exception:
             db.rollback()
             logger.warning("Failed to persist default gender for user_id=%s", user.id)
 
+    # 哈希成本因子与当前配置不一致时，用本次登录的明文密码重新生成（失败不影响登录）
+    if password_hashing.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = password_hashing.pooled_hash_password(login_data.password)
+            db.commit()
+            db.refresh(user)
+            logger.info("Rehashed password for user_id=%s", user.id)
+        except password_hashing.PasswordHashingBusy:
+            logger.info("Skipped password rehash for user_id=%s: hashing pool busy", user.id)
+        except Exception:
+            db.rollback()
+            logger.warning("Failed to rehash password for user_id=%s", user.id)
+
     # 生成 Token
     access_token = create_access_token(data={"sub": user.id})
 
@@ -3,16 +3,126 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from database import get_db
+from database import get_async_db, get_db
 from models import CommunityPost, Comment, User, ContentLike, PostReport
 from schemas import PostCreate, PostResponse, CommentCreate, CommentResponse
-from auth import get_current_active_user, get_optional_user
+from auth import get_current_active_user, get_optional_user, get_optional_user_async
+import engagement
 
 router = APIRouter()
 
+# 评论分页：默认每页条数和上限
+COMMENT_PAGE_SIZE = 50
+MAX_COMMENT_PAGE_SIZE = 100
+
+
+def _hydrate_posts(
+    db: Session,
+    posts: List[CommunityPost],
+    current_user: Optional[User] = None
+) -> List[PostResponse]:
+    """
+    批量组装帖子响应
+    - 一次 IN 查询加载本页所有作者（当前用户直接复用）
+    - 一次查询加载当前用户对本页帖子的点赞
+    查询次数与帖子数量无关
+    """
+    if not posts:
+        return []
+    
+    authors = {}
+    if current_user is not None:
+        authors[current_user.id] = current_user
+    author_ids = {post.author_id for post in posts if post.author_id is not None} - set(authors)
+    if author_ids:
+        for author in db.query(User).filter(User.id.in_(author_ids)).all():
+            authors[author.id] = author
+    
+    liked_post_ids = set()
+    if current_user is not None:
+        liked_post_ids = {
+            row[0] for row in db.query(ContentLike.content_id).filter(
+                ContentLike.user_id == current_user.id,
+                ContentLike.content_type == "post",
+                ContentLike.content_id.in_([post.id for post in posts])
+            ).all()
+        }
+    
+    result = []
+    for post in posts:
+        author = authors.get(post.author_id)
+        post_dict = {
+            "id": post.id,
+            "author_id": post.author_id,
+            "author_name": author.nickname if author and author.nickname else f"用户{post.author_id % 10000}",
+            "author_nickname": author.nickname if author else None,
+            "author_role": author.role.value if author else None,
+            "category": post.category,
+            "content": post.content,
+            "tags": post.tags,
+            "like_count": post.like_count,
+            "comment_count": post.comment_count,
+            "is_liked": post.id in liked_post_ids,
+            "created_at": post.created_at,
+        }
+        result.append(PostResponse(**post_dict))
+    return result
+
+
+def _hydrate_comments(
+    db: Session,
+    comments: List[Comment],
+    current_user: Optional[User] = None
+) -> List[CommentResponse]:
+    """
+    批量组装评论响应
+    - 一次 IN 查询加载本页所有评论者（当前用户直接复用）
+    - 一次查询加载当前用户对本页评论的点赞
+    """
+    if not comments:
+        return []
+    
+    users = {}
+    if current_user is not None:
+        users[current_user.id] = current_user
+    user_ids = {comment.user_id for comment in comments if comment.user_id is not None} - set(users)
+    if user_ids:
+        for user in db.query(User).filter(User.id.in_(user_ids)).all():
+            users[user.id] = user
+    
+    liked_comment_ids = set()
+    if current_user is not None:
+        liked_comment_ids = {
+            row[0] for row in db.query(ContentLike.content_id).filter(
+                ContentLike.user_id == current_user.id,
+                ContentLike.content_type == "comment",
+                ContentLike.content_id.in_([comment.id for comment in comments])
+            ).all()
+        }
+    
+    result = []
+    for comment in comments:
+        user = users.get(comment.user_id)
+        comment_dict = {
+            "id": comment.id,
+            "post_id": comment.post_id,
+            "user_id": comment.user_id,
+            "user_name": user.nickname if user and user.nickname else f"用户{comment.user_id % 10000}",
+            "user_nickname": user.nickname if user else None,
+            "content": comment.content,
+            "like_count": comment.like_count,
+            "is_liked": comment.id in liked_comment_ids,
+            "created_at": comment.created_at,
+        }
+        result.append(CommentResponse(**comment_dict))
+    return result
+
 
 @router.post("/posts", response_model=PostResponse)
 def create_post(
@@ -33,86 +143,33 @@ def create_post(
     db.commit()
     db.refresh(new_post)
     
-    # 获取作者信息
-    author = db.query(User).filter(User.id == new_post.author_id).first()
-    author_name = author.nickname if author and author.nickname else f"用户{new_post.author_id % 10000}"
-    author_nickname = author.nickname if author else None
-    author_role = author.role.value if author else None
-    
-    post_dict = {
-        "id": new_post.id,
-        "author_id": new_post.author_id,
-        "author_name": author_name,
-        "author_nickname": author_nickname,
-        "author_role": author_role,
-        "category": new_post.category,
-        "content": new_post.content,
-        "tags": new_post.tags,
-        "like_count": new_post.like_count,
-        "comment_count": new_post.comment_count,
-        "is_liked": False,
-        "created_at": new_post.created_at,
-    }
-    
-    return PostResponse(**post_dict)
+    return _hydrate_posts(db, [new_post], current_user)[0]
 
 
 @router.get("/posts", response_model=List[PostResponse])
-def get_posts(
+async def get_posts(
     category: Optional[str] = None,
     skip: int = 0,
     limit: int = 20,
-    current_user: Optional[User] = Depends(get_optional_user),
-    db: Session = Depends(get_db)
+    current_user: Optional[User] = Depends(get_optional_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取社区帖子列表（所有用户可见，排除被多人举报的帖子）"""
-    query = db.query(CommunityPost).filter(
+    query = select(CommunityPost).where(
         CommunityPost.is_approved == True,
         CommunityPost.is_deleted == False,
         CommunityPost.report_count < 3  # 举报次数少于3次的帖子才显示
     )
     
     if category:
-        query = query.filter(CommunityPost.category == category)
+        query = query.where(CommunityPost.category == category)
     
-    posts = query.order_by(CommunityPost.created_at.desc()).offset(skip).limit(limit).all()
+    posts = (await db.execute(
+        query.order_by(CommunityPost.created_at.desc()).offset(skip).limit(limit)
+    )).scalars().all()
     
     # 构建响应，包含作者信息和点赞状态
-    result = []
-    for post in posts:
-        # 获取作者信息
-        author = db.query(User).filter(User.id == post.author_id).first()
-        author_name = author.nickname if author and author.nickname else f"用户{post.author_id % 10000}"
-        author_nickname = author.nickname if author else None
-        author_role = author.role.value if author else None
-        
-        # 检查当前用户是否已点赞
-        is_liked = False
-        if current_user:
-            like = db.query(ContentLike).filter(
-                ContentLike.user_id == current_user.id,
-                ContentLike.content_type == "post",
-                ContentLike.content_id == post.id
-            ).first()
-            is_liked = like is not None
-        
-        post_dict = {
-            "id": post.id,
-            "author_id": post.author_id,
-            "author_name": author_name,
-            "author_nickname": author_nickname,
-            "author_role": author_role,
-            "category": post.category,
-            "content": post.content,
-            "tags": post.tags,
-            "like_count": post.like_count,
-            "comment_count": post.comment_count,
-            "is_liked": is_liked,
-            "created_at": post.created_at,
-        }
-        result.append(PostResponse(**post_dict))
-    
-    return result
+    return await db.run_sync(_hydrate_posts, posts, current_user)
 
 
 @router.get("/posts/{post_id}", response_model=PostResponse)
@@ -127,38 +184,7 @@ def get_post_detail(
     if not post or post.is_deleted:
         raise HTTPException(status_code=404, detail="帖子不存在")
     
-    # 获取作者信息
-    author = db.query(User).filter(User.id == post.author_id).first()
-    author_name = author.nickname if author and author.nickname else f"用户{post.author_id % 10000}"
-    author_nickname = author.nickname if author else None
-    author_role = author.role.value if author else None
-    
-    # 检查当前用户是否已点赞
-    is_liked = False
-    if current_user:
-        like = db.query(ContentLike).filter(
-            ContentLike.user_id == current_user.id,
-            ContentLike.content_type == "post",
-            ContentLike.content_id == post.id
-        ).first()
-        is_liked = like is not None
-    
-    post_dict = {
-        "id": post.id,
-        "author_id": post.author_id,
-        "author_name": author_name,
-        "author_nickname": author_nickname,
-        "author_role": author_role,
-        "category": post.category,
-        "content": post.content,
-        "tags": post.tags,
-        "like_count": post.like_count,
-        "comment_count": post.comment_count,
-        "is_liked": is_liked,
-        "created_at": post.created_at,
-    }
-    
-    return PostResponse(**post_dict)
+    return _hydrate_posts(db, [post], current_user)[0]
 
 
 @router.post("/posts/{post_id}/like")
@@ -167,36 +193,18 @@ def like_post(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """点赞/取消点赞帖子（防止重复点赞）"""
-    post = db.query(CommunityPost).filter(CommunityPost.id == post_id).first()
+    """点赞/取消点赞帖子（点赞记录唯一，计数在数据库中原子增减）"""
+    post_exists = db.query(CommunityPost.id).filter(CommunityPost.id == post_id).first()
     
-    if not post:
+    if not post_exists:
         raise HTTPException(status_code=404, detail="帖子不存在")
     
-    # 检查是否已点赞
-    existing_like = db.query(ContentLike).filter(
-        ContentLike.user_id == current_user.id,
-        ContentLike.content_type == "post",
-        ContentLike.content_id == post_id
-    ).first()
+    is_liked, like_count = engagement.toggle_like(db, current_user.id, "post", post_id)
+    db.commit()
     
-    if existing_like:
-        # 取消点赞
-        db.delete(existing_like)
-        post.like_count = max(0, post.like_count - 1)
-        db.commit()
-        return {"message": "已取消点赞", "like_count": post.like_count, "is_liked": False}
-    else:
-        # 点赞
-        new_like = ContentLike(
-            user_id=current_user.id,
-            content_type="post",
-            content_id=post_id
-        )
-        db.add(new_like)
-        post.like_count += 1
-        db.commit()
-        return {"message": "点赞成功", "like_count": post.like_count, "is_liked": True}
+    if is_liked:
+        return {"message": "点赞成功", "like_count": like_count, "is_liked": True}
+    return {"message": "已取消点赞", "like_count": like_count, "is_liked": False}
 
 
 @router.post("/comments", response_model=CommentResponse)
@@ -207,8 +215,8 @@ def create_comment(
 ):
     """发布评论"""
     # 检查帖子是否存在
-    post = db.query(CommunityPost).filter(CommunityPost.id == comment_data.post_id).first()
-    if not post:
+    post_exists = db.query(CommunityPost.id).filter(CommunityPost.id == comment_data.post_id).first()
+    if not post_exists:
         raise HTTPException(status_code=404, detail="帖子不存在")
     
     new_comment = Comment(
@@ -220,76 +228,48 @@ def create_comment(
     
     db.add(new_comment)
     
-    # 更新帖子评论数
-    post.comment_count += 1
+    # 更新帖子评论数（数据库中原子递增）
+    engagement.record_comment(db, comment_data.post_id)
     
     db.commit()
     db.refresh(new_comment)
     
-    # 获取用户信息
-    user = db.query(User).filter(User.id == new_comment.user_id).first()
-    user_name = user.nickname if user and user.nickname else f"用户{new_comment.user_id % 10000}"
-    user_nickname = user.nickname if user else None
-    
-    comment_dict = {
-        "id": new_comment.id,
-        "post_id": new_comment.post_id,
-        "user_id": new_comment.user_id,
-        "user_name": user_name,
-        "user_nickname": user_nickname,
-        "content": new_comment.content,
-        "like_count": new_comment.like_count,
-        "is_liked": False,
-        "created_at": new_comment.created_at,
-    }
-    
-    return CommentResponse(**comment_dict)
+    return _hydrate_comments(db, [new_comment], current_user)[0]
 
 
 @router.get("/posts/{post_id}/comments", response_model=List[CommentResponse])
 def get_post_comments(
     post_id: int,
+    after_id: Optional[int] = Query(None, description="上一页最后一条评论的ID，不传则从第一条开始"),
+    limit: int = Query(COMMENT_PAGE_SIZE, ge=1, le=MAX_COMMENT_PAGE_SIZE),
     current_user: Optional[User] = Depends(get_optional_user),
     db: Session = Depends(get_db)
 ):
-    """获取帖子的评论列表"""
-    comments = db.query(Comment).filter(
+    """
+    获取帖子的评论列表（按发布时间正序，游标分页）
+    - 使用 (created_at, id) 作为游标，返回 after_id 之后的 limit 条评论
+    - 返回条数等于 limit 时，以最后一条评论的 id 作为 after_id 继续获取下一页
+    """
+    query = db.query(Comment).filter(
         Comment.post_id == post_id,
         Comment.is_approved == True
-    ).order_by(Comment.created_at.asc()).all()
+    )
     
-    # 构建响应，包含用户信息和点赞状态
-    result = []
-    for comment in comments:
-        # 获取用户信息
-        user = db.query(User).filter(User.id == comment.user_id).first()
-        user_name = user.nickname if user and user.nickname else f"用户{comment.user_id % 10000}"
-        user_nickname = user.nickname if user else None
-        
-        # 检查当前用户是否已点赞
-        is_liked = False
-        if current_user:
-            like = db.query(ContentLike).filter(
-                ContentLike.user_id == current_user.id,
-                ContentLike.content_type == "comment",
-                ContentLike.content_id == comment.id
-            ).first()
-            is_liked = like is not None
-        
-        comment_dict = {
-            "id": comment.id,
-            "post_id": comment.post_id,
-            "user_id": comment.user_id,
-            "user_name": user_name,
-            "user_nickname": user_nickname,
-            "content": comment.content,
-            "like_count": comment.like_count,
-            "is_liked": is_liked,
-            "created_at": comment.created_at,
-        }
-        result.append(CommentResponse(**comment_dict))
+    if after_id is not None:
+        # 游标时间用子查询直接取库中的原值，避免时间精度在往返中变化；游标不存在时返回空列表
+        cursor_created_at = db.query(Comment.created_at).filter(
+            Comment.id == after_id,
+            Comment.post_id == post_id
+        ).scalar_subquery()
+        query = query.filter(or_(
+            Comment.created_at > cursor_created_at,
+            and_(Comment.created_at == cursor_created_at, Comment.id > after_id)
+        ))
     
-    return result
+    comments = query.order_by(Comment.created_at.asc(), Comment.id.asc()).limit(limit).all()
+    
+    # 构建响应，包含用户信息和点赞状态
+    return _hydrate_comments(db, comments, current_user)
 
 
 @router.post("/posts/{post_id}/report")
@@ -301,38 +281,30 @@ def report_post(
 ):
     """举报帖子"""
     # 检查帖子是否存在
-    post = db.query(CommunityPost).filter(CommunityPost.id == post_id).first()
-    if not post:
+    post_exists = db.query(CommunityPost.id).filter(CommunityPost.id == post_id).first()
+    if not post_exists:
         raise HTTPException(status_code=404, detail="帖子不存在")
     
-    # 检查是否已经举报过
-    existing_report = db.query(PostReport).filter(
-        PostReport.post_id == post_id,
-        PostReport.user_id == current_user.id
-    ).first()
-    
-    if existing_report:
-        raise HTTPException(status_code=400, detail="您已经举报过该帖子")
-    
-    # 创建举报记录
+    # 创建举报记录（唯一约束保证同一用户只能举报一次）
     new_report = PostReport(
         post_id=post_id,
         user_id=current_user.id,
         reason=reason
     )
     db.add(new_report)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="您已经举报过该帖子")
     
-    # 更新帖子举报次数
-    post.report_count += 1
-    
-    # 如果举报次数达到3次，自动设置为未审核状态
-    if post.report_count >= 3:
-        post.is_approved = False
+    # 更新帖子举报次数，达到3次时在同一条语句中设置为未审核状态
+    report_count, is_approved = engagement.record_report(db, post_id)
     
     db.commit()
     
     return {
         "message": "举报成功",
-        "report_count": post.report_count,
-        "is_approved": post.is_approved
+        "report_count": report_count,
+        "is_approved": is_approved
     }
@@ -2,57 +2,81 @@
 健康科普内容路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from database import get_db
+from database import get_async_db, get_db
 from models import Content
 from schemas import ContentCreate, ContentResponse
 from auth import get_current_active_user
+import engagement
+import response_cache
+import view_counter
 
 router = APIRouter()
 
+# 内容列表缓存的公共标签（新增内容时失效）
+CONTENT_LIST_TAG = "content:list"
+
 
 @router.get("/list", response_model=List[ContentResponse])
-def get_content_list(
+async def get_content_list(
+    request: Request,
     content_type: Optional[str] = None,
     category: Optional[str] = None,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取科普内容列表
     - 支持按类型、分类筛选
     - 分页查询
+    - 响应按查询参数缓存，列表中任一内容变更时失效
     """
-    query = db.query(Content).filter(Content.is_published == True)
-    
-    if content_type:
-        query = query.filter(Content.content_type == content_type)
-    
-    if category:
-        query = query.filter(Content.category == category)
-    
-    contents = query.order_by(Content.created_at.desc()).offset(skip).limit(limit).all()
+    async def build():
+        query = select(Content).where(Content.is_published == True)
+        
+        if content_type:
+            query = query.where(Content.content_type == content_type)
+        
+        if category:
+            query = query.where(Content.category == category)
+        
+        contents = (await db.execute(
+            query.order_by(Content.created_at.desc()).offset(skip).limit(limit)
+        )).scalars().all()
+        
+        tags = [CONTENT_LIST_TAG] + [response_cache.content_tag(content.id) for content in contents]
+        return [ContentResponse.model_validate(content) for content in contents], tags
     
-    return contents
+    return await response_cache.cached_response_async(request, build)
 
 
 @router.get("/{content_id}", response_model=ContentResponse)
-def get_content_detail(content_id: int, db: Session = Depends(get_db)):
-    """获取内容详情"""
-    content = db.query(Content).filter(Content.id == content_id).first()
-    
-    if not content:
-        raise HTTPException(status_code=404, detail="内容不存在")
+def get_content_detail(content_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    获取内容详情（只读，浏览量由 view_counter 缓冲后定时写回）
+    - 响应缓存，浏览量为缓存生成时的值
+    """
+    def build():
+        content = db.query(Content).filter(Content.id == content_id).first()
+        
+        if not content:
+            raise HTTPException(status_code=404, detail="内容不存在")
+        
+        # 返回值包含尚未写回数据库的浏览次数
+        response = ContentResponse.model_validate(content)
+        response.view_count = (content.view_count or 0) + view_counter.pending_views(content_id)
+        return response, [response_cache.content_tag(content_id)]
     
-    # 增加浏览量
-    content.view_count += 1
-    db.commit()
+    response = response_cache.cached_response(request, build)
+    view_counter.record_view(content_id)
     
-    return content
+    return response
 
 
 @router.post("/{content_id}/like")
@@ -61,13 +85,16 @@ def like_content(
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """点赞内容"""
-    content = db.query(Content).filter(Content.id == content_id).first()
+    """点赞/取消点赞内容（点赞记录唯一，计数在数据库中原子增减）"""
+    content_exists = db.query(Content.id).filter(Content.id == content_id).first()
     
-    if not content:
+    if not content_exists:
         raise HTTPException(status_code=404, detail="内容不存在")
     
-    content.like_count += 1
+    is_liked, like_count = engagement.toggle_like(db, current_user.id, "content", content_id)
     db.commit()
+    response_cache.invalidate_tags(response_cache.content_tag(content_id))
     
-    return {"message": "点赞成功", "like_count": content.like_count}
+    if is_liked:
+        return {"message": "点赞成功", "like_count": like_count, "is_liked": True}
+    return {"message": "已取消点赞", "like_count": like_count, "is_liked": False}
@@ -2,22 +2,27 @@
 咨询师路由 - 咨询师管理和查询
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, date, time, timedelta
-from jose import jwt as jwt_lib, JWTError
 
-from database import get_db
+from database import get_async_db, get_db
 from models import Counselor, User, CounselorStatus, CounselorSchedule, CounselorUnavailable, CounselorFavorite, Appointment, ConsultationRecord, AppointmentStatus
 from schemas import (
     CounselorCreate, CounselorResponse, CounselorUpdate, ScheduleSet,
     CounselorProfileUpdate, ScheduleUpdate, UnavailablePeriodCreate, UnavailablePeriodUpdate,
     CounselorFavoriteResponse, ClientInfo
 )
-from auth import get_current_active_user, oauth2_scheme
-from sqlalchemy import func, distinct, and_, or_
-from collections import defaultdict
+from auth import get_current_active_user, get_optional_user_async
+import activity_stats
+import availability
+import counselor_tags
+import response_cache
+import stats_counters
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils import parse_json_array_field
 from sqlalchemy.orm import joinedload
 import json
 import logging
@@ -27,28 +32,6 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def get_optional_current_user(
-    token: Optional[str] = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
-    """可选获取当前用户（如果已登录）"""
-    if not token:
-        return None
-    try:
-        from auth import SECRET_KEY, ALGORITHM
-        payload = jwt_lib.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id_str = payload.get("sub")
-        if user_id_str is None:
-            return None
-        user_id: int = int(user_id_str)
-        user = db.query(User).filter(User.id == user_id).first()
-        if user is None or not user.is_active:
-            return None
-        return user
-    except (JWTError, ValueError, Exception):
-        return None
-
-
 @router.post("/apply", response_model=CounselorResponse)
 def apply_as_counselor(
     counselor_data: CounselorCreate,
@@ -78,6 +61,8 @@ def apply_as_counselor(
     )
     
     db.add(new_counselor)
+    db.flush()
+    counselor_tags.sync_counselor_tags(db, new_counselor)
     db.commit()
     db.refresh(new_counselor)
     
@@ -92,65 +77,41 @@ def apply_as_counselor(
     return new_counselor
 
 
+def _apply_search_filters(query, specialties, methods, gender):
+    """咨询师搜索的公共筛选条件（擅长领域、咨询方式走标签表索引），Query 和 select() 均可"""
+    if specialties:
+        query = query.filter(counselor_tags.specialty_filter(specialties))
+    if gender and gender != 'all':
+        query = query.filter(Counselor.gender == gender)
+    if methods:
+        query = query.filter(counselor_tags.consult_method_filter(methods))
+    return query
+
+
 @router.get("/search", response_model=List[CounselorResponse])
-def search_counselors(
+async def search_counselors(
     specialty: Optional[str] = None,
     gender: Optional[str] = None,
     consult_method: Optional[str] = None,
     sort_by: Optional[str] = None,  # 'hot', 'new', 'rating'
     skip: int = 0,
     limit: int = 20,
-    current_user: Optional[User] = Depends(get_optional_current_user),
-    db: Session = Depends(get_db)
+    current_user: Optional[User] = Depends(get_optional_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     搜索咨询师
-    - 支持按擅长领域、性别、咨询方式筛选
+    - 支持按擅长领域、性别、咨询方式筛选（多个值用逗号分隔，命中任一即可）
     - 支持排序：按热度、最新入驻、好评率
     - 分页查询
     """
-    import json
-    
-    query = db.query(Counselor).filter(Counselor.status == CounselorStatus.ACTIVE)
-    
-    # 如果用户已登录，获取用户收藏的咨询师ID列表
-    favorited_counselor_ids = set()
-    if current_user:
-        favorites = db.query(CounselorFavorite.counselor_id).filter(
-            CounselorFavorite.user_id == current_user.id
-        ).all()
-        favorited_counselor_ids = {f[0] for f in favorites}
-    
-    # 按擅长领域筛选（支持多个，用逗号分隔）
-    if specialty:
-        specialties = [s.strip() for s in specialty.split(',') if s.strip()]
-        if specialties:
-            from sqlalchemy import or_
-            conditions = [Counselor.specialty.contains(s) for s in specialties]
-            query = query.filter(or_(*conditions))
-    
-    # 按性别筛选
-    if gender and gender != 'all':
-        query = query.filter(Counselor.gender == gender)
-    
-    # 按咨询方式筛选
-    if consult_method:
-        methods = [m.strip() for m in consult_method.split(',') if m.strip()]
-        if methods:
-            # 由于 consult_methods 可能是 JSON 字符串或逗号分隔的字符串
-            # 使用 LIKE 查询来匹配
-            from sqlalchemy import or_
-            conditions = []
-            for method in methods:
-                # 匹配 JSON 格式 ["video", "offline"] 或逗号分隔格式 "video,offline"
-                conditions.append(
-                    or_(
-                        Counselor.consult_methods.like(f'%"{method}"%'),
-                        Counselor.consult_methods.like(f'%{method}%')
-                    )
-                )
-            if conditions:
-                query = query.filter(or_(*conditions))
+    query = select(Counselor).where(Counselor.status == CounselorStatus.ACTIVE)
+    query = _apply_search_filters(
+        query,
+        counselor_tags.split_filter_value(specialty),
+        counselor_tags.split_filter_value(consult_method),
+        gender,
+    )
     
     # 排序
     if sort_by == 'hot':
@@ -168,73 +129,73 @@ def search_counselors(
         # 默认按创建时间排序
         query = query.order_by(Counselor.created_at.desc())
     
-    counselors = query.offset(skip).limit(limit).all()
+    counselors = (await db.execute(query.offset(skip).limit(limit))).scalars().all()
+    counselor_ids = [counselor.id for counselor in counselors]
     
-    # 确保 average_rating 和 review_count 不为 None，并格式化 specialty 和 consult_methods
+    # 如果用户已登录，获取本页中已收藏的咨询师
+    favorited_counselor_ids = set()
+    if current_user and counselor_ids:
+        favorites = await db.execute(
+            select(CounselorFavorite.counselor_id).where(
+                CounselorFavorite.user_id == current_user.id,
+                CounselorFavorite.counselor_id.in_(counselor_ids)
+            )
+        )
+        favorited_counselor_ids = set(favorites.scalars().all())
+    
+    # 本页咨询师的标签一次取回，拼接为逗号分隔的字符串（CounselorResponse 期望字符串）
+    tags = await db.run_sync(counselor_tags.load_tags, counselor_ids)
+    
+    result = []
     for counselor in counselors:
-        if counselor.average_rating is None:
-            counselor.average_rating = 0.0
-        if counselor.review_count is None:
-            counselor.review_count = 0
-        if counselor.fee is None:
-            counselor.fee = 0.0
-        
-        # 解析 specialty 和 consult_methods 为字符串（用于显示）
-        # CounselorResponse 期望 specialty 和 consult_methods 是字符串
-        specialty_parsed = parse_json_array_field(counselor.specialty, default=[])
-        consult_methods_parsed = parse_json_array_field(counselor.consult_methods, default=[])
+        # 尚未同步标签的旧数据回退到解析原字段
+        specialty_list = tags["specialty"].get(counselor.id) or parse_json_array_field(counselor.specialty, default=[])
+        methods_list = tags["consult_methods"].get(counselor.id) or parse_json_array_field(counselor.consult_methods, default=[])
         
-        # 将数组转换为逗号分隔的字符串（用于显示）
-        counselor.specialty = ', '.join(specialty_parsed) if specialty_parsed else ''
-        counselor.consult_methods = ', '.join(consult_methods_parsed) if consult_methods_parsed else ''
-        # 检查是否已收藏
-        counselor.is_favorited = counselor.id in favorited_counselor_ids
+        counselor_dict = {
+            "id": counselor.id,
+            "real_name": counselor.real_name,
+            "gender": counselor.gender,
+            "specialty": ', '.join(specialty_list),
+            "experience_years": counselor.experience_years,
+            "fee": counselor.fee,
+            "average_rating": counselor.average_rating,
+            "review_count": counselor.review_count,
+            "status": counselor.status,
+            "created_at": counselor.created_at,
+            "bio": counselor.bio,
+            "consult_methods": ', '.join(methods_list),
+            "avatar": counselor.avatar,
+            "intro": counselor.intro,
+            "qualification": counselor.qualification,
+            "consult_place": counselor.consult_place,
+            "age": counselor.age,
+            "total_consultations": counselor.total_consultations or 0,
+            "is_favorited": counselor.id in favorited_counselor_ids,
+        }
+        result.append(CounselorResponse(**counselor_dict))
     
-    return counselors
+    return result
 
 
-def parse_json_array_field(value, default=None):
+@router.get("/search/facets")
+def get_search_facets(
+    specialty: Optional[str] = None,
+    gender: Optional[str] = None,
+    consult_method: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    统一解析JSON数组字段的函数
-    支持多种格式：
-    1. JSON数组字符串：'["item1", "item2"]'
-    2. 逗号分隔字符串：'item1, item2' 或 'item1，item2'（中文逗号）
-    3. 单个字符串：'item1'
-    4. None/空字符串：返回默认值或空数组
+    咨询师筛选栏的分面统计
+    - 返回各擅长领域、咨询方式下可预约咨询师的数量
+    - 每个维度的计数应用其他维度的当前筛选条件
     """
-    if value is None:
-        return default if default is not None else []
-    
-    if isinstance(value, list):
-        # 已经是数组，清理空格后返回
-        return [str(item).strip() for item in value if item and str(item).strip()]
-    
-    if not isinstance(value, str):
-        return default if default is not None else []
-    
-    value = value.strip()
-    if not value:
-        return default if default is not None else []
-    
-    # 尝试解析JSON数组
-    try:
-        if value.startswith('[') and value.endswith(']'):
-            parsed = json.loads(value)
-            if isinstance(parsed, list):
-                return [str(item).strip() for item in parsed if item and str(item).strip()]
-    except (json.JSONDecodeError, ValueError):
-        pass
-    
-    # 尝试按逗号分割（支持中文逗号和英文逗号）
-    # 先尝试中文逗号
-    if '，' in value:
-        items = value.split('，')
-    else:
-        items = value.split(',')
-    
-    # 清理空格和空项
-    result = [item.strip() for item in items if item.strip()]
-    return result if result else (default if default is not None else [])
+    return counselor_tags.search_facets(
+        db,
+        counselor_tags.split_filter_value(specialty),
+        counselor_tags.split_filter_value(consult_method),
+        gender,
+    )
 
 
 # ============ 具体路由（必须在参数路由之前）============
@@ -492,7 +453,12 @@ def update_counselor_profile(
     if need_review and counselor.status == CounselorStatus.ACTIVE:
         counselor.status = CounselorStatus.PENDING
     
+    # 同步擅长领域、咨询方式标签表（用于搜索筛选）
+    if 'specialty' in update_dict or 'consult_methods' in update_dict:
+        counselor_tags.sync_counselor_tags(db, counselor)
+    
     db.commit()
+    response_cache.invalidate_tags(response_cache.counselor_tag(counselor.id))
     db.refresh(counselor)
     
     return {"message": "资料更新成功", "need_review": need_review}
@@ -526,6 +492,7 @@ def upload_avatar(
     # 更新数据库
     counselor.avatar = avatar_url
     db.commit()
+    response_cache.invalidate_tags(response_cache.counselor_tag(counselor.id))
     
     return {"avatar_url": avatar_url, "message": "头像上传成功"}
 
@@ -544,13 +511,10 @@ def get_counselor_stats(
     if not counselor:
         raise HTTPException(status_code=404, detail="您还不是咨询师")
     
-    # 待确认预约数
-    pending_appointments = db.query(Appointment).filter(
-        Appointment.counselor_id == counselor.id,
-        Appointment.status == AppointmentStatus.PENDING
-    ).count()
+    # 待确认预约数、总咨询次数、评分统计来自 stats_counters 计数行
+    counters = stats_counters.get_counters(db, stats_counters.OWNER_COUNSELOR, counselor.id)
     
-    # 今日咨询数
+    # 今日咨询数（按 (counselor_id, appointment_date) 索引的当天区间查询）
     today = date.today()
     today_appointments = db.query(Appointment).filter(
         Appointment.counselor_id == counselor.id,
@@ -559,23 +523,10 @@ def get_counselor_stats(
         Appointment.status == AppointmentStatus.CONFIRMED
     ).count()
     
-    # 总咨询次数
-    total_consultations = db.query(Appointment).filter(
-        Appointment.counselor_id == counselor.id,
-        Appointment.status == AppointmentStatus.COMPLETED
-    ).count()
-    
-    # 好评率和平均评分（从CounselorRating表重新计算）
-    from models import CounselorRating
-    ratings = db.query(CounselorRating).filter(
-        CounselorRating.counselor_id == counselor.id
-    ).all()
-    
-    if ratings:
-        good_ratings = sum(1 for r in ratings if r.rating >= 4)
-        rating_percentage = int((good_ratings / len(ratings)) * 100)
-        # 重新计算平均评分
-        calculated_average_rating = round(sum(r.rating for r in ratings) / len(ratings), 1)
+    rating_count = counters.rating_count
+    if rating_count:
+        rating_percentage = int((counters.good_rating_count / rating_count) * 100)
+        calculated_average_rating = round(counters.rating_sum / rating_count, 1)
     else:
         rating_percentage = 0
         calculated_average_rating = None
@@ -591,12 +542,12 @@ def get_counselor_stats(
         final_average_rating = 5.0
     
     return {
-        "pending_appointments": pending_appointments,
+        "pending_appointments": counters.pending_appointments,
         "today_appointments": today_appointments,
-        "total_consultations": total_consultations or counselor.total_consultations,
+        "total_consultations": counters.completed_appointments or counselor.total_consultations,
         "rating_percentage": rating_percentage,
         "average_rating": final_average_rating,
-        "review_count": counselor.review_count or len(ratings) if ratings else 0
+        "review_count": counselor.review_count or rating_count if rating_count else 0
     }
 
 
@@ -606,284 +557,13 @@ def get_counselor_consultation_activity(
     db: Session = Depends(get_db)
 ):
     """获取咨询师的咨询活动数据（用于数据可视化）"""
-    from models import CounselorRating
-
     counselor = db.query(Counselor).filter(Counselor.user_id == current_user.id).first()
 
     if not counselor:
         raise HTTPException(status_code=404, detail="您还不是咨询师")
 
     try:
-        completed_appointments = db.query(Appointment).filter(
-            Appointment.counselor_id == counselor.id,
-            or_(
-                Appointment.status == AppointmentStatus.COMPLETED,
-                and_(
-                    Appointment.status == AppointmentStatus.CONFIRMED,
-                    Appointment.user_confirmed_complete.is_(True),
-                    Appointment.counselor_confirmed_complete.is_(True),
-                ),
-            )
-        ).order_by(Appointment.appointment_date.desc()).all()
-
-        today = date.today()
-        date_stats = defaultdict(int)
-        date_duration_stats = defaultdict(int)
-        consultation_activities = []
-        DEFAULT_DURATION_MINUTES = 60
-        total_duration_minutes = 0
-
-        for appointment in completed_appointments:
-            if appointment.appointment_date is None:
-                continue
-
-            try:
-                apt_datetime = appointment.appointment_date
-                if isinstance(apt_datetime, datetime) and apt_datetime.tzinfo is not None:
-                    apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-                elif not isinstance(apt_datetime, datetime):
-                    apt_datetime = datetime.fromisoformat(str(apt_datetime).replace('Z', '+00:00'))
-                    if apt_datetime.tzinfo is not None:
-                        apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-            except Exception:
-                apt_datetime = None
-
-            if apt_datetime is None:
-                continue
-
-            appointment_date = apt_datetime.date()
-            days_ago = (today - appointment_date).days
-
-            if days_ago > 30:
-                continue
-
-            date_str = appointment_date.isoformat()
-            date_stats[date_str] += 1
-
-            duration_minutes = DEFAULT_DURATION_MINUTES
-            end_datetime = None
-
-            if appointment.description and "|END_TIME:" in appointment.description:
-                try:
-                    end_time_str = appointment.description.split("|END_TIME:")[1].split("|")[0]
-                    end_datetime = datetime.fromisoformat(end_time_str.replace("Z", "+00:00"))
-                    if end_datetime.tzinfo is not None:
-                        end_datetime = end_datetime.astimezone().replace(tzinfo=None)
-                except Exception:
-                    end_datetime = None
-
-            if end_datetime is None and appointment.updated_at:
-                try:
-                    updated_at = appointment.updated_at
-                    if isinstance(updated_at, datetime) and updated_at.tzinfo is not None:
-                        updated_at = updated_at.astimezone().replace(tzinfo=None)
-                    elif not isinstance(updated_at, datetime):
-                        updated_at = datetime.fromisoformat(str(updated_at).replace('Z', '+00:00'))
-                        if updated_at.tzinfo is not None:
-                            updated_at = updated_at.astimezone().replace(tzinfo=None)
-
-                    if isinstance(updated_at, datetime) and isinstance(apt_datetime, datetime):
-                        duration = updated_at - apt_datetime
-                        duration_minutes = max(60, min(180, int(duration.total_seconds() / 60)))
-                except Exception:
-                    duration_minutes = DEFAULT_DURATION_MINUTES
-
-            if end_datetime and isinstance(end_datetime, datetime) and isinstance(apt_datetime, datetime):
-                duration = end_datetime - apt_datetime
-                duration_minutes = max(60, min(180, int(duration.total_seconds() / 60)))
-
-            date_duration_stats[date_str] += duration_minutes
-            total_duration_minutes += duration_minutes
-
-            try:
-                consultation_activities.append({
-                    "id": appointment.id,
-                    "date": date_str,
-                    "datetime": appointment.appointment_date.isoformat()
-                    if hasattr(appointment.appointment_date, "isoformat")
-                    else str(appointment.appointment_date),
-                    "consult_type": appointment.consult_type or "心理咨询",
-                    "consult_method": appointment.consult_method or "未知",
-                    "user_name": appointment.user.nickname if appointment.user else None,
-                    "user_username": appointment.user.username if appointment.user else None,
-                    "duration_minutes": duration_minutes,
-                    "rating": appointment.rating,
-                    "status": "completed",
-                })
-            except Exception:
-                continue
-
-        date_list = []
-        for i in range(29, -1, -1):
-            d = today - timedelta(days=i)
-            date_str = d.isoformat()
-            date_list.append({
-                "date": date_str,
-                "count": date_stats.get(date_str, 0),
-                "total_duration": date_duration_stats.get(date_str, 0),
-            })
-
-        week_stats = defaultdict(int)
-        for appointment in completed_appointments:
-            if appointment.appointment_date is None:
-                continue
-            try:
-                apt_datetime = appointment.appointment_date
-                if isinstance(apt_datetime, datetime) and apt_datetime.tzinfo is not None:
-                    apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-                elif not isinstance(apt_datetime, datetime):
-                    apt_datetime = datetime.fromisoformat(str(apt_datetime).replace('Z', '+00:00'))
-                    if apt_datetime.tzinfo is not None:
-                        apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-            except Exception:
-                continue
-
-            appointment_date = apt_datetime.date()
-            days_ago = (today - appointment_date).days
-            if days_ago <= 30:
-                week_num = days_ago // 7
-                week_stats[week_num] += 1
-
-        type_stats = defaultdict(int)
-        for appointment in completed_appointments:
-            type_stats[appointment.consult_type or "心理咨询"] += 1
-
-        hour_stats = defaultdict(int)
-        hour_duration_stats = defaultdict(int)
-        time_period_stats = {
-            "morning": 0,
-            "afternoon": 0,
-            "evening": 0,
-            "night": 0,
-        }
-        time_period_duration = {
-            "morning": 0,
-            "afternoon": 0,
-            "evening": 0,
-            "night": 0,
-        }
-        duration_distribution = {
-            "short": 0,
-            "medium": 0,
-            "long": 0,
-            "very_long": 0,
-        }
-
-        for appointment in completed_appointments:
-            if appointment.appointment_date is None:
-                continue
-
-            try:
-                apt_datetime = appointment.appointment_date
-                if isinstance(apt_datetime, datetime) and apt_datetime.tzinfo is not None:
-                    apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-                elif not isinstance(apt_datetime, datetime):
-                    apt_datetime = datetime.fromisoformat(str(apt_datetime).replace('Z', '+00:00'))
-                    if apt_datetime.tzinfo is not None:
-                        apt_datetime = apt_datetime.astimezone().replace(tzinfo=None)
-            except Exception:
-                continue
-
-            if not isinstance(apt_datetime, datetime):
-                continue
-
-            hour = apt_datetime.hour
-            hour_stats[hour] += 1
-
-            duration_minutes = DEFAULT_DURATION_MINUTES
-            end_datetime = None
-
-            if appointment.description and "|END_TIME:" in appointment.description:
-                try:
-                    end_time_str = appointment.description.split("|END_TIME:")[1].split("|")[0]
-                    end_datetime = datetime.fromisoformat(end_time_str.replace("Z", "+00:00"))
-                    if end_datetime.tzinfo is not None:
-                        end_datetime = end_datetime.astimezone().replace(tzinfo=None)
-                except Exception:
-                    end_datetime = None
-
-            if end_datetime is None and appointment.updated_at:
-                try:
-                    updated_at = appointment.updated_at
-                    if isinstance(updated_at, datetime) and updated_at.tzinfo is not None:
-                        updated_at = updated_at.astimezone().replace(tzinfo=None)
-                    elif not isinstance(updated_at, datetime):
-                        updated_at = datetime.fromisoformat(str(updated_at).replace('Z', '+00:00'))
-                        if updated_at.tzinfo is not None:
-                            updated_at = updated_at.astimezone().replace(tzinfo=None)
-
-                    if isinstance(updated_at, datetime):
-                        duration = updated_at - apt_datetime
-                        duration_minutes = max(60, min(180, int(duration.total_seconds() / 60)))
-                except Exception:
-                    duration_minutes = DEFAULT_DURATION_MINUTES
-
-            if end_datetime and isinstance(end_datetime, datetime):
-                duration = end_datetime - apt_datetime
-                duration_minutes = max(60, min(180, int(duration.total_seconds() / 60)))
-
-            hour_duration_stats[hour] += duration_minutes
-
-            if 6 <= hour < 12:
-                time_period_stats["morning"] += 1
-                time_period_duration["morning"] += duration_minutes
-            elif 12 <= hour < 18:
-                time_period_stats["afternoon"] += 1
-                time_period_duration["afternoon"] += duration_minutes
-            elif 18 <= hour < 22:
-                time_period_stats["evening"] += 1
-                time_period_duration["evening"] += duration_minutes
-            else:
-                time_period_stats["night"] += 1
-                time_period_duration["night"] += duration_minutes
-
-            if duration_minutes < 60:
-                duration_distribution["short"] += 1
-            elif duration_minutes < 120:
-                duration_distribution["medium"] += 1
-            elif duration_minutes < 180:
-                duration_distribution["long"] += 1
-            else:
-                duration_distribution["very_long"] += 1
-
-        hour_list = []
-        for hour in range(24):
-            count = hour_stats.get(hour, 0)
-            total_dur = hour_duration_stats.get(hour, 0)
-            avg_dur = int(total_dur / count) if count > 0 else 0
-            hour_list.append({
-                "hour": hour,
-                "count": count,
-                "total_duration": total_dur,
-                "average_duration": avg_dur,
-            })
-
-        total_consultations = len(completed_appointments)
-        average_duration_minutes = int(total_duration_minutes / total_consultations) if total_consultations > 0 else 0
-        total_hours = round(total_duration_minutes / 60, 1)
-        recent_7_days = sum(date_stats.get((today - timedelta(days=i)).isoformat(), 0) for i in range(7))
-        recent_30_days = sum(date_stats.values())
-
-        ratings = db.query(CounselorRating).filter(CounselorRating.counselor_id == counselor.id).all()
-        average_rating = round(sum(r.rating for r in ratings) / len(ratings), 1) if ratings else 0
-
-        return {
-            "total_consultations": total_consultations,
-            "total_duration_minutes": total_duration_minutes,
-            "total_duration_hours": total_hours,
-            "average_duration_minutes": average_duration_minutes,
-            "recent_7_days": recent_7_days,
-            "recent_30_days": recent_30_days,
-            "average_rating": average_rating,
-            "daily_stats": date_list,
-            "week_stats": dict(week_stats),
-            "type_stats": dict(type_stats),
-            "hour_stats": hour_list,
-            "time_period_stats": time_period_stats,
-            "time_period_duration": time_period_duration,
-            "duration_distribution": duration_distribution,
-            "activities": consultation_activities[:50],
-        }
+        return activity_stats.build_consultation_activity(db, counselor_id=counselor.id)
     except Exception as exc:
         import traceback
         traceback.print_exc()
@@ -927,6 +607,7 @@ def set_counselor_schedules(
         db.add(schedule)
     
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     
     return {"message": "时段设置已更新"}
 
@@ -974,6 +655,7 @@ def update_single_schedule(
         db.add(schedule)
     
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     return {"message": "时段设置已更新"}
 
 
@@ -1002,6 +684,7 @@ def reset_schedule(
         ).delete()
     
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     return {"message": "时段已重置为默认"}
 
 
@@ -1098,10 +781,10 @@ def get_counselor_schedules(
 
 
 @router.get("/{counselor_id}/available-slots")
-def get_available_slots(
+async def get_available_slots(
     counselor_id: int,
     date: str = Query(..., description="日期，格式：YYYY-MM-DD"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取咨询师在指定日期的可用时段
@@ -1112,17 +795,18 @@ def get_available_slots(
     
     跨页面数据联动：
     - 所有关联页面（学生个人中心、咨询师工作台、管理员后台）均从同一核心数据库读取预约相关数据
-    - 状态变更时实时同步至各页面，确保无论从哪个页面查看，预约记录、咨询师档期、咨询进度等信息完全一致
+    - 时段数据由 availability 索引提供，预约或日程变更时索引会立即失效，确保各页面信息一致
     """
-    from models import Appointment, AppointmentStatus
-    from datetime import datetime, date as date_type, timedelta, time
+    from datetime import datetime, date as date_type, timedelta
     
     # 检查咨询师是否存在且已激活
-    counselor = db.query(Counselor).filter(
-        Counselor.id == counselor_id,
-        Counselor.status == CounselorStatus.ACTIVE
-    ).first()
-    if not counselor:
+    counselor_exists = await db.scalar(
+        select(Counselor.id).where(
+            Counselor.id == counselor_id,
+            Counselor.status == CounselorStatus.ACTIVE
+        )
+    )
+    if counselor_exists is None:
         raise HTTPException(status_code=404, detail="咨询师不存在或未激活")
     
     # 解析日期
@@ -1139,149 +823,55 @@ def get_available_slots(
     if target_date > max_date:
         raise HTTPException(status_code=400, detail="只能预约未来30天内的日期")
     
-    # 获取星期几（1=周一，7=周日）
-    weekday = target_date.isoweekday()
+    return {"available_slots": await availability.get_available_slots_async(db, counselor_id, target_date)}
+
+
+@router.get("/{counselor_id}/available-slots/range")
+async def get_available_slots_range(
+    counselor_id: int,
+    start_date: Optional[str] = Query(None, description="开始日期，格式：YYYY-MM-DD，默认今天"),
+    end_date: Optional[str] = Query(None, description="结束日期，格式：YYYY-MM-DD，默认今天起30天"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    一次性获取咨询师在日期区间内每天的可用时段
+    - 供预约页面的30天日历使用，替代逐日调用 available-slots
+    - 区间会被限制在今天到未来30天之内
+    """
+    from datetime import datetime, date as date_type, timedelta
     
-    # 获取咨询师在该工作日的时段设置（如果没有设置，使用默认8:00-22:00）
-    from sqlalchemy import text
+    counselor_exists = await db.scalar(
+        select(Counselor.id).where(
+            Counselor.id == counselor_id,
+            Counselor.status == CounselorStatus.ACTIVE
+        )
+    )
+    if counselor_exists is None:
+        raise HTTPException(status_code=404, detail="咨询师不存在或未激活")
     
-    schedule = None
+    today = date_type.today()
+    max_date = today + timedelta(days=30)
     try:
-        # 直接使用原始 SQL 查询避免类型转换错误
-        result = db.execute(
-            text("""
-                SELECT id, weekday, start_time, end_time, max_num, is_available
-                FROM counselor_schedules
-                WHERE counselor_id = :counselor_id
-                  AND weekday = :weekday
-                  AND is_available = true
-                LIMIT 1
-            """),
-            {"counselor_id": counselor_id, "weekday": weekday}
-        )
-        row = result.fetchone()
-        if row:
-            schedule = {
-                'id': row[0],
-                'weekday': row[1],
-                'start_time': row[2],
-                'end_time': row[3],
-                'max_num': row[4],
-                'is_available': bool(row[5])
-            }
-    except Exception as e:
-        # 如果原始查询失败，尝试使用 ORM（作为后备）
-        logger.warning(f"原始查询失败，尝试使用 ORM: {e}")
-        try:
-            schedule_obj = db.query(CounselorSchedule).filter(
-                CounselorSchedule.counselor_id == counselor_id,
-                CounselorSchedule.weekday == weekday,
-                CounselorSchedule.is_available == True
-            ).first()
-            if schedule_obj:
-                schedule = {
-                    'id': schedule_obj.id,
-                    'weekday': schedule_obj.weekday,
-                    'start_time': schedule_obj.start_time,
-                    'end_time': schedule_obj.end_time,
-                    'max_num': schedule_obj.max_num,
-                    'is_available': schedule_obj.is_available
-                }
-        except Exception as e2:
-            logger.error(f"ORM 查询也失败: {e2}")
+        range_start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else today
+        range_end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else max_date
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式错误，应为 YYYY-MM-DD")
     
-    if schedule:
-        try:
-            start_time = _safe_parse_time(schedule['start_time'])
-            end_time = _safe_parse_time(schedule['end_time'])
-            if start_time is None or end_time is None:
-                raise ValueError("时间解析失败")
-            max_num = schedule['max_num'] if schedule['max_num'] is not None else 1
-        except Exception as e:
-            logger.error(f"处理时间字段时出错: {e}, start_time={schedule.get('start_time')}, end_time={schedule.get('end_time')}")
-            # 使用默认值
-            start_time = time(8, 0)
-            end_time = time(22, 0)
-            max_num = 1
-    else:
-        # 默认时段：8:00-22:00
-        start_time = time(8, 0)
-        end_time = time(22, 0)
-        max_num = 1
-    
-    # 获取该日期不可预约时段
-    unavailable_periods = db.query(CounselorUnavailable).filter(
-        CounselorUnavailable.counselor_id == counselor_id,
-        CounselorUnavailable.status == 1,
-        CounselorUnavailable.start_date <= target_date,
-        CounselorUnavailable.end_date >= target_date
-    ).all()
-    
-    # 获取该日期已预约的时段
-    start_of_day = datetime.combine(target_date, datetime.min.time())
-    end_of_day = datetime.combine(target_date, datetime.max.time())
-    
-    existing_appointments = db.query(Appointment).filter(
-        Appointment.counselor_id == counselor_id,
-        Appointment.appointment_date >= start_of_day,
-        Appointment.appointment_date < end_of_day,
-        Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED])
-    ).all()
-    
-    # 转换为时间段集合（小时:分钟）
-    booked_times = set()
-    for apt in existing_appointments:
-        booked_time = apt.appointment_date.strftime("%H:%M")
-        booked_times.add(booked_time)
-    
-    # 生成可用时段（以1小时为单位）
-    available_slots = []
-    start_minutes = start_time.hour * 60 + start_time.minute
-    end_minutes = end_time.hour * 60 + end_time.minute
-    
-    current_minutes = start_minutes
-    while current_minutes + 60 <= end_minutes:
-        hour = current_minutes // 60
-        minute = current_minutes % 60
-        time_str = f"{hour:02d}:{minute:02d}"
-        slot_time = time(hour, minute)
-        
-        # 检查是否在不可预约时段内
-        is_unavailable = False
-        for period in unavailable_periods:
-            try:
-                period_start_time = _safe_parse_time(period.start_time) if period.start_time else None
-                period_end_time = _safe_parse_time(period.end_time) if period.end_time else None
-                
-                if period_start_time is None or period_end_time is None:
-                    # 全天不可预约
-                    is_unavailable = True
-                    break
-                else:
-                    if period_start_time <= slot_time < period_end_time:
-                        is_unavailable = True
-                        break
-            except Exception as e:
-                logger.warning(f"处理不可预约时段时出错: {e}, period.start_time={period.start_time}, period.end_time={period.end_time}")
-                # 如果解析失败，假设该时段不可预约（更安全的处理）
-                if period.start_time is None or period.end_time is None:
-                    is_unavailable = True
-                    break
-        
-        if not is_unavailable and time_str not in booked_times:
-            # 检查是否超过当日最大预约量
-            slot_appointments = [apt for apt in existing_appointments 
-                               if apt.appointment_date.hour == hour and apt.appointment_date.minute == minute]
-            
-            if len(slot_appointments) < max_num:
-                available_slots.append({
-                    "time": time_str,
-                    "display": f"{hour:02d}:{minute:02d}-{(current_minutes + 60) // 60:02d}:{(current_minutes + 60) % 60:02d}"
-                })
-        
-        current_minutes += 60
+    range_start = max(range_start, today)
+    range_end = min(range_end, max_date)
+    if range_end < range_start:
+        raise HTTPException(status_code=400, detail="结束日期不能早于开始日期")
+    
+    slots_by_day = await availability.get_available_slots_range_async(db, counselor_id, range_start, range_end)
     
-    return {"available_slots": available_slots}
+    return {
+        "start_date": range_start.isoformat(),
+        "end_date": range_end.isoformat(),
+        "days": [
+            {"date": day.isoformat(), "available_slots": slots}
+            for day, slots in sorted(slots_by_day.items())
+        ]
+    }
 
 
 # ============ 不可预约时段管理 ============
@@ -1372,6 +962,7 @@ def add_unavailable_period(
     
     db.add(period)
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     db.refresh(period)
     
     return {"message": "不可预约时段已添加", "id": period.id}
@@ -1436,6 +1027,7 @@ def update_unavailable_period(
         period.reason = period_data.reason
     
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     return {"message": "不可预约时段已更新"}
 
 
@@ -1460,6 +1052,7 @@ def delete_unavailable_period(
     
     db.delete(period)
     db.commit()
+    availability.invalidate_counselor_availability(counselor.id)
     
     return {"message": "不可预约时段已删除"}
 
@@ -1565,114 +1158,131 @@ def get_my_favorite_counselors(
 def get_my_clients(
     skip: int = 0,
     limit: int = 20,
+    sort_by: Optional[str] = None,  # 'last_visit'（默认，最近预约在前）, 'visit_count'（预约次数多在前）
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """咨询师查看来访者列表（预约过或咨询过的用户）"""
+    """
+    咨询师查看来访者列表（预约过或咨询过的用户）
+    - 预约按用户分组得到首次/最近预约时间和预约次数，左连接咨询记录数和用户信息，
+      排序和分页都在数据库中完成，每页固定一条查询
+    """
     # 检查当前用户是否是咨询师
     counselor = db.query(Counselor).filter(Counselor.user_id == current_user.id).first()
     if not counselor:
         raise HTTPException(status_code=403, detail="您不是咨询师")
     
-    # 获取所有预约过该咨询师的用户ID（去重）
-    user_ids = db.query(distinct(Appointment.user_id)).filter(
-        Appointment.counselor_id == counselor.id
-    ).all()
-    user_ids = [uid[0] for uid in user_ids]
-    
-    if not user_ids:
-        return []
-    
-    # 获取用户信息及统计数据
-    clients = []
-    for user_id in user_ids[skip:skip+limit]:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            continue
-        
-        # 获取首次预约时间
-        first_appointment = db.query(Appointment).filter(
-            Appointment.user_id == user_id,
-            Appointment.counselor_id == counselor.id
-        ).order_by(Appointment.appointment_date.asc()).first()
-        
-        # 获取最近预约时间
-        last_appointment = db.query(Appointment).filter(
-            Appointment.user_id == user_id,
-            Appointment.counselor_id == counselor.id
-        ).order_by(Appointment.appointment_date.desc()).first()
-        
-        # 统计总预约次数
-        total_appointments = db.query(func.count(Appointment.id)).filter(
-            Appointment.user_id == user_id,
-            Appointment.counselor_id == counselor.id
-        ).scalar() or 0
-        
-        # 统计总咨询次数（已完成的）
-        total_consultations = db.query(func.count(ConsultationRecord.id)).filter(
-            ConsultationRecord.user_id == user_id,
-            ConsultationRecord.counselor_id == counselor.id
-        ).scalar() or 0
-        
-        # 获取性别显示
-        from utils import get_gender_display
-        gender_display = get_gender_display(user.gender) if user.gender else None
-        
-        clients.append({
-            "user_id": user.id,
-            "username": user.username,
-            "nickname": user.nickname,
-            "gender": user.gender,
-            "gender_display": gender_display,
-            "age": user.age,
-            "school": user.school,
-            "first_appointment_date": first_appointment.appointment_date if first_appointment else None,
-            "last_appointment_date": last_appointment.appointment_date if last_appointment else None,
-            "total_appointments": total_appointments,
-            "total_consultations": total_consultations
-        })
-    
-    return clients
+    appointment_stats = db.query(
+        Appointment.user_id.label("user_id"),
+        func.min(Appointment.appointment_date).label("first_appointment_date"),
+        func.max(Appointment.appointment_date).label("last_appointment_date"),
+        func.count(Appointment.id).label("total_appointments")
+    ).filter(
+        Appointment.counselor_id == counselor.id,
+        Appointment.user_id.isnot(None)
+    ).group_by(Appointment.user_id).subquery()
+    
+    # 总咨询次数（已完成并生成咨询记录的）
+    consultation_stats = db.query(
+        ConsultationRecord.user_id.label("user_id"),
+        func.count(ConsultationRecord.id).label("total_consultations")
+    ).filter(
+        ConsultationRecord.counselor_id == counselor.id
+    ).group_by(ConsultationRecord.user_id).subquery()
+    
+    if sort_by == 'visit_count':
+        order_by = (
+            appointment_stats.c.total_appointments.desc(),
+            appointment_stats.c.last_appointment_date.desc(),
+            User.id.desc()
+        )
+    else:
+        order_by = (appointment_stats.c.last_appointment_date.desc(), User.id.desc())
+    
+    rows = db.query(
+        User.id, User.username, User.nickname, User.gender, User.age, User.school,
+        appointment_stats.c.first_appointment_date,
+        appointment_stats.c.last_appointment_date,
+        appointment_stats.c.total_appointments,
+        func.coalesce(consultation_stats.c.total_consultations, 0)
+    ).join(
+        appointment_stats, appointment_stats.c.user_id == User.id
+    ).outerjoin(
+        consultation_stats, consultation_stats.c.user_id == User.id
+    ).order_by(*order_by).offset(skip).limit(limit).all()
+    
+    from utils import get_gender_display
+    return [
+        {
+            "user_id": user_id,
+            "username": username,
+            "nickname": nickname,
+            "gender": gender,
+            "gender_display": get_gender_display(gender) if gender else None,
+            "age": age,
+            "school": school,
+            "first_appointment_date": first_appointment_date,
+            "last_appointment_date": last_appointment_date,
+            "total_appointments": int(total_appointments or 0),
+            "total_consultations": int(total_consultations or 0)
+        }
+        for (
+            user_id, username, nickname, gender, age, school,
+            first_appointment_date, last_appointment_date, total_appointments, total_consultations
+        ) in rows
+    ]
 
 
 # ============ 参数路由（必须在所有具体路由之后）============
 
 @router.get("/{counselor_id}", response_model=CounselorResponse)
-def get_counselor_detail(
+async def get_counselor_detail(
     counselor_id: int,
-    current_user: Optional[User] = Depends(get_optional_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Optional[User] = Depends(get_optional_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取咨询师详情"""
-    counselor = db.query(Counselor).filter(Counselor.id == counselor_id).first()
-    
-    if not counselor:
-        raise HTTPException(status_code=404, detail="咨询师不存在")
-    
-    # 确保 average_rating 和 review_count 不为 None
-    if counselor.average_rating is None:
-        counselor.average_rating = 0.0
-    if counselor.review_count is None:
-        counselor.review_count = 0
-    if counselor.fee is None:
-        counselor.fee = 0.0
-    
-    # 解析 specialty 和 consult_methods 为字符串（用于显示）
-    # CounselorResponse 期望 specialty 和 consult_methods 是字符串
-    specialty_parsed = parse_json_array_field(counselor.specialty, default=[])
-    consult_methods_parsed = parse_json_array_field(counselor.consult_methods, default=[])
-    
-    # 将数组转换为逗号分隔的字符串（用于显示）
-    counselor.specialty = ', '.join(specialty_parsed) if specialty_parsed else ''
-    counselor.consult_methods = ', '.join(consult_methods_parsed) if consult_methods_parsed else ''
-    
+    """
+    获取咨询师详情
+    - 响应按「咨询师 + 是否已收藏」缓存，资料、状态、评分变更时失效
+    """
     # 检查当前用户是否已收藏该咨询师
-    counselor.is_favorited = False
+    is_favorited = False
     if current_user:
-        favorite = db.query(CounselorFavorite).filter(
-            CounselorFavorite.user_id == current_user.id,
-            CounselorFavorite.counselor_id == counselor_id
-        ).first()
-        counselor.is_favorited = favorite is not None
+        favorite_id = await db.scalar(
+            select(CounselorFavorite.id).where(
+                CounselorFavorite.user_id == current_user.id,
+                CounselorFavorite.counselor_id == counselor_id
+            ).limit(1)
+        )
+        is_favorited = favorite_id is not None
+    
+    async def build():
+        counselor = await db.get(Counselor, counselor_id)
+        
+        if not counselor:
+            raise HTTPException(status_code=404, detail="咨询师不存在")
+        
+        # 确保 average_rating 和 review_count 不为 None
+        if counselor.average_rating is None:
+            counselor.average_rating = 0.0
+        if counselor.review_count is None:
+            counselor.review_count = 0
+        if counselor.fee is None:
+            counselor.fee = 0.0
+        
+        # 解析 specialty 和 consult_methods 为字符串（用于显示）
+        # CounselorResponse 期望 specialty 和 consult_methods 是字符串
+        specialty_parsed = parse_json_array_field(counselor.specialty, default=[])
+        consult_methods_parsed = parse_json_array_field(counselor.consult_methods, default=[])
+        
+        # 将数组转换为逗号分隔的字符串（用于显示）
+        counselor.specialty = ', '.join(specialty_parsed) if specialty_parsed else ''
+        counselor.consult_methods = ', '.join(consult_methods_parsed) if consult_methods_parsed else ''
+        counselor.is_favorited = is_favorited
+        
+        return CounselorResponse.model_validate(counselor), [response_cache.counselor_tag(counselor_id)]
     
-    return counselor
+    return await response_cache.cached_response_async(
+        request, build, vary=(is_favorited,), private=current_user is not None
+    )
@@ -2,34 +2,51 @@
 心理测评路由 - 测评量表和报告管理
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List
+import json
+import logging
 
 from database import get_db
 from models import TestScale, TestReport, User
 from schemas import TestScaleResponse, TestReportCreate, TestReportResponse
 from auth import get_current_active_user
+import response_cache
+import scale_scoring
+import stats_counters
+
+logger = logging.getLogger("heart_care.tests")
 
 router = APIRouter()
 
+# 量表列表缓存的公共标签（新增量表时失效）
+SCALE_LIST_TAG = "scale:list"
+
 
 @router.get("/scales", response_model=List[TestScaleResponse])
-def get_test_scales(db: Session = Depends(get_db)):
-    """获取所有测评量表列表"""
-    scales = db.query(TestScale).filter(TestScale.is_active == True).all()
-    return scales
+def get_test_scales(request: Request, db: Session = Depends(get_db)):
+    """获取所有测评量表列表（响应缓存）"""
+    def build():
+        scales = db.query(TestScale).filter(TestScale.is_active == True).all()
+        tags = [SCALE_LIST_TAG] + [response_cache.scale_tag(scale.id) for scale in scales]
+        return [TestScaleResponse.model_validate(scale) for scale in scales], tags
+    
+    return response_cache.cached_response(request, build)
 
 
 @router.get("/scales/{scale_id}", response_model=TestScaleResponse)
-def get_test_scale_detail(scale_id: int, db: Session = Depends(get_db)):
-    """获取测评量表详情"""
-    scale = db.query(TestScale).filter(TestScale.id == scale_id).first()
-    
-    if not scale:
-        raise HTTPException(status_code=404, detail="测评量表不存在")
+def get_test_scale_detail(scale_id: int, request: Request, db: Session = Depends(get_db)):
+    """获取测评量表详情（响应缓存）"""
+    def build():
+        scale = db.query(TestScale).filter(TestScale.id == scale_id).first()
+        
+        if not scale:
+            raise HTTPException(status_code=404, detail="测评量表不存在")
+        
+        return TestScaleResponse.model_validate(scale), [response_cache.scale_tag(scale_id)]
     
-    return scale
+    return response_cache.cached_response(request, build)
 
 
 @router.post("/submit", response_model=TestReportResponse)
@@ -38,22 +55,57 @@ def submit_test_report(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """提交测评结果"""
+    """
+    提交测评结果
+    - 量表配置了计分规则时按提交的作答结果在服务端计分，忽略客户端的分数和等级
+    - 未配置计分规则的量表沿用客户端提交的分数
+    """
     # 检查量表是否存在
     scale = db.query(TestScale).filter(TestScale.id == report_data.scale_id).first()
     if not scale:
         raise HTTPException(status_code=404, detail="测评量表不存在")
     
+    try:
+        compiled = scale_scoring.get_compiled(scale)
+    except scale_scoring.ScaleDefinitionError as exc:
+        logger.error("量表 %s 的计分规则有误：%s", scale.id, exc)
+        raise HTTPException(status_code=500, detail="测评量表配置有误，请联系管理员")
+    
+    if compiled is not None:
+        if report_data.answers is None:
+            raise HTTPException(status_code=400, detail="请提交作答结果")
+        try:
+            score, level, raw_score = compiled.score(report_data.answers)
+        except scale_scoring.AnswerError as exc:
+            raise HTTPException(status_code=400, detail=f"作答结果无效：{exc}")
+        
+        # 保留客户端附带的详细结果，作答和计分信息以服务端为准
+        result = {}
+        if report_data.result_json:
+            try:
+                parsed = json.loads(report_data.result_json)
+                if isinstance(parsed, dict):
+                    result = parsed
+            except ValueError:
+                pass
+        result.update(answers=report_data.answers, raw_score=raw_score, scale_version=compiled.version)
+        result_json = json.dumps(result, ensure_ascii=False)
+    else:
+        if report_data.score is None:
+            raise HTTPException(status_code=400, detail="请提交测评分数")
+        score, level, result_json = report_data.score, report_data.level, report_data.result_json
+    
     # 创建测评报告
     new_report = TestReport(
         user_id=current_user.id,
         scale_id=report_data.scale_id,
-        score=report_data.score,
-        level=report_data.level,
-        result_json=report_data.result_json
+        score=score,
+        level=level,
+        result_json=result_json
     )
     
     db.add(new_report)
+    stats_counters.record_test_report(db, current_user.id)
     db.commit()
     db.refresh(new_report)
     
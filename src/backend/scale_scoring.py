@@ -0,0 +1,242 @@
+"""
+测评量表计分
+量表的 questions_json 定义题目、选项分值、反向计分题和结果等级，服务端按作答结果计分，不再信任客户端提交的分数：
+{
+  "options": [{"text": "从不", "score": 0}, {"text": "偶尔", "score": 1}, ...],   # 各题默认选项
+  "questions": [
+    {"text": "...", "reverse": false},
+    {"text": "...", "reverse": true},                                           # 反向计分题
+    {"text": "...", "options": [{"text": "是", "score": 1}, {"text": "否", "score": 0}]}
+  ],
+  "multiplier": 1.25,                                                           # 可选，粗分换算标准分（如 SDS）
+  "levels": [{"min": 0, "level": "正常"}, {"min": 53, "level": "轻度抑郁"}, ...]  # 按分数下限划分等级
+}
+作答结果为每题所选选项的下标（从 0 开始）
+
+每个量表的定义只编译一次（按 questions_json 内容的摘要区分版本），编译结果为「题目 × 选项」分值表，
+反向计分题在编译时翻转分值；批量计分（导入历史答卷、重新计分）在安装了 NumPy 时按矩阵一次计算
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时批量计分逐行计算
+    np = None
+
+logger = logging.getLogger("heart_care.scale_scoring")
+
+
+class ScaleDefinitionError(ValueError):
+    """量表计分定义有误"""
+
+
+class AnswerError(ValueError):
+    """作答结果与量表不匹配"""
+
+
+def _option_scores(options: Any, where: str) -> Tuple[float, ...]:
+    if not isinstance(options, list) or not options:
+        raise ScaleDefinitionError(f"{where}缺少选项")
+    scores = []
+    for option in options:
+        score = option.get("score") if isinstance(option, dict) else option
+        if isinstance(score, bool) or not isinstance(score, (int, float)):
+            raise ScaleDefinitionError(f"{where}的选项分值无效：{option!r}")
+        scores.append(float(score))
+    return tuple(scores)
+
+
+class CompiledScale:
+    """编译后的量表计分规则"""
+
+    def __init__(self, version: str, table: Sequence[Sequence[float]], multiplier: float,
+                 level_mins: Sequence[float], level_names: Sequence[str]):
+        self.version = version
+        # table[i][j]：第 i 题选第 j 个选项的得分（反向计分已处理）
+        self.table = tuple(tuple(row) for row in table)
+        self.question_count = len(self.table)
+        self.multiplier = multiplier
+        self.level_mins = tuple(level_mins)
+        self.level_names = tuple(level_names)
+        self._arrays = None
+
+    def level_for(self, score: int) -> Optional[str]:
+        """分数对应的结果等级，低于最低下限时为 None"""
+        index = bisect_right(self.level_mins, score) - 1
+        return self.level_names[index] if index >= 0 else None
+
+    def _final_score(self, raw: float) -> int:
+        return int(round(raw * self.multiplier))
+
+    def score(self, answers: Sequence[int]) -> Tuple[int, Optional[str], float]:
+        """为一份作答计分，返回 (分数, 等级, 粗分)"""
+        if len(answers) != self.question_count:
+            raise AnswerError(f"应作答 {self.question_count} 题，实际提交 {len(answers)} 题")
+        raw = 0.0
+        for number, (row, answer) in enumerate(zip(self.table, answers), start=1):
+            if isinstance(answer, bool) or not isinstance(answer, int) or not 0 <= answer < len(row):
+                raise AnswerError(f"第 {number} 题的选项无效")
+            raw += row[answer]
+        score = self._final_score(raw)
+        return score, self.level_for(score), raw
+
+    def _numpy_arrays(self):
+        if self._arrays is None:
+            width = max(len(row) for row in self.table)
+            table = np.zeros((self.question_count, width), dtype=np.float64)
+            for i, row in enumerate(self.table):
+                table[i, :len(row)] = row
+            option_counts = np.array([len(row) for row in self.table], dtype=np.int64)
+            level_mins = np.array(self.level_mins, dtype=np.float64)
+            self._arrays = (table, option_counts, level_mins)
+        return self._arrays
+
+    def score_many(self, answer_rows: Sequence[Sequence[int]]) -> Tuple[List[Optional[int]], List[Optional[str]]]:
+        """
+        批量计分，返回 (分数列表, 等级列表)
+        与量表不匹配的作答（题数不符、选项越界）对应位置为 None
+        """
+        if np is None:
+            scores: List[Optional[int]] = []
+            levels: List[Optional[str]] = []
+            for answers in answer_rows:
+                try:
+                    score, level, _ = self.score(answers)
+                except AnswerError:
+                    score, level = None, None
+                scores.append(score)
+                levels.append(level)
+            return scores, levels
+
+        count = len(answer_rows)
+        if count == 0:
+            return [], []
+        table, option_counts, level_mins = self._numpy_arrays()
+
+        matrix = np.full((count, self.question_count), -1, dtype=np.int64)
+        valid = np.ones(count, dtype=bool)
+        for i, answers in enumerate(answer_rows):
+            if len(answers) == self.question_count:
+                # 与 score() 的校验一致只接受 int：不能交给 NumPy 把 1.9、'3'、True 转成整数
+                if all(isinstance(answer, int) and not isinstance(answer, bool) for answer in answers):
+                    try:
+                        matrix[i] = answers
+                        continue
+                    except OverflowError:
+                        pass
+            valid[i] = False
+        valid &= ((matrix >= 0) & (matrix < option_counts)).all(axis=1)
+
+        safe = np.where(valid[:, None], matrix, 0)
+        raw = table[np.arange(self.question_count), safe].sum(axis=1)
+        # 与 score() 一致：Python round 为银行家舍入，np.rint 同样如此
+        final = np.rint(raw * self.multiplier).astype(np.int64)
+        level_index = np.searchsorted(level_mins, final, side="right") - 1
+
+        scores = [int(value) if ok else None for value, ok in zip(final.tolist(), valid.tolist())]
+        levels = [
+            self.level_names[index] if ok and index >= 0 else None
+            for index, ok in zip(level_index.tolist(), valid.tolist())
+        ]
+        return scores, levels
+
+
+def definition_version(questions_json: str) -> str:
+    """量表定义的版本（内容摘要）"""
+    return hashlib.sha1(questions_json.encode("utf-8")).hexdigest()[:12]
+
+
+def compile_definition(questions_json: str) -> Optional[CompiledScale]:
+    """编译量表定义；未配置计分规则（无题目或无选项分值）时返回 None"""
+    version = definition_version(questions_json)
+    try:
+        definition = json.loads(questions_json)
+    except (TypeError, ValueError) as exc:
+        raise ScaleDefinitionError(f"题目定义不是有效的 JSON：{exc}")
+
+    # 兼容只存题目列表的旧格式
+    if isinstance(definition, list):
+        definition = {"questions": definition}
+    if not isinstance(definition, dict):
+        raise ScaleDefinitionError("题目定义格式无效")
+    questions = definition.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return None
+    default_options = definition.get("options")
+    if default_options is None and not all(isinstance(q, dict) and q.get("options") for q in questions):
+        return None
+
+    table = []
+    for number, question in enumerate(questions, start=1):
+        question = question if isinstance(question, dict) else {}
+        scores = _option_scores(question.get("options") or default_options, f"第 {number} 题")
+        table.append(scores[::-1] if question.get("reverse") else scores)
+
+    multiplier = definition.get("multiplier", 1)
+    if isinstance(multiplier, bool) or not isinstance(multiplier, (int, float)) or multiplier <= 0:
+        raise ScaleDefinitionError(f"换算系数无效：{multiplier!r}")
+
+    levels = []
+    for level in definition.get("levels") or []:
+        if not isinstance(level, dict) or not isinstance(level.get("min"), (int, float)) or not level.get("level"):
+            raise ScaleDefinitionError(f"结果等级无效：{level!r}")
+        levels.append((float(level["min"]), str(level["level"])))
+    levels.sort()
+
+    return CompiledScale(
+        version=version,
+        table=table,
+        multiplier=float(multiplier),
+        level_mins=[minimum for minimum, _ in levels],
+        level_names=[name for _, name in levels],
+    )
+
+
+# scale_id -> (版本, 编译结果)
+_compiled: Dict[int, Tuple[str, Optional[CompiledScale]]] = {}
+_lock = threading.Lock()
+
+
+def get_compiled(scale) -> Optional[CompiledScale]:
+    """
+    返回量表的编译结果（按定义版本缓存，定义修改后自动重新编译）
+    量表未配置计分规则时返回 None
+    """
+    questions_json = scale.questions_json
+    if not questions_json:
+        return None
+    version = definition_version(questions_json)
+    with _lock:
+        cached = _compiled.get(scale.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    compiled = compile_definition(questions_json)
+    with _lock:
+        _compiled[scale.id] = (version, compiled)
+    logger.info("已编译量表 %s 的计分规则（版本 %s）", scale.id, version)
+    return compiled
+
+
+def clear_cache() -> None:
+    """清空编译缓存"""
+    with _lock:
+        _compiled.clear()
+
+
+def answers_from_result(result_json: Optional[str]) -> Optional[List[Any]]:
+    """从报告的 result_json 中取出作答结果"""
+    if not result_json:
+        return None
+    try:
+        result = json.loads(result_json)
+    except (TypeError, ValueError):
+        return None
+    answers = result.get("answers") if isinstance(result, dict) else None
+    return answers if isinstance(answers, list) else None
@@ -5,7 +5,7 @@ Pydantic 模型定义
 
 from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from models import UserRole, Gender, AppointmentStatus, CounselorStatus
 
 
@@ -194,6 +194,7 @@ class CounselorResponse(BaseModel):
     qualification: Optional[str] = None
     consult_place: Optional[str] = None
     age: Optional[int] = None
+    total_consultations: Optional[int] = 0  # 累计完成咨询次数
     is_favorited: Optional[bool] = False  # 当前用户是否已收藏
 
     @model_validator(mode='before')
@@ -206,7 +207,7 @@ class CounselorResponse(BaseModel):
             for key in ['id', 'real_name', 'gender', 'specialty', 'experience_years', 
                        'fee', 'average_rating', 'review_count', 'status', 'created_at',
                        'bio', 'consult_methods', 'avatar', 'intro', 'qualification', 
-                       'consult_place', 'age', 'is_favorited']:
+                       'consult_place', 'age', 'total_consultations', 'is_favorited']:
                 if hasattr(data, key):
                     value = getattr(data, key, None)
                     # 处理 None 值
@@ -216,6 +217,8 @@ class CounselorResponse(BaseModel):
                         value = 0
                     elif key == 'fee' and value is None:
                         value = 0.0
+                    elif key == 'total_consultations' and value is None:
+                        value = 0
                     elif key == 'is_favorited' and value is None:
                         value = False
                     data_dict[key] = value
@@ -343,6 +346,7 @@ class AppointmentResponse(BaseModel):
     consult_method: str  # 咨询方式（直接存储中文：线上视频、线下面谈、语音咨询、文字咨询）
     consult_method_display: Optional[str] = None  # 咨询方式中文显示（与consult_method相同，保持兼容）
     appointment_date: datetime
+    end_time: Optional[datetime] = None  # 预约结束时间
     status: AppointmentStatus
     status_display: Optional[str] = None  # 状态中文显示
     description: Optional[str] = None
@@ -389,9 +393,14 @@ class TestScaleResponse(BaseModel):
 
 
 class TestReportCreate(BaseModel):
-    """提交测评"""
+    """
+    提交测评
+    量表配置了计分规则时提交 answers（每题所选选项的下标），分数和等级由服务端计算；
+    score、level 仅用于未配置计分规则的量表
+    """
     scale_id: int
-    score: int
+    answers: Optional[List[int]] = None
+    score: Optional[int] = None
     level: Optional[str] = None
     result_json: Optional[str] = None
 
@@ -497,6 +506,7 @@ class ConsultationRecordResponse(BaseModel):
     consult_type: Optional[str] = None
     consult_method: Optional[str] = None
     appointment_date: Optional[datetime] = None
+    end_time: Optional[datetime] = None  # 预约结束时间
     description: Optional[str] = None
     summary: Optional[str] = None  # 咨询师填写的小结
     rating: Optional[int] = None  # 用户评分 1-5
@@ -520,6 +530,20 @@ class ConsultationRecordResponse(BaseModel):
 
 
 # ============ 统计数据 ============
+class DailyStatistics(BaseModel):
+    """平台每日统计"""
+    day: date
+    signups: int
+    active_users: int
+    appointments: int
+    appointments_pending: int
+    appointments_confirmed: int
+    appointments_completed: int
+    appointments_cancelled: int
+    completed_sessions: int
+    tests: int
+
+
 class Statistics(BaseModel):
     """平台统计数据"""
     total_users: int
@@ -528,3 +552,7 @@ class Statistics(BaseModel):
     total_tests: int
     active_users_month: int
     appointments_month: int
+    new_users_month: int = 0
+    completed_sessions_month: int = 0
+    tests_month: int = 0
+    series: List[DailyStatistics] = []  # 最近 90 天逐日数据
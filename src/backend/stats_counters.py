@@ -0,0 +1,307 @@
+"""
+仪表盘计数维护
+用户端 /api/users/stats 和咨询师端 /api/counselors/stats/mine 读取 stats_counters 表的单行数据，
+预约、评分、测评的写入路径在同一事务中增量更新计数；计数行不存在时从业务表现算一次
+咨询师表的 total_consultations（已完成预约数）随预约状态变化同步增减
+"""
+
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import (
+    Appointment,
+    AppointmentStatus,
+    Counselor,
+    CounselorRating,
+    StatsCounter,
+    TestReport,
+    UserFavorite,
+)
+
+logger = logging.getLogger("heart_care.stats_counters")
+
+OWNER_USER = "user"
+OWNER_COUNSELOR = "counselor"
+
+GOOD_RATING_THRESHOLD = 4
+
+COUNTER_COLUMNS = (
+    "pending_appointments",
+    "completed_appointments",
+    "test_reports",
+    "favorites",
+    "rating_count",
+    "rating_sum",
+    "good_rating_count",
+)
+
+# (待确认, 用户端已完成, 咨询师端已完成)
+AppointmentState = Tuple[bool, bool, bool]
+
+
+def appointment_state(appointment: Optional[Appointment]) -> AppointmentState:
+    """
+    预约在计数中的归属
+    - 用户端「已完成」：状态为已完成，或已确认且双方都确认结束
+    - 咨询师端「已完成」：状态为已完成
+    """
+    if appointment is None:
+        return (False, False, False)
+    status = appointment.status
+    counselor_completed = status == AppointmentStatus.COMPLETED
+    user_completed = counselor_completed or (
+        status == AppointmentStatus.CONFIRMED
+        and bool(appointment.user_confirmed_complete)
+        and bool(appointment.counselor_confirmed_complete)
+    )
+    return (status == AppointmentStatus.PENDING, user_completed, counselor_completed)
+
+
+def _user_completed_filter():
+    return or_(
+        Appointment.status == AppointmentStatus.COMPLETED,
+        and_(
+            Appointment.status == AppointmentStatus.CONFIRMED,
+            Appointment.user_confirmed_complete.is_(True),
+            Appointment.counselor_confirmed_complete.is_(True),
+        ),
+    )
+
+
+def _compute_user_counters(db: Session, user_id: int) -> Dict[str, int]:
+    """从业务表计算单个用户的计数"""
+    pending, completed = db.query(
+        func.sum(case((Appointment.status == AppointmentStatus.PENDING, 1), else_=0)),
+        func.sum(case((_user_completed_filter(), 1), else_=0)),
+    ).filter(Appointment.user_id == user_id).one()
+    test_reports = db.query(func.count(TestReport.id)).filter(TestReport.user_id == user_id).scalar()
+    favorites = db.query(func.count(UserFavorite.id)).filter(UserFavorite.user_id == user_id).scalar()
+    return {
+        "pending_appointments": int(pending or 0),
+        "completed_appointments": int(completed or 0),
+        "test_reports": int(test_reports or 0),
+        "favorites": int(favorites or 0),
+    }
+
+
+def _compute_counselor_counters(db: Session, counselor_id: int) -> Dict[str, int]:
+    """从业务表计算单个咨询师的计数"""
+    pending, completed = db.query(
+        func.sum(case((Appointment.status == AppointmentStatus.PENDING, 1), else_=0)),
+        func.sum(case((Appointment.status == AppointmentStatus.COMPLETED, 1), else_=0)),
+    ).filter(Appointment.counselor_id == counselor_id).one()
+    rating_count, rating_sum, good_rating_count = db.query(
+        func.count(CounselorRating.id),
+        func.sum(CounselorRating.rating),
+        func.sum(case((CounselorRating.rating >= GOOD_RATING_THRESHOLD, 1), else_=0)),
+    ).filter(CounselorRating.counselor_id == counselor_id).one()
+    return {
+        "pending_appointments": int(pending or 0),
+        "completed_appointments": int(completed or 0),
+        "rating_count": int(rating_count or 0),
+        "rating_sum": int(rating_sum or 0),
+        "good_rating_count": int(good_rating_count or 0),
+    }
+
+
+def _compute_counters(db: Session, owner_type: str, owner_id: int) -> Dict[str, int]:
+    if owner_type == OWNER_USER:
+        return _compute_user_counters(db, owner_id)
+    return _compute_counselor_counters(db, owner_id)
+
+
+def _insert_counters(db: Session, owner_type: str, owner_id: int) -> bool:
+    """
+    从业务表现算并插入计数行（调用前需 flush，使本事务内的写入也计入）
+    并发插入冲突时返回 False，由调用方改走增量更新
+    """
+    values = {column: 0 for column in COUNTER_COLUMNS}
+    values.update(_compute_counters(db, owner_type, owner_id))
+    savepoint = db.begin_nested()
+    try:
+        db.add(StatsCounter(owner_type=owner_type, owner_id=owner_id, **values))
+        db.flush()
+        savepoint.commit()
+        return True
+    except IntegrityError:
+        savepoint.rollback()
+        return False
+
+
+def _adjust(db: Session, owner_type: str, owner_id: Optional[int], **deltas: int) -> None:
+    """按增量更新计数行；行不存在时整行现算"""
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if owner_id is None or not deltas:
+        return
+
+    db.flush()
+    updated = db.query(StatsCounter).filter(
+        StatsCounter.owner_type == owner_type,
+        StatsCounter.owner_id == owner_id
+    ).update(
+        {getattr(StatsCounter, column): getattr(StatsCounter, column) + delta for column, delta in deltas.items()},
+        synchronize_session=False
+    )
+    if updated:
+        return
+    if _insert_counters(db, owner_type, owner_id):
+        return
+    # 其他请求刚插入了计数行，重新按增量更新
+    db.query(StatsCounter).filter(
+        StatsCounter.owner_type == owner_type,
+        StatsCounter.owner_id == owner_id
+    ).update(
+        {getattr(StatsCounter, column): getattr(StatsCounter, column) + delta for column, delta in deltas.items()},
+        synchronize_session=False
+    )
+
+
+def record_appointment_change(
+    db: Session,
+    appointment: Appointment,
+    before: Optional[AppointmentState] = None,
+) -> None:
+    """
+    预约新增或状态变化后更新双方计数（在 commit 之前调用）
+    before 为修改前的 appointment_state()，新建预约时不传
+    """
+    old_pending, old_user_completed, old_counselor_completed = before or appointment_state(None)
+    new_pending, new_user_completed, new_counselor_completed = appointment_state(appointment)
+    pending_delta = int(new_pending) - int(old_pending)
+
+    _adjust(
+        db, OWNER_USER, appointment.user_id,
+        pending_appointments=pending_delta,
+        completed_appointments=int(new_user_completed) - int(old_user_completed),
+    )
+    counselor_completed_delta = int(new_counselor_completed) - int(old_counselor_completed)
+    _adjust(
+        db, OWNER_COUNSELOR, appointment.counselor_id,
+        pending_appointments=pending_delta,
+        completed_appointments=counselor_completed_delta,
+    )
+    if counselor_completed_delta and appointment.counselor_id is not None:
+        # 单条 UPDATE 原子增减，不在 Python 中读改写
+        db.execute(
+            update(Counselor).where(Counselor.id == appointment.counselor_id).values(
+                total_consultations=func.coalesce(Counselor.total_consultations, 0) + counselor_completed_delta
+            ).execution_options(synchronize_session=False)
+        )
+
+
+def record_rating_change(
+    db: Session,
+    counselor_id: Optional[int],
+    old_rating: Optional[int],
+    new_rating: int,
+) -> None:
+    """新增或修改评分后更新咨询师评分计数（old_rating 为空表示新增）"""
+    _adjust(
+        db, OWNER_COUNSELOR, counselor_id,
+        rating_count=0 if old_rating is not None else 1,
+        rating_sum=new_rating - (old_rating or 0),
+        good_rating_count=int(new_rating >= GOOD_RATING_THRESHOLD)
+        - int(old_rating is not None and old_rating >= GOOD_RATING_THRESHOLD),
+    )
+
+
+def record_test_report(db: Session, user_id: int) -> None:
+    """新增测评报告后更新用户计数"""
+    _adjust(db, OWNER_USER, user_id, test_reports=1)
+
+
+def get_counters(db: Session, owner_type: str, owner_id: int) -> StatsCounter:
+    """按主键读取计数行，不存在时现算并写入"""
+    counters = db.get(StatsCounter, (owner_type, owner_id))
+    if counters is not None:
+        return counters
+
+    try:
+        _insert_counters(db, owner_type, owner_id)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("初始化计数失败 %s:%s：%s", owner_type, owner_id, exc)
+    counters = db.get(StatsCounter, (owner_type, owner_id))
+    if counters is None:
+        values = {column: 0 for column in COUNTER_COLUMNS}
+        values.update(_compute_counters(db, owner_type, owner_id))
+        counters = StatsCounter(owner_type=owner_type, owner_id=owner_id, **values)
+    return counters
+
+
+def rebuild_counters(db: Session) -> Dict[str, int]:
+    """
+    用分组查询重建全部计数行（修复漂移）
+    返回各类型重建的行数
+    """
+    user_rows: Dict[int, Dict[str, int]] = {}
+    counselor_rows: Dict[int, Dict[str, int]] = {}
+
+    def _row(rows: Dict[int, Dict[str, int]], owner_id: int) -> Dict[str, int]:
+        return rows.setdefault(owner_id, {column: 0 for column in COUNTER_COLUMNS})
+
+    for user_id, pending, completed in db.query(
+        Appointment.user_id,
+        func.sum(case((Appointment.status == AppointmentStatus.PENDING, 1), else_=0)),
+        func.sum(case((_user_completed_filter(), 1), else_=0)),
+    ).filter(Appointment.user_id.isnot(None)).group_by(Appointment.user_id).all():
+        row = _row(user_rows, user_id)
+        row["pending_appointments"] = int(pending or 0)
+        row["completed_appointments"] = int(completed or 0)
+
+    for user_id, count in db.query(
+        TestReport.user_id, func.count(TestReport.id)
+    ).filter(TestReport.user_id.isnot(None)).group_by(TestReport.user_id).all():
+        _row(user_rows, user_id)["test_reports"] = int(count)
+
+    for user_id, count in db.query(
+        UserFavorite.user_id, func.count(UserFavorite.id)
+    ).filter(UserFavorite.user_id.isnot(None)).group_by(UserFavorite.user_id).all():
+        _row(user_rows, user_id)["favorites"] = int(count)
+
+    for counselor_id, pending, completed in db.query(
+        Appointment.counselor_id,
+        func.sum(case((Appointment.status == AppointmentStatus.PENDING, 1), else_=0)),
+        func.sum(case((Appointment.status == AppointmentStatus.COMPLETED, 1), else_=0)),
+    ).filter(Appointment.counselor_id.isnot(None)).group_by(Appointment.counselor_id).all():
+        row = _row(counselor_rows, counselor_id)
+        row["pending_appointments"] = int(pending or 0)
+        row["completed_appointments"] = int(completed or 0)
+
+    for counselor_id, count, total, good in db.query(
+        CounselorRating.counselor_id,
+        func.count(CounselorRating.id),
+        func.sum(CounselorRating.rating),
+        func.sum(case((CounselorRating.rating >= GOOD_RATING_THRESHOLD, 1), else_=0)),
+    ).filter(CounselorRating.counselor_id.isnot(None)).group_by(CounselorRating.counselor_id).all():
+        row = _row(counselor_rows, counselor_id)
+        row["rating_count"] = int(count or 0)
+        row["rating_sum"] = int(total or 0)
+        row["good_rating_count"] = int(good or 0)
+
+    db.query(StatsCounter).delete(synchronize_session=False)
+    repaired = repair_total_consultations(db)
+    db.add_all(
+        [StatsCounter(owner_type=OWNER_USER, owner_id=owner_id, **values) for owner_id, values in user_rows.items()]
+        + [StatsCounter(owner_type=OWNER_COUNSELOR, owner_id=owner_id, **values) for owner_id, values in counselor_rows.items()]
+    )
+    db.commit()
+    return {OWNER_USER: len(user_rows), OWNER_COUNSELOR: len(counselor_rows), "total_consultations": repaired}
+
+
+def repair_total_consultations(db: Session) -> int:
+    """把 counselors.total_consultations 改为实际的已完成预约数，只改写不一致的行，返回修正行数（调用方负责 commit）"""
+    actual = select(func.count(Appointment.id)).where(
+        Appointment.counselor_id == Counselor.id,
+        Appointment.status == AppointmentStatus.COMPLETED,
+    ).scalar_subquery()
+    return db.execute(
+        update(Counselor).where(func.coalesce(Counselor.total_consultations, -1) != actual).values(
+            total_consultations=actual
+        ).execution_options(synchronize_session=False)
+    ).rowcount
@@ -1,21 +1,34 @@
 """
 同步本地MySQL数据库的所有数据到云端PostgreSQL数据库
-按照外键依赖顺序同步所有表
+按 models.py 中的外键关系构建依赖图，互不依赖的表在线程池中并行同步（父表同步完成后才开始同步子表）
 如果用户密码哈希为空或无效，默认设置为123456
+增量同步（选项 3 或 --delta 参数）：按检查点文件中记录的各表水位，只同步上次同步后新增或修改的行
+- 有 updated_at 的表按 COALESCE(updated_at, created_at) 水位同步新增和修改的行
+- SYNC_APPEND_ONLY_TABLES 中只插入、不原地修改的表按 created_at（没有时按主键）水位只同步新增的行
+- 其他表（会被原地修改但没有 updated_at，如 community_posts、comments、test_reports、private_messages、
+  counselor_ratings、counselor_schedules、login_identifiers）每次增量同步都按主键顺序分批全表重新同步
+- 删除不会同步到云端
 """
 
 import os
 import sys
+import json
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from datetime import datetime, timedelta
 
 # 添加项目根目录到路径
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(PROJECT_ROOT / "src" / "backend"))
 
 from dotenv import load_dotenv, dotenv_values
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import bindparam, create_engine, text, inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import IntegrityError
 import pymysql
@@ -33,30 +46,71 @@ for env_file in ENV_FILES:
 
 # 导入密码哈希函数
 from auth import get_password_hash
+from models import Base
+
+# 每批写入的行数（可通过 SYNC_BATCH_SIZE 调整）
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500"))
+# PostgreSQL 单条语句的参数上限
+MAX_STATEMENT_PARAMS = 65535
+# 增量同步的检查点文件（记录每个云端库各表已同步到的水位）
+CHECKPOINT_FILE = Path(os.getenv("SYNC_CHECKPOINT_FILE", str(Path(__file__).with_name(".cloud_sync_checkpoint.json"))))
+# 增量同步时时间水位回退的秒数，补上时间戳早于水位、但在上次同步之后才提交的行
+SYNC_DELTA_OVERLAP_SECONDS = int(os.getenv("SYNC_DELTA_OVERLAP_SECONDS", "60"))
+
+# 读取线程最多领先写入的批数：每个表同时在内存中的数据不超过约 (SYNC_QUEUE_CHUNKS + 2) 批
+SYNC_QUEUE_CHUNKS = max(1, int(os.getenv("SYNC_QUEUE_CHUNKS", "2")))
+# 并行同步的线程数（每个线程各自持有本地和云端连接）
+SYNC_WORKERS = max(1, int(os.getenv("SYNC_WORKERS", "4")))
+# 不同步的表：统计汇总任务的水位属于各库自己的任务状态，云端首次汇总时会全量重算
+SYNC_EXCLUDED_TABLES = {"stats_watermarks"}
+# 只插入或删除、从不原地修改的表，增量同步时只需同步水位之后新增的行
+# 新增表或修改已有表的写入方式时需同步维护：会被原地修改的表不能放在这里，否则增量同步会漏掉修改
+SYNC_APPEND_ONLY_TABLES = {
+    "system_logs",
+    "post_reports",
+    "content_likes",
+    "user_favorites",
+    "counselor_favorites",
+    "user_blocks",
+    "counselor_specialties",  # 标签变更时整体删除后重新插入
+    "counselor_consult_methods",
+}
+
+# 检查点和输出由多个同步线程共享
+_checkpoint_lock = threading.Lock()
+_print_lock = threading.Lock()
+
+
+def build_sync_dag() -> Dict[str, Set[str]]:
+    """
+    从 models.py 的表定义构建同步依赖图：表名 -> 需要先同步的父表（外键引用的表）
+    按拓扑顺序返回（父表在前），忽略自引用
+    """
+    dag: Dict[str, Set[str]] = {}
+    for table in Base.metadata.sorted_tables:
+        if table.name in SYNC_EXCLUDED_TABLES:
+            continue
+        dag[table.name] = {
+            fk.column.table.name
+            for fk in table.foreign_keys
+            if fk.column.table.name != table.name and fk.column.table.name not in SYNC_EXCLUDED_TABLES
+        }
+    return dag
+
+
+TABLE_SYNC_DAG = build_sync_dag()
 
-# 表同步顺序（按照外键依赖关系）
-TABLE_SYNC_ORDER = [
-    "users",                    # 1. 用户表（无依赖）
-    "test_scales",              # 2. 测评量表（无依赖）
-    "counselors",               # 3. 咨询师（依赖 users）
-    "counselor_schedules",      # 4. 咨询师日程（依赖 counselors）
-    "counselor_unavailable",    # 5. 咨询师不可预约时段（依赖 counselors）
-    "contents",                 # 6. 内容（无依赖）
-    "appointments",             # 7. 预约（依赖 users, counselors）
-    "consultation_records",     # 8. 咨询记录（依赖 appointments, users, counselors）
-    "counselor_ratings",        # 9. 咨询师评分（依赖 appointments, users, counselors）
-    "test_reports",             # 10. 测评报告（依赖 users, test_scales）
-    "community_posts",          # 11. 社区帖子（依赖 users）
-    "comments",                 # 12. 评论（依赖 community_posts, users）
-    "post_reports",             # 13. 帖子举报（依赖 community_posts, users）
-    "user_favorites",           # 14. 用户收藏（依赖 users）
-    "counselor_favorites",      # 15. 咨询师收藏（依赖 users, counselors）
-    "content_likes",            # 16. 内容点赞（依赖 users）
-    "private_messages",         # 17. 私信（依赖 users）
-    "emergency_helps",          # 18. 紧急求助（依赖 users）
-    "user_blocks",              # 19. 用户拉黑（依赖 users）
-    "system_logs",              # 20. 系统日志（依赖 users）
-]
+
+def _table_printer(table_name: str) -> Callable[..., None]:
+    """返回带表名前缀的输出函数，并行同步时各表的输出按行不交错"""
+    prefix = f"[{table_name}] "
+    
+    def log(message: Any = "") -> None:
+        lines = str(message).lstrip("\n").split("\n")
+        with _print_lock:
+            print("\n".join(prefix + line for line in lines), flush=True)
+    
+    return log
 
 
 def get_local_db_url() -> str:
@@ -120,7 +174,10 @@ def get_cloud_db_url() -> str:
 
 
 def convert_mysql_to_postgres_value(value: Any, column_type: str, column_name: str = None, cloud_engine=None, table_name: str = None) -> Any:
-    """将MySQL值转换为PostgreSQL兼容的值"""
+    """
+    将MySQL值转换为PostgreSQL兼容的值（逐值判断的参考实现）
+    同步时使用 compile_row_transformer 按表编译出的转换函数，结果与本函数一致（bench_sync_transform.py 对比校验）
+    """
     if value is None:
         return None
     
@@ -310,21 +367,305 @@ def get_table_columns(engine, table_name: str) -> List[Dict[str, Any]]:
     return columns
 
 
+# 转为布尔值时视为真的字符串
+_TRUE_STRINGS = frozenset(('1', 'true', 'yes', 'on'))
+
+# 枚举列：列名 -> (原值 -> 小写枚举值, 无法识别时的默认值)
+_GENDER_VALUES = {
+    **dict.fromkeys(('male', 'm', '男', '1'), 'male'),
+    **dict.fromkeys(('female', 'f', '女', '2'), 'female'),
+    **dict.fromkeys(('other', 'o', '其他', '3', ''), 'other'),
+}
+_ROLE_VALUES = {value: value for value in ('user', 'counselor', 'volunteer', 'admin')}
+_STATUS_VALUES = {
+    value: value
+    for value in ('pending', 'confirmed', 'completed', 'cancelled', 'rejected', 'active', 'inactive')
+}
+
+
+@lru_cache(maxsize=None)
+def _default_password_hash(default_password: str) -> str:
+    """默认密码的哈希（每次运行只计算一次，所有需要重置的用户共用）"""
+    return get_password_hash(default_password)
+
+
+def _to_bool(value: Any) -> Any:
+    if isinstance(value, (int, bool)):
+        return bool(value)
+    if isinstance(value, str):
+        return value.lower() in _TRUE_STRINGS
+    return value
+
+
+def _enum_converter(values: Dict[str, str], default: str, upper: bool) -> Callable[[Any], Any]:
+    if upper:
+        values = {key: value.upper() for key, value in values.items()}
+        default = default.upper()
+    
+    def convert(value: Any) -> Any:
+        if isinstance(value, str):
+            return values.get(value.lower().strip(), default)
+        return value
+    
+    return convert
+
+
+def _pg_enum_is_upper(cloud_engine, enum_name: str) -> bool:
+    """云端 PostgreSQL 枚举类型是否使用大写值"""
+    pg_values = get_pg_enum_values(cloud_engine, enum_name) if cloud_engine else []
+    return bool(pg_values) and pg_values[0].isupper()
+
+
+def _column_converter(column_type: Optional[str], column_name: str, table_name: str, cloud_engine) -> Optional[Callable[[Any], Any]]:
+    """按列类型和列名选择转换函数，不需要转换的列返回 None（与 convert_mysql_to_postgres_value 的判断顺序一致）"""
+    if column_type is None:
+        return None
+    column_type = column_type.lower()
+    if 'tinyint' in column_type or 'boolean' in column_type:
+        return _to_bool
+    if column_name == 'gender':
+        return _enum_converter(_GENDER_VALUES, 'other', _pg_enum_is_upper(cloud_engine, 'gender'))
+    if column_name == 'role':
+        return _enum_converter(_ROLE_VALUES, 'user', _pg_enum_is_upper(cloud_engine, 'userrole'))
+    if column_name == 'status':
+        enum_name = 'counselorstatus' if table_name == 'counselors' else 'appointmentstatus'
+        return _enum_converter(_STATUS_VALUES, 'pending', _pg_enum_is_upper(cloud_engine, enum_name))
+    return None
+
+
+def compile_row_transformer(
+    table_name: str,
+    common_columns: List[str],
+    column_types: Dict[str, str],
+    pk_column: Optional[str],
+    cloud_engine,
+    default_password: str,
+    log: Callable[..., None] = print,
+) -> Callable[[Sequence[Any]], List[Any]]:
+    """
+    按表编译行转换函数：每列的转换规则只判断一次，得到逐列的转换函数元组（不需要转换的列为 None）
+    返回的函数把本地一行（按 common_columns 顺序，多出的列忽略）转换为云端可写入的值列表
+    users 表 password_hash 为空或无效时替换为默认密码的哈希
+    """
+    converters = tuple(
+        _column_converter(column_types.get(col_name), col_name, table_name, cloud_engine)
+        for col_name in common_columns
+    )
+    pk_index = common_columns.index(pk_column) if pk_column in common_columns else None
+    password_index = (
+        common_columns.index("password_hash")
+        if table_name == "users" and "password_hash" in common_columns else None
+    )
+    
+    def transform(row: Sequence[Any]) -> List[Any]:
+        values = [
+            value if convert is None or value is None else convert(value)
+            for convert, value in zip(converters, row)
+        ]
+        if password_index is not None:
+            password_hash = values[password_index]
+            # 如果密码哈希为空或无效，使用默认密码
+            if not password_hash or len(password_hash) < 10:
+                values[password_index] = _default_password_hash(default_password)
+                if pk_index is not None and values[pk_index]:
+                    log(f"  🔑 用户ID {values[pk_index]}: 密码已重置为默认密码")
+        return values
+    
+    return transform
+
+
+def _build_upsert_sql(table_name: str, common_columns: List[str], pk_column: Optional[str], row_count: int) -> str:
+    """构建 row_count 行的多行 VALUES 插入语句（有主键时按主键 UPSERT），参数名为 p{行}_{列}"""
+    columns_str = ", ".join([f'"{col}"' for col in common_columns])
+    values_str = ", ".join(
+        "(" + ", ".join(f":p{r}_{c}" for c in range(len(common_columns))) + ")"
+        for r in range(row_count)
+    )
+    
+    if pk_column and pk_column in common_columns:
+        # 有主键，使用ON CONFLICT DO UPDATE
+        update_set = ", ".join([
+            f'"{col}" = EXCLUDED."{col}"'
+            for col in common_columns
+            if col != pk_column
+        ])
+        conflict = f'ON CONFLICT ("{pk_column}") DO UPDATE SET {update_set}' if update_set else "ON CONFLICT DO NOTHING"
+    else:
+        # 无主键或主键不在列中，直接INSERT
+        conflict = "ON CONFLICT DO NOTHING"
+    
+    return f'INSERT INTO "{table_name}" ({columns_str}) VALUES {values_str} {conflict}'
+
+
+@lru_cache(maxsize=64)
+def _param_names(row_count: int, column_count: int) -> Tuple[str, ...]:
+    """_build_upsert_sql 中按行展开的参数名"""
+    return tuple(f"p{r}_{c}" for r in range(row_count) for c in range(column_count))
+
+
+def _batch_params(rows_values: List[List[Any]], column_count: int) -> Dict[str, Any]:
+    return dict(zip(_param_names(len(rows_values), column_count), chain.from_iterable(rows_values)))
+
+
+def _short_error(e: Exception, limit: int) -> str:
+    error_msg = str(e.orig) if isinstance(e, IntegrityError) and hasattr(e, 'orig') else str(e)
+    # 截断过长的错误信息
+    return error_msg[:limit] + "..." if len(error_msg) > limit else error_msg
+
+
+class SyncReadError(Exception):
+    """读取本地数据失败（由读取线程抛出，在写入方重新抛出）"""
+
+
+class _ReadError:
+    """读取线程中的异常，经队列转交给写入方"""
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END_OF_STREAM = object()
+
+
+def _stream_chunks(read_chunks: Callable[[], Iterable[List[Any]]], queue_size: int = SYNC_QUEUE_CHUNKS) -> Iterator[List[Any]]:
+    """
+    在后台线程中运行 read_chunks()，读出的批次经有界队列逐批交给调用方写入，读取和写入交错进行
+    队列满时读取线程等待，内存中的批数固定；读取出错时在调用方抛出 SyncReadError
+    调用方提前结束迭代（写入出错）时通知读取线程停止并等待其关闭本地连接
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def reader():
+        try:
+            for chunk in read_chunks():
+                if not put(chunk):
+                    return
+            put(_END_OF_STREAM)
+        except BaseException as e:
+            put(_ReadError(e))
+    
+    thread = threading.Thread(target=reader, name=f"{threading.current_thread().name}-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, _ReadError):
+                raise SyncReadError(str(item.error)) from item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def load_checkpoints() -> Dict[str, Any]:
+    """读取增量同步检查点文件（不存在或损坏时返回空）"""
+    if not CHECKPOINT_FILE.exists():
+        return {}
+    try:
+        return json.loads(CHECKPOINT_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"⚠️  读取检查点文件失败，将全量同步: {e}")
+        return {}
+
+
+def save_checkpoints(checkpoints: Dict[str, Any]) -> None:
+    """写入检查点文件（先写临时文件再替换，中断时不会留下半个文件）"""
+    tmp_file = CHECKPOINT_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(checkpoints, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+
+def get_checkpoint_target(cloud_url: str) -> str:
+    """检查点按云端数据库区分（不含账号密码）"""
+    return cloud_url.split('@')[-1]
+
+
+def _delta_mode(table_name: str, common_columns: List[str]) -> Tuple[str, List[str]]:
+    """
+    表的增量同步方式和用作时间水位的列
+    - timestamp：有 updated_at 的表以 COALESCE(updated_at, created_at) 为水位；只插入的表以 created_at 为水位
+    - pk：没有 created_at 的只插入表以主键为水位
+    - full：会被原地修改但没有 updated_at 的表没有可靠的水位，每次按主键顺序全表重新同步
+    """
+    if "updated_at" in common_columns:
+        return "timestamp", [col for col in ("updated_at", "created_at") if col in common_columns]
+    if table_name not in SYNC_APPEND_ONLY_TABLES:
+        return "full", []
+    if "created_at" in common_columns:
+        return "timestamp", ["created_at"]
+    return "pk", []
+
+
+def _watermark_expr(ts_columns: List[str]) -> str:
+    if len(ts_columns) == 1:
+        return f"`{ts_columns[0]}`"
+    return "COALESCE(" + ", ".join(f"`{col}`" for col in ts_columns) + ")"
+
+
+def _mark_value(value: Any) -> Any:
+    """水位值转为可写入 JSON 的形式"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _parse_mark_ts(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
 def sync_table(
     local_engine,
     cloud_engine,
     table_name: str,
-    default_password: str = "123456"
+    default_password: str = "123456",
+    batch_size: int = SYNC_BATCH_SIZE,
+    checkpoints: Optional[Dict[str, Any]] = None,
+    persist_checkpoints: Optional[Callable[[], None]] = None,
+    delta: bool = False
 ) -> tuple[int, int]:
     """
     同步单个表的数据
+    按 batch_size 行一批转换，每批用一条多行 VALUES 的 INSERT ... ON CONFLICT 写入并提交；
+    整批失败时回滚该批，改为逐行（每行一个 savepoint）写入，隔离并报告出错的行
+    
+    checkpoints 为当前云端库的检查点（表名 -> 水位），传入时同步后更新水位并调用 persist_checkpoints 保存，
+    水位方式见 _delta_mode：
+    - delta 为 True 时只读取水位之后的行，按水位顺序分批读取，每批提交后立即保存检查点，中断后从最后提交的批次继续
+    - full 方式的表在 delta 为 True 时按主键顺序分批读取全表，每批提交后在检查点中记录读到的主键（pass_pk），
+      中断后从该主键继续，读完后清除，下次增量同步重新从头读取
+    - 还没有检查点的表在 delta 为 True 时同样分批读取并逐批保存检查点：pk 方式从空水位开始按主键读取；
+      timestamp 方式先记下当前最大时间，再按主键顺序读取全表（记录 pass_pk），读完后以该时间为水位
+    
+    读取在单独的线程中进行（全量同步用服务端游标流式读取），经有界队列把批次交给写入方，
+    读取和写入交错进行，内存占用与表的大小无关
+    - 没有主键的表无法记录水位，每次全量同步
+    - 写入失败的行（如父表对应的行同步失败导致外键错误）的主键记入检查点的 retry 列表，
+      下次增量同步先按主键重试这些行，水位照常推进，失败的行不会因水位越过而被遗漏
+    
+    可在多个线程中同时同步不同的表：每个表使用各自的连接，检查点在锁内更新和保存，输出带表名前缀
     
     Returns:
         (成功数量, 失败数量)
     """
-    print(f"\n{'='*60}")
-    print(f"同步表: {table_name}")
-    print(f"{'='*60}")
+    log = _table_printer(table_name)
+    log("开始同步")
     
     # 获取列信息
     local_columns = get_table_columns(local_engine, table_name)
@@ -336,175 +677,362 @@ def sync_table(
     common_columns = sorted(local_column_names & cloud_column_names)
     
     if not common_columns:
-        print(f"⚠️  警告: 表 {table_name} 没有共同列，跳过")
+        log(f"⚠️  警告: 表 {table_name} 没有共同列，跳过")
         return 0, 0
     
+    column_types = {col['name']: str(col['type']) for col in local_columns}
+    
     # 获取主键列
     local_inspector = inspect(local_engine)
-    cloud_inspector = inspect(cloud_engine)
     local_pk = local_inspector.get_pk_constraint(table_name)
-    cloud_pk = cloud_inspector.get_pk_constraint(table_name)
     pk_column = local_pk.get('constrained_columns', [None])[0] if local_pk else None
+    pk_index = common_columns.index(pk_column) if pk_column in common_columns else None
     
-    # 从本地数据库读取数据
-    with local_engine.connect() as local_conn:
-        # 构建SELECT查询
-        columns_str = ", ".join([f"`{col}`" for col in common_columns])
-        query = f"SELECT {columns_str} FROM `{table_name}`"
-        
-        try:
-            result = local_conn.execute(text(query))
-            rows = result.fetchall()
-            print(f"📊 本地数据库找到 {len(rows)} 条记录")
-        except Exception as e:
-            print(f"❌ 读取本地数据失败: {e}")
-            return 0, 0
+    # 水位定义（复合主键的表无法按单列主键分批读取，与没有主键的表一样每次全量同步）
+    single_pk = pk_index is not None and len(local_pk.get('constrained_columns') or []) == 1
+    mark_mode, ts_columns = _delta_mode(table_name, common_columns) if single_pk else (None, [])
+    ts_expr = _watermark_expr(ts_columns) if ts_columns else None
+    saved_mark = (checkpoints or {}).get(table_name)
+    if saved_mark and (saved_mark.get("mode") != mark_mode or saved_mark.get("columns", []) != ts_columns):
+        log("ℹ️  表结构与检查点不一致，本次全量同步")
+        saved_mark = None
     
-    if not rows:
-        print(f"ℹ️  表 {table_name} 没有数据，跳过")
-        return 0, 0
+    # PostgreSQL 单条语句最多 65535 个参数
+    batch_size = max(1, min(batch_size, MAX_STATEMENT_PARAMS // len(common_columns)))
+    column_count = len(common_columns)
+    single_row_sql = text(_build_upsert_sql(table_name, common_columns, pk_column, 1))
+    batch_sql_cache: Dict[int, Any] = {}
+    transform = compile_row_transformer(
+        table_name, common_columns, column_types, pk_column, cloud_engine, default_password, log
+    )
     
-    # 同步到云端数据库
-    # 使用autocommit模式，每条记录单独提交，避免一条失败影响其他记录
     success_count = 0
     fail_count = 0
+    read_count = 0
+    failed_ids = []  # 失败行的主键（用于报告）
     inserted_ids = []  # 记录成功插入的ID（用于调试）
     
-    # 创建连接（不使用事务，每条记录单独提交）
-    cloud_conn = cloud_engine.connect()
+    def record_failure(row, e: Exception, limit: int, label: str):
+        nonlocal fail_count
+        fail_count += 1
+        if pk_index is not None:
+            failed_ids.append(row[pk_index])
+        if fail_count <= 5:  # 只打印前5个错误
+            log(f"  {label}: {_short_error(e, limit)}")
     
-    try:
-        for idx, row in enumerate(rows):
-            # 使用savepoint来隔离每条记录的插入
-            savepoint_name = f"sp_{table_name}_{idx}"
-            savepoint = cloud_conn.begin_nested()
-            
+    def write_chunk(cloud_conn, batch_rows):
+        """转换并写入一批数据，返回后该批已提交"""
+        nonlocal success_count
+        
+        # 转换本批数据，转换失败的行单独记为失败
+        prepared = []
+        for row in batch_rows:
             try:
-                # 构建行数据字典
-                row_dict = {}
-                row_id = None  # 记录当前行的ID
-                
-                for i, col_name in enumerate(common_columns):
-                    value = row[i]
-                    
-                    # 记录主键ID
-                    if col_name == pk_column:
-                        row_id = value
-                    
-                    # 特殊处理users表的password_hash
-                    if table_name == "users" and col_name == "password_hash":
-                        # 如果密码哈希为空或无效，使用默认密码
-                        if not value or len(value) < 10:
-                            value = get_password_hash(default_password)
-                            if row_id:
-                                print(f"  🔑 用户ID {row_id}: 密码已重置为默认密码")
-                    
-                    # 转换数据类型
-                    col_info = next((c for c in local_columns if c['name'] == col_name), None)
-                    if col_info:
-                        value = convert_mysql_to_postgres_value(value, str(col_info['type']), col_name, cloud_engine, table_name)
-                    
-                    row_dict[col_name] = value
-                
-                # 构建INSERT语句（使用ON CONFLICT处理重复）
-                columns_str = ", ".join([f'"{col}"' for col in common_columns])
-                values_str = ", ".join([f":{col}" for col in common_columns])
-                
-                if pk_column and pk_column in common_columns:
-                    # 有主键，使用ON CONFLICT DO UPDATE
-                    update_set = ", ".join([
-                        f'"{col}" = EXCLUDED."{col}"'
-                        for col in common_columns
-                        if col != pk_column
-                    ])
-                    insert_sql = f"""
-                        INSERT INTO "{table_name}" ({columns_str})
-                        VALUES ({values_str})
-                        ON CONFLICT ("{pk_column}") DO UPDATE SET {update_set}
-                    """
-                else:
-                    # 无主键或主键不在列中，直接INSERT
-                    insert_sql = f"""
-                        INSERT INTO "{table_name}" ({columns_str})
-                        VALUES ({values_str})
-                        ON CONFLICT DO NOTHING
-                    """
-                
-                result = cloud_conn.execute(text(insert_sql), row_dict)
-                savepoint.commit()
-                success_count += 1
-                
-                # 记录成功插入的ID（仅对users表）
-                if table_name == "users" and row_id is not None:
-                    inserted_ids.append(row_id)
-                
-            except IntegrityError as e:
-                # 外键约束错误或其他完整性错误
-                savepoint.rollback()
-                fail_count += 1
-                if fail_count <= 5:  # 只打印前5个错误
-                    error_msg = str(e.orig) if hasattr(e, 'orig') else str(e)
-                    # 截断过长的错误信息
-                    if len(error_msg) > 200:
-                        error_msg = error_msg[:200] + "..."
-                    print(f"  ⚠️  跳过重复或冲突记录: {error_msg}")
+                prepared.append((row, transform(row)))
             except Exception as e:
-                savepoint.rollback()
-                fail_count += 1
-                if fail_count <= 5:  # 只打印前5个错误
-                    error_msg = str(e)
-                    # 截断过长的错误信息
-                    if len(error_msg) > 300:
-                        error_msg = error_msg[:300] + "..."
-                    print(f"  ❌ 插入失败: {error_msg}")
+                record_failure(row, e, 300, "❌ 转换失败")
+        if not prepared:
+            return
+        
+        # 整批写入
+        batch_ok = False
+        succeeded = []
+        savepoint = cloud_conn.begin_nested()
+        try:
+            sql = batch_sql_cache.get(len(prepared))
+            if sql is None:
+                sql = batch_sql_cache[len(prepared)] = text(_build_upsert_sql(
+                    table_name, common_columns, pk_column, len(prepared)
+                ))
+            cloud_conn.execute(sql, _batch_params([values for _, values in prepared], column_count))
+            savepoint.commit()
+            batch_ok = True
+            succeeded = [row for row, _ in prepared]
+            success_count += len(prepared)
+        except Exception as e:
+            savepoint.rollback()
+            log(f"  ↩️  第 {read_count - len(batch_rows) + 1}-{read_count} 行批量写入失败，改为逐行写入: {_short_error(e, 200)}")
+        
+        if not batch_ok:
+            # 逐行写入，使用savepoint隔离每条记录
+            for row, values in prepared:
+                savepoint = cloud_conn.begin_nested()
+                try:
+                    cloud_conn.execute(single_row_sql, _batch_params([values], column_count))
+                    savepoint.commit()
+                    succeeded.append(row)
+                    success_count += 1
+                except IntegrityError as e:
+                    # 外键约束错误或其他完整性错误
+                    savepoint.rollback()
+                    record_failure(row, e, 200, "⚠️  跳过重复或冲突记录")
+                except Exception as e:
+                    savepoint.rollback()
+                    record_failure(row, e, 300, "❌ 插入失败")
+        
+        # 每批提交一次，中途中断时已同步的批次保留
+        cloud_conn.commit()
+        
+        # 记录成功插入的ID（仅对users表）
+        if table_name == "users" and pk_index is not None:
+            inserted_ids.extend(row[pk_index] for row in succeeded if row[pk_index] is not None)
+    
+    def save_mark(ts_value, pk_value, pass_pk=None):
+        if checkpoints is None or mark_mode is None:
+            return
+        mark = {"mode": mark_mode, "columns": ts_columns}
+        if mark_mode != "full":
+            mark["pk"] = _mark_value(pk_value)
+        if mark_mode == "timestamp":
+            mark["ts"] = _mark_value(ts_value)
+        if pass_pk is not None:
+            # 按主键顺序全表读取尚未完成，下次从该主键之后继续
+            mark["pass_pk"] = _mark_value(pass_pk)
+        if failed_ids:
+            # 本次同步中失败的行（包括重试后仍失败的行），下次增量同步时重试
+            mark["retry"] = [_mark_value(pk) for pk in dict.fromkeys(failed_ids)]
+        with _checkpoint_lock:
+            checkpoints[table_name] = mark
+            if persist_checkpoints is not None:
+                persist_checkpoints()
+    
+    columns_str = ", ".join([f"`{col}`" for col in common_columns])
+    pk_quoted = f"`{pk_column}`" if pk_column else None
+    incremental = delta and mark_mode is not None
+    saved_mark = saved_mark or {}
+    # timestamp 方式还没有时间水位（首次增量同步或首轮读取中断）时先按主键顺序读取全表
+    initial_pass = incremental and mark_mode == "timestamp" and (
+        saved_mark.get("ts") is None or "pass_pk" in saved_mark
+    )
+    
+    def read_full():
+        """全量读取：服务端游标流式读取，每次取 batch_size 行"""
+        with local_engine.connect() as local_conn:
+            result = local_conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                text(f"SELECT {columns_str} FROM `{table_name}`")
+            )
+            try:
+                for batch_rows in result.partitions(batch_size):
+                    yield batch_rows, None
+            finally:
+                result.close()
+    
+    def read_by_pk(local_conn, start_pk):
+        """按主键顺序从 start_pk 之后（None 表示从头）分批读取"""
+        while True:
+            where = "" if start_pk is None else f"WHERE {pk_quoted} > :start_pk "
+            batch_rows = local_conn.execute(
+                text(f"SELECT {columns_str} FROM `{table_name}` {where}ORDER BY {pk_quoted} LIMIT :limit"),
+                {"start_pk": start_pk, "limit": batch_size},
+            ).fetchall()
+            if not batch_rows:
+                return
+            yield batch_rows
+            start_pk = batch_rows[-1][pk_index]
+    
+    def read_delta():
+        """
+        增量读取：先按主键重试上次失败的行，再读取水位之后的行
+        产出 (批次, 类型)：retry 为重试的行，mark 为推进水位的批次，pass 为按主键全表读取的批次
+        - timestamp 方式按 (时间水位, 主键) 顺序读取，pk 方式按主键顺序读取
+        - full 方式按主键顺序读取全表（从上次中断的 pass_pk 之后继续）
+        """
+        mark_pk = saved_mark.get("pk")
+        mark_ts = _parse_mark_ts(saved_mark.get("ts"))
+        # 第一批回退 SYNC_DELTA_OVERLAP_SECONDS，补上时间戳早于水位、但在上次同步之后才提交的行
+        lower_ts = mark_ts - timedelta(seconds=SYNC_DELTA_OVERLAP_SECONDS) if isinstance(mark_ts, datetime) else mark_ts
+        retry_ids = saved_mark.get("retry") or []
+        with local_engine.connect() as local_conn:
+            # 重试的行按主键读取（本地已删除的行自然跳过），不推进水位
+            retry_select = f"SELECT {columns_str}, {ts_expr} AS `__sync_ts`" if mark_mode == "timestamp" else f"SELECT {columns_str}"
+            retry_query = text(
+                f"{retry_select} FROM `{table_name}` WHERE {pk_quoted} IN :ids ORDER BY {pk_quoted}"
+            ).bindparams(bindparam("ids", expanding=True))
+            for start in range(0, len(retry_ids), batch_size):
+                batch_rows = local_conn.execute(retry_query, {"ids": retry_ids[start:start + batch_size]}).fetchall()
+                if batch_rows:
+                    yield batch_rows, "retry"
+            
+            if mark_mode == "full" or initial_pass:
+                for batch_rows in read_by_pk(local_conn, saved_mark.get("pass_pk")):
+                    yield batch_rows, "pass"
+                return
+            if mark_mode == "pk":
+                for batch_rows in read_by_pk(local_conn, mark_pk):
+                    yield batch_rows, "mark"
+                return
+            
+            query = text(
+                f"SELECT {columns_str}, {ts_expr} AS `__sync_ts` FROM `{table_name}` "
+                f"WHERE {ts_expr} > :lower_ts OR ({ts_expr} = :mark_ts AND {pk_quoted} > :mark_pk) "
+                f"ORDER BY {ts_expr}, {pk_quoted} LIMIT :limit"
+            )
+            while True:
+                params = {"lower_ts": lower_ts, "mark_ts": mark_ts, "mark_pk": mark_pk, "limit": batch_size}
+                batch_rows = local_conn.execute(query, params).fetchall()
+                if not batch_rows:
+                    return
+                yield batch_rows, "mark"
+                last = batch_rows[-1]
+                # 之后的批次严格按 (时间, 主键) 往后取
+                mark_pk = last[pk_index]
+                mark_ts = lower_ts = last[len(common_columns)]
+    
+    mark_row = None
+    if incremental:
+        if saved_mark.get("retry"):
+            log(f"🔁 先重试上次失败的 {len(saved_mark['retry'])} 条记录")
+        resume = f"，从 {pk_column} {saved_mark['pass_pk']} 之后继续" if saved_mark.get("pass_pk") is not None else ""
+        if mark_mode == "full":
+            log(f"🔄 增量同步：表中的行会被原地修改且没有 updated_at，按 {pk_column} 顺序全表重新同步{resume}")
+        elif initial_pass:
+            log(f"📌 增量同步：还没有 {'/'.join(ts_columns)} 水位，按 {pk_column} 顺序全表同步{resume}，每批提交后保存检查点")
+        elif mark_mode == "timestamp":
+            log(f"📌 增量同步：{'/'.join(ts_columns)} 晚于 {saved_mark.get('ts')}（回退 {SYNC_DELTA_OVERLAP_SECONDS} 秒）")
+        elif saved_mark.get("pk") is None:
+            log(f"📌 增量同步：还没有检查点，按 {pk_column} 顺序从头同步，每批提交后保存检查点")
+        else:
+            log(f"📌 增量同步：{pk_column} 大于 {saved_mark.get('pk')}")
+    if mark_mode in ("timestamp", "pk") and (not incremental or (initial_pass and "pass_pk" not in saved_mark)):
+        # 全量同步或首轮读取：先记下当前水位，读完后保存（读取期间写入的行由下次增量同步补上）
+        try:
+            with local_engine.connect() as local_conn:
+                if mark_mode == "timestamp":
+                    mark_row = local_conn.execute(text(
+                        f"SELECT MAX({ts_expr}) FROM `{table_name}`"
+                    )).one()
+                    mark_row = (mark_row[0], None)
+                else:
+                    mark_row = local_conn.execute(text(
+                        f"SELECT NULL, MAX(`{pk_column}`) FROM `{table_name}`"
+                    )).one()
+        except Exception as e:
+            log(f"❌ 读取本地数据失败: {e}")
+            return 0, 0
+    
+    # 读取线程流式读出批次，当前线程逐批转换写入，内存中只保留固定数量的批次
+    read_ok = True
+    cloud_conn = cloud_engine.connect()
+    try:
+        chunks = _stream_chunks(read_delta if incremental else read_full)
+        try:
+            if initial_pass:
+                # 首轮读取完成后以读取前的最大时间为水位（中断后继续时沿用检查点中记下的时间）
+                current_mark = (mark_row[0] if mark_row is not None else _parse_mark_ts(saved_mark.get("ts")), 0)
+            else:
+                current_mark = (_parse_mark_ts(saved_mark.get("ts")), saved_mark.get("pk"))
+            for batch_rows, kind in chunks:
+                read_count += len(batch_rows)
+                write_chunk(cloud_conn, batch_rows)
+                # 每批提交后保存检查点，中断后从最后提交的批次继续
+                last = batch_rows[-1]
+                if kind == "mark":
+                    current_mark = (last[len(common_columns)] if mark_mode == "timestamp" else None, last[pk_index])
+                    save_mark(*current_mark)
+                elif kind == "pass":
+                    save_mark(*current_mark, pass_pk=last[pk_index])
+                log(f"  已同步 {read_count} 条")
+            if incremental:
+                # 水位未推进时也要保存，更新重试列表（并清除已完成的 pass_pk）
+                save_mark(*current_mark)
+        except SyncReadError as e:
+            read_ok = False
+            log(f"❌ 读取本地数据失败: {e}")
+        finally:
+            chunks.close()
     finally:
         cloud_conn.close()
     
-    print(f"✅ 成功: {success_count} 条")
+    if read_ok and read_count == 0:
+        log(f"ℹ️  表 {table_name} {'没有新增或修改的数据' if incremental else '没有数据，跳过'}")
+    if read_ok and not incremental and mark_row is not None and (mark_row[0] is not None or mark_row[1] is not None):
+        # 时间水位只记录时间，主键取 0：下次从该时间点（含）开始
+        save_mark(mark_row[0], mark_row[1] if mark_mode == "pk" else 0)
+    elif read_ok and not incremental and mark_mode == "full":
+        # 全量同步完成，清除上次增量同步中断时留下的 pass_pk
+        save_mark(None, None)
+    
+    log(f"✅ 成功: {success_count} 条")
     if fail_count > 0:
-        print(f"⚠️  失败/跳过: {fail_count} 条")
+        log(f"⚠️  失败/跳过: {fail_count} 条")
+        if failed_ids:
+            shown = ", ".join(str(i) for i in failed_ids[:20])
+            more = f" 等 {len(failed_ids)} 条" if len(failed_ids) > 20 else ""
+            log(f"  📋 失败记录的{pk_column}: {shown}{more}")
     
     # 对于users表，显示实际插入的ID列表
     if table_name == "users" and inserted_ids:
-        print(f"  📋 已插入的用户ID: {sorted(inserted_ids)}")
+        log(f"  📋 已插入的用户ID: {sorted(inserted_ids)}")
     
     return success_count, fail_count
 
 
 def verify_users_before_sync_counselors(local_engine, cloud_engine):
     """在同步counselors表之前，验证云端users表中是否有足够的用户"""
-    print("\n" + "="*60)
-    print("🔍 验证用户数据（同步counselors前检查）")
-    print("="*60)
+    log = _table_printer("counselors")
+    log("🔍 验证用户数据（同步counselors前检查）")
     
     try:
         # 获取本地counselors表中需要的user_id
         with local_engine.connect() as local_conn:
             result = local_conn.execute(text("SELECT DISTINCT user_id FROM `counselors` WHERE user_id IS NOT NULL"))
             required_user_ids = {row[0] for row in result.fetchall()}
-            print(f"📋 本地counselors表需要的user_id: {sorted(required_user_ids)}")
+            log(f"📋 本地counselors表需要的user_id: {sorted(required_user_ids)}")
         
         # 获取云端users表中实际存在的id
         with cloud_engine.connect() as cloud_conn:
             result = cloud_conn.execute(text('SELECT id FROM "users"'))
             existing_user_ids = {row[0] for row in result.fetchall()}
-            print(f"📋 云端users表实际存在的id: {sorted(existing_user_ids)}")
+            log(f"📋 云端users表实际存在的id: {sorted(existing_user_ids)}")
         
         # 检查缺失的user_id
         missing_ids = required_user_ids - existing_user_ids
         if missing_ids:
-            print(f"\n⚠️  警告: 以下user_id在云端users表中不存在: {sorted(missing_ids)}")
-            print("   这可能导致counselors表同步失败")
+            log(f"\n⚠️  警告: 以下user_id在云端users表中不存在: {sorted(missing_ids)}")
+            log("   这可能导致counselors表同步失败")
             return False
         else:
-            print("\n✅ 所有需要的user_id在云端users表中都存在")
+            log("\n✅ 所有需要的user_id在云端users表中都存在")
             return True
             
     except Exception as e:
-        print(f"⚠️  验证过程出错: {e}")
+        log(f"⚠️  验证过程出错: {e}")
         return True  # 验证失败时继续同步，让同步过程自己处理错误
 
 
+def run_sync_dag(
+    dag: Dict[str, Set[str]],
+    sync_one: Callable[[str], Dict[str, Any]],
+    workers: int = SYNC_WORKERS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    按依赖图并行同步：父表全部结束后子表才提交到线程池，最多 workers 个表同时同步
+    sync_one(表名) 返回该表的结果字典；父表失败不阻塞子表（子表中引用缺失父行的记录会单独写入失败）
+    返回 表名 -> 结果，按完成顺序排列
+    """
+    pending = {table: parents & dag.keys() for table, parents in dag.items()}
+    done: Set[str] = set()
+    results: Dict[str, Dict[str, Any]] = {}
+    running = {}
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cloud-sync") as pool:
+        while pending or running:
+            ready = [table for table, parents in pending.items() if parents <= done]
+            if not ready and not running:
+                # 依赖成环（正常的表定义不会出现），剩余的表按原顺序依次同步
+                ready = list(pending)[:1]
+            for table in ready:
+                del pending[table]
+                running[pool.submit(sync_one, table)] = table
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                table = running.pop(future)
+                done.add(table)
+                results[table] = future.result()
+    return results
+
+
 def clear_cloud_database(cloud_engine):
     """清空云端数据库的所有数据（保留表结构）"""
     print("\n" + "="*60)
@@ -512,7 +1040,7 @@ def clear_cloud_database(cloud_engine):
     print("="*60)
     
     # 按照依赖关系的逆序删除数据（先删除有外键的表）
-    reverse_order = list(reversed(TABLE_SYNC_ORDER))
+    reverse_order = list(reversed(list(TABLE_SYNC_DAG)))
     
     with cloud_engine.begin() as conn:
         # PostgreSQL中，TRUNCATE CASCADE会自动处理外键约束
@@ -598,10 +1126,23 @@ def main():
     print("="*60)
     print("1. 清空云端数据后同步（推荐，确保完整同步所有数据）")
     print("2. 保留云端数据，仅更新/插入（可能因外键约束失败）")
+    print("3. 增量同步，仅同步上次同步后新增或修改的数据（不同步删除）")
     print("="*60)
     
-    clear_option = input("\n请选择 (1/2，默认: 1): ").strip()
-    should_clear = clear_option in ('', '1', 'yes', 'y')
+    if "--delta" in sys.argv[1:]:
+        clear_option = "3"
+        print("\n已通过 --delta 选择增量同步")
+    else:
+        clear_option = input("\n请选择 (1/2/3，默认: 1): ").strip()
+    delta = clear_option == '3'
+    should_clear = not delta and clear_option in ('', '1', 'yes', 'y')
+    
+    # 检查点按云端库区分；清空云端数据后原有水位作废
+    checkpoint_root = load_checkpoints()
+    checkpoint_target = get_checkpoint_target(cloud_url)
+    if should_clear:
+        checkpoint_root.pop(checkpoint_target, None)
+    table_checkpoints = checkpoint_root.setdefault(checkpoint_target, {})
     
     if should_clear:
         try:
@@ -612,6 +1153,8 @@ def main():
             if confirm not in ('yes', 'y'):
                 print("❌ 已取消同步")
                 return
+    elif delta:
+        print("\n⚠️  增量同步：没有检查点的表将全量同步一次")
     else:
         print("\n⚠️  将保留云端现有数据，仅进行更新/插入操作")
     
@@ -622,45 +1165,54 @@ def main():
         print("   如果云端已有数据，将根据主键进行更新（UPSERT）")
     print("="*60)
     
-    confirm = input("\n是否继续？(yes/no，默认: yes): ").strip().lower()
-    if confirm and confirm not in ('yes', 'y', ''):
-        print("❌ 已取消同步")
-        return
+    if "--delta" not in sys.argv[1:]:
+        confirm = input("\n是否继续？(yes/no，默认: yes): ").strip().lower()
+        if confirm and confirm not in ('yes', 'y', ''):
+            print("❌ 已取消同步")
+            return
     
     # 开始同步
     print("\n🚀 开始同步数据...")
     start_time = datetime.now()
     
-    total_success = 0
-    total_fail = 0
+    local_tables = set(inspect(local_engine).get_table_names())
+    cloud_tables = set(inspect(cloud_engine).get_table_names())
     
-    for table_name in TABLE_SYNC_ORDER:
+    def sync_one(table_name: str) -> Dict[str, Any]:
+        result = {"status": "跳过", "success": 0, "fail": 0, "seconds": 0.0}
+        # 检查表是否存在
+        if table_name not in local_tables:
+            _table_printer(table_name)("⚠️  本地数据库中没有该表，跳过")
+            return result
+        if table_name not in cloud_tables:
+            _table_printer(table_name)("⚠️  云端数据库中没有该表，跳过")
+            return result
+        
+        started = time.perf_counter()
         try:
-            # 检查表是否存在
-            local_inspector = inspect(local_engine)
-            cloud_inspector = inspect(cloud_engine)
-            
-            if table_name not in local_inspector.get_table_names():
-                print(f"\n⚠️  本地数据库中没有表: {table_name}，跳过")
-                continue
-            
-            if table_name not in cloud_inspector.get_table_names():
-                print(f"\n⚠️  云端数据库中没有表: {table_name}，跳过")
-                continue
-            
-            # 在同步counselors表之前，验证users表
+            # 在同步counselors表之前，验证users表（users 是 counselors 的父表，此时已同步完成）
             if table_name == "counselors":
                 verify_users_before_sync_counselors(local_engine, cloud_engine)
             
-            success, fail = sync_table(local_engine, cloud_engine, table_name)
-            total_success += success
-            total_fail += fail
-            
+            result["success"], result["fail"] = sync_table(
+                local_engine, cloud_engine, table_name,
+                checkpoints=table_checkpoints,
+                persist_checkpoints=lambda: save_checkpoints(checkpoint_root),
+                delta=delta
+            )
+            result["status"] = "完成" if result["fail"] == 0 else "部分失败"
         except Exception as e:
-            print(f"\n❌ 同步表 {table_name} 时出错: {e}")
             import traceback
-            traceback.print_exc()
-            total_fail += 1
+            _table_printer(table_name)(f"❌ 同步出错: {e}\n{traceback.format_exc()}")
+            result["status"] = "出错"
+            result["fail"] += 1
+        result["seconds"] = time.perf_counter() - started
+        return result
+    
+    print(f"🧵 并行线程数: {SYNC_WORKERS}（SYNC_WORKERS），共 {len(TABLE_SYNC_DAG)} 个表")
+    results = run_sync_dag(TABLE_SYNC_DAG, sync_one, SYNC_WORKERS)
+    total_success = sum(result["success"] for result in results.values())
+    total_fail = sum(result["fail"] for result in results.values())
     
     # 同步完成
     end_time = datetime.now()
@@ -674,6 +1226,17 @@ def main():
     print(f"⏱️  耗时: {duration:.2f} 秒")
     print("="*60)
     
+    # 各表耗时（按依赖图顺序）
+    print("\n⏱️  各表同步耗时:")
+    print(f"  {'表名':<28}{'状态':<8}{'成功':>8}{'失败':>8}{'耗时(秒)':>12}")
+    for table_name in TABLE_SYNC_DAG:
+        result = results.get(table_name)
+        if result is None:
+            continue
+        print(f"  {table_name:<30}{result['status']:<8}{result['success']:>10}{result['fail']:>10}{result['seconds']:>12.2f}")
+    table_seconds = sum(result["seconds"] for result in results.values())
+    print(f"  各表耗时合计 {table_seconds:.2f} 秒，实际耗时 {duration:.2f} 秒")
+    
     # 测试同步结果
     print("\n🧪 测试同步结果...")
     try:
@@ -696,7 +1259,7 @@ def main():
             
             # 统计各表记录数
             print("\n📊 各表记录数统计:")
-            for table_name in TABLE_SYNC_ORDER:
+            for table_name in TABLE_SYNC_DAG:
                 try:
                     result = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"'))
                     count = result.scalar()
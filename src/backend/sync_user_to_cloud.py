@@ -167,6 +167,7 @@ def sync_user_to_cloud():
         
         from database import SessionLocal as CloudSession
         from models import User
+        from login_identifiers import sync_login_identifiers
         
         cloud_db = CloudSession()
         try:
@@ -182,6 +183,7 @@ def sync_user_to_cloud():
                 for key, value in user_data.items():
                     if key != "username":  # 不更新用户名
                         setattr(existing_user, key, value)
+                sync_login_identifiers(cloud_db, existing_user, strict=False)
                 cloud_db.commit()
                 print(f"✅ 用户数据已更新")
             else:
@@ -189,6 +191,8 @@ def sync_user_to_cloud():
                 # 创建新用户
                 new_user = User(**user_data)
                 cloud_db.add(new_user)
+                # 写入登录标识，账号可按唯一索引登录
+                sync_login_identifiers(cloud_db, new_user, strict=False)
                 cloud_db.commit()
                 cloud_db.refresh(new_user)
                 print(f"✅ 用户已创建，ID: {new_user.id}")
@@ -2,8 +2,16 @@
 工具函数
 """
 
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
 from models import AppointmentStatus, Gender, CounselorStatus, UserRole
 
+# 旧版本将预约结束时间拼接在 description 末尾：{原始描述}|END_TIME:{ISO时间}
+END_TIME_MARKER = "|END_TIME:"
+TZ_BEIJING = timezone(timedelta(hours=8))
+
 
 def get_consult_method_display(method: str) -> str:
     """获取咨询方式的中文显示（兼容函数，现在method已经是中文）"""
@@ -63,3 +71,67 @@ def get_user_role_display(role: UserRole) -> str:
     }
     return role_map.get(role, str(role))
 
+
+def split_end_time_marker(description: Optional[str]) -> Tuple[Optional[str], Optional[datetime]]:
+    """
+    拆分旧版 description 中的结束时间标记
+    返回 (去掉标记后的描述, 结束时间)；结束时间统一为北京时间的 naive datetime
+    """
+    if not description or END_TIME_MARKER not in description:
+        return description, None
+
+    head, _, tail = description.partition(END_TIME_MARKER)
+    end_time_str, _, rest = tail.partition("|")
+    cleaned = head + (f"|{rest}" if rest else "")
+
+    try:
+        end_time = datetime.fromisoformat(end_time_str.replace("Z", "+00:00"))
+    except ValueError:
+        return description, None
+    if end_time.tzinfo is not None:
+        end_time = end_time.astimezone(TZ_BEIJING).replace(tzinfo=None)
+    return cleaned or None, end_time
+
+
+def parse_json_array_field(value, default=None):
+    """
+    统一解析JSON数组字段的函数
+    支持多种格式：
+    1. JSON数组字符串：'["item1", "item2"]'
+    2. 逗号分隔字符串：'item1, item2' 或 'item1，item2'（中文逗号）
+    3. 单个字符串：'item1'
+    4. None/空字符串：返回默认值或空数组
+    """
+    if value is None:
+        return default if default is not None else []
+    
+    if isinstance(value, list):
+        # 已经是数组，清理空格后返回
+        return [str(item).strip() for item in value if item and str(item).strip()]
+    
+    if not isinstance(value, str):
+        return default if default is not None else []
+    
+    value = value.strip()
+    if not value:
+        return default if default is not None else []
+    
+    # 尝试解析JSON数组
+    try:
+        if value.startswith('[') and value.endswith(']'):
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                return [str(item).strip() for item in parsed if item and str(item).strip()]
+    except (json.JSONDecodeError, ValueError):
+        pass
+    
+    # 尝试按逗号分割（支持中文逗号和英文逗号）
+    # 先尝试中文逗号
+    if '，' in value:
+        items = value.split('，')
+    else:
+        items = value.split(',')
+    
+    # 清理空格和空项
+    result = [item.strip() for item in items if item.strip()]
+    return result if result else (default if default is not None else [])
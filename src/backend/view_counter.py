@@ -0,0 +1,95 @@
+"""
+科普内容浏览量计数（写缓冲）
+详情接口只在进程内累加浏览次数，后台线程定时把累计增量合并写回：
+每个内容一条 UPDATE contents SET view_count = view_count + :delta，应用退出时再写回一次
+写回失败的增量会放回缓冲区，下次重试；数据库中的浏览量最终一致
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from database import SessionLocal
+
+logger = logging.getLogger("heart_care.view_counter")
+
+# 写回间隔（秒）
+CONTENT_VIEW_FLUSH_SECONDS = float(os.getenv("CONTENT_VIEW_FLUSH_SECONDS", "10"))
+
+_pending: Dict[int, int] = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def record_view(content_id: int) -> int:
+    """记录一次浏览，返回该内容尚未写回的浏览次数"""
+    with _lock:
+        count = _pending.get(content_id, 0) + 1
+        _pending[content_id] = count
+        return count
+
+
+def pending_views(content_id: int) -> int:
+    """该内容尚未写回的浏览次数"""
+    with _lock:
+        return _pending.get(content_id, 0)
+
+
+def flush() -> int:
+    """把缓冲区中的增量写回数据库，返回写回的内容数"""
+    with _flush_lock:
+        with _lock:
+            if not _pending:
+                return 0
+            deltas = dict(_pending)
+            _pending.clear()
+
+        db = SessionLocal()
+        try:
+            # 按 ID 顺序更新，避免多进程同时写回时互相等待行锁
+            for content_id in sorted(deltas):
+                db.execute(
+                    text("UPDATE contents SET view_count = COALESCE(view_count, 0) + :delta WHERE id = :id"),
+                    {"delta": deltas[content_id], "id": content_id},
+                )
+            db.commit()
+            return len(deltas)
+        except Exception as exc:
+            db.rollback()
+            with _lock:
+                for content_id, delta in deltas.items():
+                    _pending[content_id] = _pending.get(content_id, 0) + delta
+            logger.warning("浏览量写回失败，%s 条增量将在下次重试：%s", len(deltas), exc)
+            return 0
+        finally:
+            db.close()
+
+
+def _run() -> None:
+    while not _stop_event.wait(CONTENT_VIEW_FLUSH_SECONDS):
+        flush()
+
+
+def start() -> None:
+    """启动定时写回线程（应用启动时调用）"""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_run, name="content-view-flusher", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    """停止定时写回线程并写回剩余增量（应用退出时调用）"""
+    global _thread
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout=CONTENT_VIEW_FLUSH_SECONDS)
+        _thread = None
+    flush()
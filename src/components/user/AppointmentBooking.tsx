@@ -237,6 +237,8 @@ export function AppointmentBooking() {
   const [loading, setLoading] = useState(true);
   const [myCounselorIds, setMyCounselorIds] = useState<Set<number>>(new Set());
   const [availableSlots, setAvailableSlots] = useState<any[]>([]);
+  // 预约窗口（今天起30天）内每天的可用时段，打开预约对话框时一次性加载
+  const [slotsByDate, setSlotsByDate] = useState<Record<string, any[]> | null>(null);
   const [loadingSlots, setLoadingSlots] = useState(false);
   const [showDetailDialog, setShowDetailDialog] = useState(false);
   const [showBookingDialog, setShowBookingDialog] = useState(false);
@@ -248,6 +250,10 @@ export function AppointmentBooking() {
   const [selectedMethods, setSelectedMethods] = useState<string[]>([]);
   const [selectedGender, setSelectedGender] = useState<string>('all');
   const [sortBy, setSortBy] = useState<string>('hot');
+  const [facetCounts, setFacetCounts] = useState<{
+    specialties: Record<string, number>;
+    consult_methods: Record<string, number>;
+  }>({ specialties: {}, consult_methods: {} });
   
   // 预约表单
   const [appointmentForm, setAppointmentForm] = useState({
@@ -292,6 +298,21 @@ export function AppointmentBooking() {
     }
   };
 
+  // 加载筛选栏分面统计（失败时不影响咨询师列表）
+  const loadFacets = async (filterParams: any) => {
+    try {
+      const data = await counselorApi.searchFacets(filterParams);
+      const toCountMap = (items: { name: string; count: number }[] = []) =>
+        Object.fromEntries(items.map(item => [item.name, item.count]));
+      setFacetCounts({
+        specialties: toCountMap(data?.specialties),
+        consult_methods: toCountMap(data?.consult_methods),
+      });
+    } catch (error) {
+      console.error('加载筛选统计失败:', error);
+    }
+  };
+
   const loadCounselors = async () => {
     try {
       setLoading(true);
@@ -313,6 +334,8 @@ export function AppointmentBooking() {
         params.sort_by = sortBy;
       }
       
+      const { limit, sort_by, ...filterParams } = params;
+      loadFacets(filterParams);
       const data = await counselorApi.search(params);
       
       // 将"我的咨询师"放在前面
@@ -357,6 +380,21 @@ export function AppointmentBooking() {
     }
   };
 
+  const loadAvailableSlotsRange = async (counselorId: number) => {
+    try {
+      const data = await counselorApi.getAvailableSlotsRange(counselorId);
+      const byDate: Record<string, any[]> = {};
+      (data.days || []).forEach((day: any) => {
+        byDate[day.date] = day.available_slots || [];
+      });
+      setSlotsByDate(byDate);
+    } catch (error: any) {
+      // 区间加载失败时选择日期会回退到逐日查询
+      console.error('加载预约窗口可用时段失败:', error);
+      setSlotsByDate(null);
+    }
+  };
+
   const loadAvailableSlots = async (counselorId: number, date: string) => {
     if (!date) return;
     
@@ -433,7 +471,11 @@ export function AppointmentBooking() {
   const handleDateChange = (date: string) => {
     setAppointmentForm(prev => ({ ...prev, appointment_date: date, appointment_time: '', start_time: '', end_time: '' }));
     if (selectedCounselor && date) {
-      loadAvailableSlots(selectedCounselor.id, date);
+      if (slotsByDate && slotsByDate[date]) {
+        setAvailableSlots(slotsByDate[date]);
+      } else {
+        loadAvailableSlots(selectedCounselor.id, date);
+      }
     }
   };
 
@@ -449,6 +491,8 @@ export function AppointmentBooking() {
       description: '',
     });
     setAvailableSlots([]);
+    setSlotsByDate(null);
+    loadAvailableSlotsRange(counselor.id);
   };
 
   const handleOpenDetail = (counselor: any) => {
@@ -653,6 +697,7 @@ export function AppointmentBooking() {
                       onClick={() => handleSpecialtyToggle(option.value)}
                     >
                       {option.label}
+                      <span className="ml-1 opacity-70">{facetCounts.specialties[option.value] ?? 0}</span>
                     </Badge>
                   );
                 })}
@@ -680,6 +725,7 @@ export function AppointmentBooking() {
                     >
                       <Icon className="w-3 h-3" />
                       {option.label}
+                      <span className="opacity-70">{facetCounts.consult_methods[option.value] ?? 0}</span>
                     </Badge>
                   );
                 })}
@@ -67,6 +67,8 @@ interface Comment {
   created_at: string;
 }
 
+const COMMENT_PAGE_SIZE = 50;
+
 export function Community() {
   const { toast } = useToast();
   const [posts, setPosts] = useState<Post[]>([]);
@@ -79,6 +81,7 @@ export function Community() {
   const [posting, setPosting] = useState(false);
   const [expandedPost, setExpandedPost] = useState<number | null>(null);
   const [comments, setComments] = useState<Record<number, Comment[]>>({});
+  const [commentsHasMore, setCommentsHasMore] = useState<Record<number, boolean>>({});
   const [commentContent, setCommentContent] = useState<Record<number, string>>({});
   const [likingPosts, setLikingPosts] = useState<Set<number>>(new Set());
   const [reportingPosts, setReportingPosts] = useState<Set<number>>(new Set());
@@ -113,16 +116,23 @@ export function Community() {
     }
   };
 
-  // 获取评论列表
-  const fetchComments = async (postId: number) => {
+  // 获取评论列表（loadMore 为 true 时从已加载的最后一条评论之后继续获取）
+  const fetchComments = async (postId: number, loadMore = false) => {
     try {
-      const response = await communityApi.getPostComments(postId);
+      const loaded = loadMore ? (comments[postId] || []) : [];
+      const response = await communityApi.getPostComments(postId, {
+        after_id: loaded.length > 0 ? loaded[loaded.length - 1].id : undefined,
+        limit: COMMENT_PAGE_SIZE,
+      });
       // API拦截器已经返回了data，response就是数组
       const commentsData = Array.isArray(response) ? response : (Array.isArray(response?.data) ? response.data : []);
-      setComments(prev => ({ ...prev, [postId]: commentsData }));
+      setComments(prev => ({ ...prev, [postId]: [...loaded, ...commentsData] }));
+      setCommentsHasMore(prev => ({ ...prev, [postId]: commentsData.length === COMMENT_PAGE_SIZE }));
     } catch (error: any) {
       console.error('获取评论失败:', error);
-      setComments(prev => ({ ...prev, [postId]: [] })); // 确保comments始终是数组
+      if (!loadMore) {
+        setComments(prev => ({ ...prev, [postId]: [] })); // 确保comments始终是数组
+      }
     }
   };
 
@@ -220,10 +230,13 @@ export function Community() {
       // API拦截器已经返回了data，response就是数据对象
       const commentData = response?.data || response;
       
-      setComments(prev => ({
-        ...prev,
-        [postId]: [...(prev[postId] || []), commentData],
-      }));
+      // 还有未加载的评论时不追加，新评论会在翻到最后一页时出现，避免游标跳过中间的评论
+      if (!commentsHasMore[postId]) {
+        setComments(prev => ({
+          ...prev,
+          [postId]: [...(prev[postId] || []), commentData],
+        }));
+      }
       
       setCommentContent(prev => ({ ...prev, [postId]: '' }));
       setPosts(prev => prev.map(post => 
@@ -548,6 +561,16 @@ export function Community() {
                         {comments[post.id]?.length === 0 && (
                           <p className="text-sm text-gray-500 text-center py-4">暂无评论</p>
                         )}
+                        {commentsHasMore[post.id] && (
+                          <Button
+                            variant="ghost"
+                            size="sm"
+                            className="w-full"
+                            onClick={() => fetchComments(post.id, true)}
+                          >
+                            加载更多评论
+                          </Button>
+                        )}
                       </div>
                     </div>
                   )}
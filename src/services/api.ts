@@ -216,6 +216,13 @@ export const counselorApi = {
     limit?: number;
   }) => api.get('/counselors/search', { params }),
 
+  // 获取筛选栏分面统计（各擅长领域、咨询方式下的咨询师数量）
+  searchFacets: (params?: {
+    specialty?: string;
+    gender?: string;
+    consult_method?: string;
+  }) => api.get('/counselors/search/facets', { params }),
+
   // 获取咨询师详情
   getDetail: (counselorId: number) => api.get(`/counselors/${counselorId}`),
 
@@ -286,6 +293,10 @@ export const counselorApi = {
   // 获取咨询师可用时段
   getAvailableSlots: (counselorId: number, date: string) =>
     api.get(`/counselors/${counselorId}/available-slots`, { params: { date } }),
+  getAvailableSlotsRange: (counselorId: number, startDate?: string, endDate?: string) =>
+    api.get(`/counselors/${counselorId}/available-slots/range`, {
+      params: { start_date: startDate, end_date: endDate },
+    }),
 
   // 获取不可预约时段列表
   getUnavailablePeriods: (skip?: number, limit?: number) =>
@@ -430,9 +441,12 @@ export const communityApi = {
     content: string;
   }) => api.post('/community/comments', data),
 
-  // 获取帖子评论列表
-  getPostComments: (postId: number) =>
-    api.get(`/community/posts/${postId}/comments`),
+  // 获取帖子评论列表（游标分页：after_id 为上一页最后一条评论的ID）
+  getPostComments: (postId: number, params?: {
+    after_id?: number;
+    limit?: number;
+  }) =>
+    api.get(`/community/posts/${postId}/comments`, { params }),
 
   // 举报帖子
   reportPost: (postId: number, reason?: string) =>